@@ -5,75 +5,81 @@ Created on Wed Apr  1 05:25:58 2020
 
 @author: josephinemonica
 """
-import pandas as pd 
+import os
+import sys
+import pandas as pd
 import numpy as np
 
-def string_to_integer(s):
-     # e.g. '1,439,323,776' --->  '1439323776'
-    s = s.replace(",","")
-    # Convert string to integer
-    s = int(s)
-    
-    return s
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tools"))
+from data_store import load_csv
+from region_names import RegionResolver
+
+def strings_to_numbers(values):
+    # e.g. ['1,439,323,776', 'N.A.'] ---> [1439323776., nan]
+    values = pd.Series(values).astype(str).str.replace(",", "", regex=False).str.strip()
+    return pd.to_numeric(values, errors="coerce").to_numpy(dtype=np.float64)
 
 class Population():
-    def __init__(self,population_filename):
-        df = pd.read_csv(population_filename)
+    def __init__(self,population_filename,aliases=None):
+        df = load_csv(population_filename)
         self.country_list = np.array(df["Country (or dependency)"])
-        self.population_list = np.array(df["Population (2020)"])
-        self.median_age_list = np.array(df["Med. Age"])
-        self.population_density_list = np.array(df["Density (P/Km²)"])
-        
+        self.population_list = strings_to_numbers(df["Population (2020)"])
+        self.median_age_list = strings_to_numbers(df["Med. Age"])
+        self.population_density_list = strings_to_numbers(df["Density (P/Km²)"])
+
+        # Worldometer country name ---> row index (first row wins, as the previous np.where lookup did)
+        self.country_index = {}
+        for ix, country in enumerate(self.country_list):
+            self.country_index.setdefault(country, ix)
+
+        # Names of other data sources (e.g. train.csv) are resolved with the shared aliases of tools/region_names.py
+        self.resolver = RegionResolver(self.country_list, extra_aliases=aliases)
+
+    def add_alias(self,alias,country):
+        self.resolver.add_alias(alias, country)
+
     def get_country_index(self,country):
         # If country doesn't exist return None
-        
-        aliases = {}
-        aliases["US"] = "United States"
-        aliases["Brunei"] = 'Brunei '
-        aliases["Taiwan*"] = "Taiwan"
-        aliases["Korea, South"] = "South Korea"
-        if(country in aliases.keys()):
-            country = aliases[country]
-        ix = np.where(self.country_list==country)[0]
-        if(len(ix)==0):
-            return None
-        return ix[0]
-    
-    def get_population(self,country):
+        return self.country_index.get(self.resolver.resolve(country))
+
+    def get_country_indices(self,countries):
+        # Same as get_country_index for a whole column, missing countries are -1
+        resolved = pd.Series(self.resolver.resolve_many(countries))
+        return resolved.map(self.country_index).fillna(-1).to_numpy(dtype=np.int64)
+
+    def lookup_many(self,countries):
+        # Returns (population, population density, median age) arrays aligned with countries,
+        # with NaN for missing countries or missing values
+        ix = self.get_country_indices(countries)
+        found = ix >= 0
+        results = []
+        for values in [self.population_list, self.population_density_list, self.median_age_list]:
+            res = np.full(len(ix), np.nan)
+            res[found] = values[ix[found]]
+            results.append(res)
+        return tuple(results)
+
+    def _get_value(self,values,country):
         ix = self.get_country_index(country)
-        
-        if(ix is None):
+
+        if(ix is None or np.isnan(values[ix])):
             return None
-        res = self.population_list[ix]
-        
-        return string_to_integer(res)
-    
+
+        return int(values[ix])
+
+    def get_population(self,country):
+        return self._get_value(self.population_list, country)
+
     def get_population_density(self,country):
-        ix = self.get_country_index(country)
-        
-        if(ix is None):
-            return None
-        
-        res = self.population_density_list[ix]
-        
-        return string_to_integer(res)
-    
+        return self._get_value(self.population_density_list, country)
+
     def get_median_age(self,country):
-        ix = self.get_country_index(country)
-        
-        if(ix is None):
-            return None
-        
-        median_age = self.median_age_list[ix]
-        
-        if(median_age == 'N.A.'):
-            return None
-        else:
-            return string_to_integer(median_age)
-    
-    
+        # 'N.A.' median ages are parsed as NaN
+        return self._get_value(self.median_age_list, country)
+
+
 if __name__ =="__main__":
     p = Population("data/Worldometer_Population_Latest.csv")
-    
+
     print("Median age for China is {}".format(p.get_median_age("China")))
-    print("Population for China is {}".format(int(p.get_population("China"))))
\ No newline at end of file
+    print("Population for China is {}".format(int(p.get_population("China"))))
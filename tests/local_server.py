@@ -0,0 +1,75 @@
+"""
+Contains the local HTTP server used by the tests in place of the real data sources (Worldometer, Worldbank, ...).
+
+Authored by: Nicholas Sadjoli (Github @NickSadjoli)
+Co-authored by: Josephine Monica (Github @josephinemonica)
+"""
+import functools
+import http.server
+import os
+import threading
+
+fixtures_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+class _Handler(http.server.SimpleHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append((self.path, dict(self.headers)))
+        if server.delay is not None:
+            server.delay(self.path)
+        if server.respond is None:
+            return super().do_GET()
+
+        status, headers, body = server.respond(self)
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class LocalServer():
+    '''
+    HTTP server on 127.0.0.1 running in a background thread, to be used as a context manager. It either serves
+    the files of a folder, or answers every GET request with respond.
+
+    Arguments:
+    - directory => (Optional) folder whose files are served, e.g. "/page.html" ---> directory/page.html
+    - respond => (Optional) function (request handler) -> (status, headers dict, body bytes), used instead of
+      serving files. The handler has the path and the headers of the request.
+    - delay => (Optional) function (path) called before answering, e.g. to make some requests slower than others
+
+    Every request is recorded in requests, as (path, headers).
+    '''
+    def __init__(self, directory=None, respond=None, delay=None):
+        handler = functools.partial(_Handler, directory=directory or os.getcwd())
+        self.httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.httpd.daemon_threads = True
+        self.httpd.respond = respond
+        self.httpd.delay = delay
+        self.httpd.requests = []
+        self.httpd.lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def requests(self):
+        return self.httpd.requests
+
+    def url(self, path=""):
+        return "http://127.0.0.1:{}/{}".format(self.httpd.server_address[1], path.lstrip("/"))
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.thread.join()
@@ -0,0 +1,69 @@
+"""
+Tests of the rolling-origin backtest (backtest.run_backtest) on a synthetic panel, with a simple model in place of
+the EBM models.
+
+Authored by: Josephine Monica (Github @josephinemonica)
+Co-authored by: Nicholas Sadjoli (Github @NickSadjoli)
+"""
+import os
+import sys
+import unittest
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tools"))
+from backtest import run_backtest
+
+
+class MeanGrowthModel():
+    # Predicts the previous day's value plus the mean daily growth of the training rows
+    def __init__(self, target):
+        self.target = target
+
+    def fit(self, X, y):
+        self.growth = float(np.mean(y.to_numpy() - X["prev_{}".format(self.target)].to_numpy()))
+        return self
+
+    def predict(self, X):
+        return X["prev_{}".format(self.target)].to_numpy() + self.growth
+
+def confirmed_factory(random_state, n_jobs):
+    return MeanGrowthModel("ConfirmedCases")
+
+def synthetic_panel(num_regions=4, num_days=30):
+    rows = []
+    for region in range(num_regions):
+        values = np.log1p(np.cumsum(np.arange(num_days) * (region + 1)))
+        for day in range(num_days):
+            rows.append({"Region": "r{}".format(region), "Days": day,
+                         "prev_ConfirmedCases": values[day - 1] if day > 0 else 0.0, "ConfirmedCases": values[day]})
+    df = pd.DataFrame(rows)
+    return df[["Region", "Days", "prev_ConfirmedCases"]], df[["ConfirmedCases"]]
+
+
+class RunBacktestTest(unittest.TestCase):
+    def test_fold_stats_report_time_and_peak_memory(self):
+        X, Y = synthetic_panel()
+        rmsle_table, fold_stats = run_backtest(X, Y, num_of_val_days=5, num_folds=3, targets=["ConfirmedCases"],
+                                               n_workers=1, model_factory=confirmed_factory)
+        self.assertEqual(list(fold_stats["Validation rows"]), [20, 20, 20])
+        self.assertEqual(list(fold_stats["Train rows"]), [100, 80, 60])
+        self.assertTrue((fold_stats["Seconds"] > 0).all())
+        if sys.platform != "win32":
+            self.assertTrue((fold_stats["Peak RSS (MB)"] > 0).all())
+            self.assertTrue((fold_stats["Peak RSS increase (MB)"] >= 0).all())
+        self.assertEqual(sorted(rmsle_table["Horizon"].unique()), [1, 2, 3, 4, 5])
+
+    def test_results_are_the_same_in_process_or_in_a_pool(self):
+        X, Y = synthetic_panel()
+        serial_table, serial_stats = run_backtest(X, Y, num_of_val_days=5, num_folds=3, targets=["ConfirmedCases"],
+                                                  n_workers=1, model_factory=confirmed_factory)
+        pool_table, pool_stats = run_backtest(X, Y, num_of_val_days=5, num_folds=3, targets=["ConfirmedCases"],
+                                              n_workers=2, model_factory=confirmed_factory)
+        pd.testing.assert_frame_equal(pool_table, serial_table)
+        pd.testing.assert_series_equal(pool_stats["RMSLE ConfirmedCases"], serial_stats["RMSLE ConfirmedCases"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+"""
+Tests of the columnar cache of the CSV files (data_store.load_csv): cache files that are missing or can't be read
+are rebuilt from the CSV.
+
+Authored by: Nicholas Sadjoli (Github @NickSadjoli)
+Co-authored by: Josephine Monica (Github @josephinemonica)
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tools"))
+from data_store import load_csv
+
+
+class LoadCsvTest(unittest.TestCase):
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.data_dir, "values.csv")
+        with open(self.path, "w") as f:
+            f.write("Country,Value\nA,\"1,234\"\nB,5\n")
+        self.expected = load_csv(self.path)
+        self.cache_dir = os.path.join(self.data_dir, ".cache")
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir)
+
+    def cache_files(self):
+        return [os.path.join(self.cache_dir, file_name) for file_name in os.listdir(self.cache_dir)
+                if file_name.startswith("values.csv.") and not file_name.endswith(".json")]
+
+    def test_removed_cache_file_is_rebuilt(self):
+        self.assertEqual(len(self.cache_files()), 1)
+        os.remove(self.cache_files()[0])
+        pd.testing.assert_frame_equal(load_csv(self.path), self.expected)
+        self.assertEqual(len(self.cache_files()), 1)
+        pd.testing.assert_frame_equal(load_csv(self.path), self.expected)
+
+    def test_unreadable_cache_file_is_rebuilt(self):
+        with open(self.cache_files()[0], "wb") as f:
+            f.write(b"not a frame")
+        pd.testing.assert_frame_equal(load_csv(self.path), self.expected)
+
+    def test_unreadable_manifest_is_rebuilt(self):
+        with open(os.path.join(self.cache_dir, "values.csv.json"), "w") as f:
+            f.write("{")
+        pd.testing.assert_frame_equal(load_csv(self.path), self.expected)
+
+    def test_touched_file_with_removed_cache_file_is_rebuilt(self):
+        os.remove(self.cache_files()[0])
+        os.utime(self.path, ns=(0, 0))
+        pd.testing.assert_frame_equal(load_csv(self.path), self.expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
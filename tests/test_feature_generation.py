@@ -0,0 +1,68 @@
+"""
+Tests of the lag and rolling-window features (feature_generation.FeatureGenerator) on a hand-built panel of two
+regions, and of their incremental update.
+
+Authored by: Josephine Monica (Github @josephinemonica)
+Co-authored by: Nicholas Sadjoli (Github @NickSadjoli)
+"""
+import os
+import sys
+import unittest
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tools"))
+from feature_generation import FeatureGenerator, feature_names
+
+spec = {
+    "lags": {"ConfirmedCases": [1, 2]},
+    "rolling_means": {"ConfirmedCases": [2]},
+    "growth_rates": {"ConfirmedCases": [2]},
+    "days_since": {"ConfirmedCases": [1, 5]},
+}
+dates = ["2020-03-{:02d}".format(day) for day in range(1, 6)]
+
+
+def panel():
+    # The rows of the two regions are interleaved, as in train.csv sorted by date
+    a = [0, 1, 3, 6, 10]
+    b = [2, 2, 7, 7, 20]
+    return pd.DataFrame({"Region": ["a", "b"] * 5, "Date": np.repeat(dates, 2),
+                         "ConfirmedCases": np.ravel(np.column_stack([a, b])).astype(np.float64)})
+
+
+class FeatureGeneratorTest(unittest.TestCase):
+    def test_feature_values(self):
+        df = panel()
+        features = FeatureGenerator(spec).generate(df)
+        self.assertEqual(list(features.columns), feature_names(spec))
+        a = features[df["Region"] == "a"]
+        b = features[df["Region"] == "b"]
+
+        self.assertEqual(a["lag1_ConfirmedCases"].tolist(), [0, 0, 1, 3, 6])
+        self.assertEqual(a["lag2_ConfirmedCases"].tolist(), [0, 0, 0, 1, 3])
+        self.assertEqual(b["lag1_ConfirmedCases"].tolist(), [0, 2, 2, 7, 7])
+        # mean of the previous days only, fewer than 2 at the start of the region
+        self.assertEqual(a["rolling_mean2_ConfirmedCases"].tolist(), [0, 0, 0.5, 2, 4.5])
+        self.assertEqual(b["rolling_mean2_ConfirmedCases"].tolist(), [0, 2, 2, 4.5, 7])
+        np.testing.assert_allclose(a["growth2_ConfirmedCases"],
+                                   [0, 0, 0, (np.log1p(3) - np.log1p(0)) / 2, (np.log1p(6) - np.log1p(1)) / 2])
+        # days since the previous day's value first reached N, in days
+        self.assertEqual(a["days_since1_ConfirmedCases"].tolist(), [-1, -1, 0, 1, 2])
+        self.assertEqual(a["days_since5_ConfirmedCases"].tolist(), [-1, -1, -1, -1, 0])
+        self.assertEqual(b["days_since1_ConfirmedCases"].tolist(), [-1, 0, 1, 2, 3])
+        self.assertEqual(b["days_since5_ConfirmedCases"].tolist(), [-1, -1, -1, 0, 1])
+
+    def test_update_matches_generate(self):
+        df = panel()
+        is_new = df["Date"] >= dates[3]
+        generator = FeatureGenerator(spec)
+        generator.generate(df[~is_new])
+        updated = pd.concat([generator.update(df[is_new & (df["Date"] == date)]) for date in dates[3:]])
+        full = FeatureGenerator(spec).generate(df)
+        pd.testing.assert_frame_equal(updated, full[is_new])
+
+
+if __name__ == "__main__":
+    unittest.main()
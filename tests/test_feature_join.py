@@ -0,0 +1,42 @@
+"""
+Tests of the join of the population features (feature_join.join_population_features) on the (country, region)
+pairs of the training data.
+
+Authored by: Nicholas Sadjoli (Github @NickSadjoli)
+Co-authored by: Josephine Monica (Github @josephinemonica)
+"""
+import os
+import sys
+import unittest
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tools"))
+from feature_join import join_population_features
+
+
+class JoinPopulationFeaturesTest(unittest.TestCase):
+    def setUp(self):
+        self.population_df = pd.DataFrame({
+            '#': ["1", "1.5", "2"],
+            'Country (or dependency)': ["United States", "United States", "France"],
+            'Region': ["All_Regions", "New York", "All_Regions"],
+            'Population (2020)': ["331,002,651", "8,175,133", "65,273,511"],
+            'Density (P/Km²)': ["36", "", "119"],
+        })
+        self.density_df = pd.DataFrame({'VAR': ["POP_DEN"], 'Year': [2019], 'Region': ["New York"], 'Value': [160.0]})
+        self.df = pd.DataFrame({'Country_Region': ["US", "US", "US", "France"],
+                                'Province_State': ["New York", "Ohio", np.nan, np.nan]})
+
+    def test_regions_only_fall_back_to_the_country_density(self):
+        joined, report = join_population_features(self.df, self.population_df, self.density_df)
+        # Ohio has no population of its own: the one of the whole US would be wrong
+        np.testing.assert_array_equal(joined['Population (2020)'], [8175133.0, np.nan, 331002651.0, 65273511.0])
+        self.assertEqual(joined['Population Density'].tolist(), [160.0, 36.0, 36.0, 119.0])
+        self.assertEqual(report['Population (2020)'].tolist(), ["region", "none", "country", "country"])
+        self.assertEqual(report['Population Density'].tolist(), ["region", "country", "country", "country"])
+
+
+if __name__ == "__main__":
+    unittest.main()
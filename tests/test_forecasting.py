@@ -0,0 +1,65 @@
+"""
+Tests of the validation rollout (forecasting.rollout_validation) against the one-row-at-a-time reference
+implementation, with simple models in place of the EBM models.
+
+Authored by: Josephine Monica (Github @josephinemonica)
+Co-authored by: Nicholas Sadjoli (Github @NickSadjoli)
+"""
+import os
+import sys
+import unittest
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tools"))
+from forecasting import _rollout_validation_rowwise, default_targets, rollout_validation
+
+
+class RegionGrowthModel():
+    # Predicts the previous day's value plus a growth depending on the region and the day, and checks the dtypes
+    # of the features it is given
+    def __init__(self, target, dtypes):
+        self.target = target
+        self.dtypes = dtypes
+
+    def predict(self, X):
+        assert X.dtypes.to_dict() == self.dtypes, X.dtypes
+        region_growth = X["Region"].astype(str).str.len().to_numpy() * 0.1
+        return X["prev_{}".format(self.target)].to_numpy() + region_growth - 0.05 * (X["Days"].to_numpy() % 3)
+
+def validation_rows(num_days_per_region=(5, 3, 1, 4)):
+    rows = []
+    for i, num_days in enumerate(num_days_per_region):
+        for day in range(num_days):
+            rows.append({"Region": "r" * (i + 1), "Days": 50 + day, "prev_ConfirmedCases": float(i + day),
+                         "prev_Fatalities": float(day) / 2})
+    return pd.DataFrame(rows, index=np.arange(len(rows)) * 2)
+
+
+class RolloutValidationTest(unittest.TestCase):
+    def check(self, X_val, enforce_constraint=True):
+        dtypes = X_val.dtypes.to_dict()
+        models = {target: RegionGrowthModel(target, dtypes) for target in default_targets}
+        Y_rowwise = _rollout_validation_rowwise(models, X_val, enforce_constraint=enforce_constraint)
+        Y_batched = rollout_validation(models, X_val, enforce_constraint=enforce_constraint)
+        np.testing.assert_array_equal(Y_batched, Y_rowwise)
+
+    def test_matches_rowwise_rollout(self):
+        self.check(validation_rows())
+        self.check(validation_rows(), enforce_constraint=False)
+
+    def test_matches_rowwise_rollout_with_categorical_regions(self):
+        X_val = validation_rows()
+        X_val["Region"] = X_val["Region"].astype("category")
+        self.check(X_val)
+
+    def test_input_is_not_modified(self):
+        X_val = validation_rows()
+        expected = X_val.copy()
+        self.check(X_val)
+        pd.testing.assert_frame_equal(X_val, expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,198 @@
+"""
+Tests of the HTTP response cache (http_cache.HttpCache) against a local HTTP server: fresh, revalidated (ETag and
+Last-Modified), downloaded and stale responses, TTL expiry, and the eviction of the least recently used bodies.
+
+Authored by: Nicholas Sadjoli (Github @NickSadjoli)
+Co-authored by: Josephine Monica (Github @josephinemonica)
+"""
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tools"))
+from http_cache import HttpCache
+
+from local_server import LocalServer
+
+
+class SourceServer(LocalServer):
+    '''
+    LocalServer whose paths have a body that can be changed, and answer 304 to matching conditional requests.
+    Paths in failing answer 500.
+    '''
+    def __init__(self):
+        super().__init__(respond=self.respond)
+        self.bodies = {}
+        self.validators = {}
+        self.failing = set()
+
+    def set_body(self, path, body, etag=True, last_modified=False):
+        self.bodies[path] = body
+        validators = {}
+        if etag:
+            validators["ETag"] = '"{}"'.format(hashlib.sha1(body).hexdigest()[:12])
+        if last_modified:
+            validators["Last-Modified"] = time.strftime("%a, %d %b %Y %H:%M:%S GMT",
+                                                        time.gmtime(1580000000 + len(self.validators)))
+        self.validators[path] = validators
+
+    def respond(self, handler):
+        path = handler.path
+        if path in self.failing:
+            return 500, {}, b"error"
+        if path not in self.bodies:
+            return 404, {}, b"not found"
+        validators = self.validators[path]
+        if "ETag" in validators and handler.headers.get("If-None-Match") == validators["ETag"]:
+            return 304, validators, b""
+        if "Last-Modified" in validators and handler.headers.get("If-Modified-Since") == validators["Last-Modified"]:
+            return 304, validators, b""
+        return 200, dict(validators, **{"Content-Type": "text/csv"}), self.bodies[path]
+
+    def num_requests(self, path):
+        return sum(1 for request_path, _ in self.requests if request_path == path)
+
+
+class HttpCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.server = SourceServer().__enter__()
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.server.__exit__(None, None, None)
+        shutil.rmtree(self.cache_dir)
+
+    def objects(self):
+        objects_dir = os.path.join(self.cache_dir, "objects")
+        return sorted(os.listdir(objects_dir)) if os.path.isdir(objects_dir) else []
+
+    def test_fresh_response_makes_no_request(self):
+        self.server.set_body("/a.csv", b"x,y\n1,2\n")
+        cache = HttpCache(self.cache_dir, ttl=60)
+        body, info = cache.fetch(self.server.url("/a.csv"))
+        self.assertEqual((body, info["status"], info["bytes_downloaded"]), (b"x,y\n1,2\n", "downloaded", 8))
+        body, info = cache.fetch(self.server.url("/a.csv"))
+        self.assertEqual((body, info["status"], info["bytes_downloaded"]), (b"x,y\n1,2\n", "fresh", 0))
+        self.assertEqual(self.server.num_requests("/a.csv"), 1)
+        self.assertEqual(cache.stats, {"fresh": 1, "not_modified": 0, "downloaded": 1, "stale": 0, "bytes_downloaded": 8})
+        self.assertEqual(self.objects(), [hashlib.sha1(b"x,y\n1,2\n").hexdigest()])
+
+        # Once flushed, the index is on disk, so another cache on the same folder serves it too
+        cache.flush()
+        body, info = HttpCache(self.cache_dir, ttl=60).fetch(self.server.url("/a.csv"))
+        self.assertEqual((body, info["status"]), (b"x,y\n1,2\n", "fresh"))
+
+    def test_index_is_written_once_per_batch(self):
+        index_path = os.path.join(self.cache_dir, "index.json")
+        for i in range(20):
+            self.server.set_body("/{}.csv".format(i), "x\n{}\n".format(i).encode("utf-8"))
+        with HttpCache(self.cache_dir, ttl=60) as cache:
+            for _ in range(3):
+                for i in range(20):
+                    cache.fetch(self.server.url("/{}.csv".format(i)))
+            self.assertFalse(os.path.exists(index_path))
+        self.assertEqual(cache.stats["fresh"], 40)
+
+        # close wrote the index, with the last use of every response
+        with open(index_path) as f:
+            index = json.load(f)
+        self.assertEqual(sorted(index), sorted(cache.index))
+        self.assertEqual(index, cache.index)
+        mtime = os.stat(index_path).st_mtime_ns
+        cache.flush()
+        self.assertEqual(os.stat(index_path).st_mtime_ns, mtime)
+
+        # a cache with save_interval=0 writes it on every change
+        eager_cache = HttpCache(self.cache_dir, ttl=0, save_interval=0)
+        eager_cache.fetch(self.server.url("/0.csv"))
+        with open(index_path) as f:
+            self.assertEqual(json.load(f), eager_cache.index)
+
+    def test_expired_response_is_revalidated_with_etag(self):
+        self.server.set_body("/a.csv", b"x,y\n1,2\n")
+        cache = HttpCache(self.cache_dir, ttl=60)
+        cache.fetch(self.server.url("/a.csv"))
+        body, info = cache.fetch(self.server.url("/a.csv"), ttl=0)
+        self.assertEqual((body, info["status"]), (b"x,y\n1,2\n", "not_modified"))
+        _, headers = self.server.requests[-1]
+        self.assertEqual(headers.get("If-None-Match"), self.server.validators["/a.csv"]["ETag"])
+        self.assertEqual(cache.stats["not_modified"], 1)
+
+        # Revalidation restarts the TTL
+        self.assertEqual(cache.fetch(self.server.url("/a.csv"))[1]["status"], "fresh")
+
+    def test_expired_response_is_revalidated_with_last_modified(self):
+        self.server.set_body("/b.csv", b"b\n1\n", etag=False, last_modified=True)
+        cache = HttpCache(self.cache_dir, ttl=0)
+        cache.fetch(self.server.url("/b.csv"))
+        body, info = cache.fetch(self.server.url("/b.csv"))
+        self.assertEqual((body, info["status"]), (b"b\n1\n", "not_modified"))
+        _, headers = self.server.requests[-1]
+        self.assertEqual(headers.get("If-Modified-Since"), self.server.validators["/b.csv"]["Last-Modified"])
+        self.assertNotIn("If-None-Match", headers)
+
+    def test_changed_content_is_downloaded_and_old_body_removed(self):
+        self.server.set_body("/a.csv", b"x\n1\n")
+        cache = HttpCache(self.cache_dir, ttl=0)
+        cache.fetch(self.server.url("/a.csv"))
+        self.server.set_body("/a.csv", b"x\n1\n2\n")
+        body, info = cache.fetch(self.server.url("/a.csv"))
+        self.assertEqual((body, info["status"], info["bytes_downloaded"]), (b"x\n1\n2\n", "downloaded", 6))
+        self.assertEqual(info["sha1"], hashlib.sha1(b"x\n1\n2\n").hexdigest())
+        self.assertEqual(self.objects(), [info["sha1"]])
+        self.assertEqual(cache.stats["downloaded"], 2)
+        self.assertEqual(cache.stats["bytes_downloaded"], 10)
+
+    def test_failed_revalidation_serves_stale_body(self):
+        self.server.set_body("/a.csv", b"x\n1\n")
+        cache = HttpCache(self.cache_dir, ttl=0)
+        cache.fetch(self.server.url("/a.csv"))
+        self.server.failing.add("/a.csv")
+        body, info = cache.fetch(self.server.url("/a.csv"))
+        self.assertEqual((body, info["status"]), (b"x\n1\n", "stale"))
+        self.assertEqual(cache.stats["stale"], 1)
+
+        strict_cache = HttpCache(self.cache_dir, ttl=0, stale_if_error=False)
+        with self.assertRaises(strict_cache.requests.HTTPError):
+            strict_cache.fetch(self.server.url("/a.csv"))
+        # Nothing cached yet: the error is raised even with stale_if_error
+        with self.assertRaises(cache.requests.HTTPError):
+            cache.fetch(self.server.url("/missing.csv"))
+
+    def test_least_recently_used_bodies_are_evicted(self):
+        bodies = {"/1.csv": b"1" * 100, "/2.csv": b"2" * 100, "/3.csv": b"3" * 100}
+        for path, body in bodies.items():
+            self.server.set_body(path, body)
+        cache = HttpCache(self.cache_dir, ttl=60, max_bytes=250)
+        cache.fetch(self.server.url("/1.csv"))
+        time.sleep(0.01)
+        cache.fetch(self.server.url("/2.csv"))
+        time.sleep(0.01)
+        self.assertEqual(cache.fetch(self.server.url("/1.csv"))[1]["status"], "fresh")
+        time.sleep(0.01)
+        cache.fetch(self.server.url("/3.csv"))
+
+        # /2.csv is the least recently used one
+        self.assertEqual(sorted(cache.index), [self.server.url("/1.csv"), self.server.url("/3.csv")])
+        self.assertEqual(self.objects(), sorted(hashlib.sha1(bodies[path]).hexdigest() for path in ["/1.csv", "/3.csv"]))
+        self.assertEqual(cache.fetch(self.server.url("/2.csv"))[1]["status"], "downloaded")
+        self.assertEqual(self.server.num_requests("/2.csv"), 2)
+
+    def test_stats_views_count_their_own_requests(self):
+        self.server.set_body("/a.csv", b"x\n1\n")
+        cache = HttpCache(self.cache_dir, ttl=60)
+        first, second = cache.stats_view(), cache.stats_view()
+        first.get(self.server.url("/a.csv"))
+        self.assertEqual(second.read_csv(self.server.url("/a.csv"))["x"].tolist(), [1])
+        self.assertEqual((first.stats["downloaded"], first.stats["fresh"]), (1, 0))
+        self.assertEqual((second.stats["downloaded"], second.stats["fresh"]), (0, 1))
+        self.assertEqual((cache.stats["downloaded"], cache.stats["fresh"]), (1, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
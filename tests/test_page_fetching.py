@@ -0,0 +1,94 @@
+"""
+Tests of the concurrent fetching of the Worldometer country pages (page_fetching.iter_pages and
+Worldometer_LatestCountriesData(n_workers=...)) against a local HTTP server serving saved country pages.
+
+Authored by: Nicholas Sadjoli (Github @NickSadjoli)
+Co-authored by: Josephine Monica (Github @josephinemonica)
+"""
+import os
+import sys
+import threading
+import unittest
+
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tools"))
+from page_fetching import HostRateLimiter, HttpPageFetcher, fetch_pages, iter_pages, url_to_file_name
+from scrape_worldometer_data import Worldometer_LatestCountriesData, worldometer_path
+
+from local_server import LocalServer, fixtures_dir
+
+pages_dir = os.path.join(fixtures_dir, "worldometer")
+country_slugs = {"USA": "us", "Italy": "italy", "Spain": "spain", "China": "china", "Brazil": "brazil", "India": "india"}
+dates = ["Mar {:02d}".format(day) for day in range(1, 21)]
+
+
+def uneven_delay(path):
+    # The first pages are the slowest, so that concurrent fetches complete out of order
+    import time
+    slugs = list(country_slugs.values())
+    for i, slug in enumerate(slugs):
+        if slug in path:
+            time.sleep(0.05 * (len(slugs) - i))
+
+
+class IterPagesTest(unittest.TestCase):
+    def setUp(self):
+        self.server = LocalServer(directory=pages_dir, delay=uneven_delay).__enter__()
+        self.country_urls = {country: self.server.url(url_to_file_name(worldometer_path + "country/{}/".format(slug)))
+                             for country, slug in country_slugs.items()}
+
+    def tearDown(self):
+        self.server.__exit__(None, None, None)
+
+    def test_pages_are_yielded_in_url_order(self):
+        urls = list(self.country_urls.values())
+        fetcher = HttpPageFetcher()
+        serial = fetch_pages(fetcher, urls, n_workers=1, rate_limiter=HostRateLimiter(0))
+        concurrent = fetch_pages(fetcher, urls, n_workers=4, rate_limiter=HostRateLimiter(0))
+        self.assertEqual(len(serial), len(urls))
+        self.assertEqual(serial, concurrent)
+        # The server sends no charset, so requests decodes the pages as ISO-8859-1
+        for url, page in zip(urls, concurrent):
+            with open(os.path.join(pages_dir, url.rsplit("/", 1)[-1]), encoding="utf-8") as f:
+                self.assertEqual(page.encode("iso-8859-1"), f.read().encode("utf-8"))
+
+    def test_countries_data_is_the_same_with_one_or_four_workers(self):
+        frames = {}
+        for n_workers in [1, 4]:
+            countries_data = Worldometer_LatestCountriesData(countries_w_href=self.country_urls, dates=list(dates),
+                                                             page_fetcher=HttpPageFetcher(), n_workers=n_workers)
+            frames[n_workers] = (countries_data.countries_timeseries_data, countries_data.countries_regional_data)
+
+        timeseries, regional = frames[1]
+        self.assertEqual(list(timeseries["Country"].unique()), list(country_slugs))
+        self.assertEqual(list(regional["Country"].unique()), ["USA", "Italy", "Brazil"])
+        pd.testing.assert_frame_equal(frames[4][0], timeseries)
+        pd.testing.assert_frame_equal(frames[4][1], regional)
+
+    def test_pages_fetched_ahead_are_bounded(self):
+        started = []
+        lock = threading.Lock()
+
+        class RecordingFetcher():
+            def get(self, url):
+                with lock:
+                    started.append(url)
+                return url
+
+        urls = ["http://127.0.0.1/{}".format(i) for i in range(50)]
+        pages = iter_pages(RecordingFetcher(), iter(urls), n_workers=3, rate_limiter=HostRateLimiter(0))
+        consumed = []
+        for page in pages:
+            consumed.append(page)
+            # the page being consumed, and at most 2 * n_workers pages submitted after it
+            self.assertLessEqual(len(started), len(consumed) + 2 * 3)
+            if len(consumed) == 10:
+                break
+        pages.close()
+        self.assertEqual(consumed, urls[:10])
+        self.assertLessEqual(len(started), 10 + 2 * 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
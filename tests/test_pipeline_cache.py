@@ -0,0 +1,122 @@
+"""
+Tests of the pipeline cache (pipeline_cache.PipelineCache): stored outputs are invalidated by edits of the stage
+function's file and of the files of the modules it depends on, preprocess is cached on DataFrames, and reading
+outputs back doesn't rewrite the index every time.
+
+Authored by: Josephine Monica (Github @josephinemonica)
+Co-authored by: Nicholas Sadjoli (Github @NickSadjoli)
+"""
+import importlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tools"))
+from data_processing import preprocess
+from pipeline_cache import PipelineCache, cached_preprocess, module_files
+
+
+class CodeFilesTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.write("stage_dependency.py", "factor = 2\n")
+        self.write("stage_module.py", "from stage_dependency import factor\n\n"
+                                      "def stage(df):\n    return df * factor\n")
+        sys.path.insert(0, self.tmp_dir)
+        self.stage = importlib.import_module("stage_module").stage
+        self.cache = PipelineCache(os.path.join(self.tmp_dir, "cache"))
+        self.df = pd.DataFrame({"x": [1, 2, 3]})
+
+    def tearDown(self):
+        sys.path.remove(self.tmp_dir)
+        for module_name in ["stage_module", "stage_dependency"]:
+            sys.modules.pop(module_name, None)
+        shutil.rmtree(self.tmp_dir)
+
+    def write(self, file_name, source):
+        with open(os.path.join(self.tmp_dir, file_name), "w") as f:
+            f.write(source)
+
+    def key(self, code_files=()):
+        return self.cache.key("stage", self.stage, args=(self.df,), code_files=code_files)
+
+    def test_editing_a_code_file_changes_the_key(self):
+        code_files = module_files("stage_dependency")
+        self.assertEqual(code_files, [os.path.join(self.tmp_dir, "stage_dependency.py")])
+        without_code_files, with_code_files = self.key(), self.key(code_files)
+        self.assertNotEqual(without_code_files, with_code_files)
+
+        self.write("stage_dependency.py", "factor = 10\n")
+        # Only the stage's own file is hashed unless its dependencies are given
+        self.assertEqual(self.key(), without_code_files)
+        self.assertNotEqual(self.key(code_files), with_code_files)
+
+        self.write("stage_module.py", "from stage_dependency import factor\n\n"
+                                      "def stage(df):\n    return df * factor + 1\n")
+        self.assertNotEqual(self.key(), without_code_files)
+
+    def test_memoize_recomputes_after_a_dependency_is_edited(self):
+        code_files = module_files("stage_dependency")
+        first = self.cache.memoize("stage", self.stage, args=(self.df,), code_files=code_files)
+        self.cache.memoize("stage", self.stage, args=(self.df,), code_files=code_files)
+        self.assertEqual(self.cache.stats, {"hit": 1, "miss": 1, "not_stored": 0})
+        self.assertEqual(first["x"].tolist(), [2, 4, 6])
+
+        self.write("stage_dependency.py", "factor = 10\n")
+        self.cache.memoize("stage", self.stage, args=(self.df,), code_files=code_files)
+        self.assertEqual(self.cache.stats["miss"], 2)
+
+
+class PipelineCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_preprocess_of_a_dataframe_is_cached(self):
+        df = pd.DataFrame({"Country_Region": ["A"] * 4 + ["B"] * 4, "Province_State": [np.nan] * 8,
+                           "Date": ["2020-03-0{}".format(day) for day in range(1, 5)] * 2,
+                           "ConfirmedCases": [0, 0, 1, 3, 0, 4, 4, 9], "Fatalities": [0, 0, 0, 1, 0, 0, 1, 1]})
+        original = df.copy()
+        cache = PipelineCache(self.cache_dir)
+        features = ["Region", "Days", "prev_ConfirmedCases", "prev_Fatalities"]
+        targets = ["ConfirmedCases", "Fatalities"]
+        X, Y = cached_preprocess(df, features, targets, cache=cache)
+        cached_X, cached_Y = cached_preprocess(df, features, targets, cache=cache)
+        self.assertEqual(cache.stats, {"hit": 1, "miss": 1, "not_stored": 0})
+        pd.testing.assert_frame_equal(df, original)
+
+        expected_X, expected_Y = preprocess(df, features, targets)
+        pd.testing.assert_frame_equal(cached_X, expected_X)
+        pd.testing.assert_frame_equal(cached_Y, expected_Y)
+        # rows start the day before the first case of their region
+        self.assertEqual(list(X["Days"]), [-1, 0, 1, 2, 0, 1, 2, 3])
+
+        df.loc[7, "ConfirmedCases"] = 10
+        cached_preprocess(df, features, targets, cache=cache)
+        self.assertEqual(cache.stats["miss"], 2)
+
+    def test_reading_outputs_back_does_not_rewrite_the_index(self):
+        index_path = os.path.join(self.cache_dir, "index.json")
+        cache = PipelineCache(self.cache_dir)
+        cache.memoize("sum", sum, args=([1, 2, 3],))
+        mtime = os.stat(index_path).st_mtime_ns
+        for _ in range(10):
+            self.assertEqual(cache.memoize("sum", sum, args=([1, 2, 3],)), 6)
+        self.assertEqual(os.stat(index_path).st_mtime_ns, mtime)
+
+        # flush writes the last use of the outputs
+        cache.flush()
+        with open(index_path) as f:
+            self.assertEqual(json.load(f), cache.index)
+
+
+if __name__ == "__main__":
+    unittest.main()
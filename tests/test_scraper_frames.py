@@ -0,0 +1,186 @@
+"""
+Regression tests of the frames built by the Worldometer scrapers (Worldometer_LatestCountriesData and
+update_data.get_worldometer_population_data) from saved pages, against the row by row DataFrame.append
+implementations they replaced.
+
+Authored by: Nicholas Sadjoli (Github @NickSadjoli)
+Co-authored by: Josephine Monica (Github @josephinemonica)
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+from bs4 import BeautifulSoup
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tools"))
+from covid19_scraper_utils import WorldometerScraper
+from page_fetching import ReplayPageFetcher
+from scrape_worldometer_data import Worldometer_LatestCountriesData, Worldometer_LatestGlobalData, worldometer_path
+from update_data import get_worldometer_population_data
+
+from local_server import fixtures_dir
+
+pages_dir = os.path.join(fixtures_dir, "worldometer")
+country_slugs = {"USA": "us", "Italy": "italy", "Spain": "spain", "China": "china", "Brazil": "brazil", "India": "india"}
+# All the dates of the charts of the saved pages
+all_dates = ["Feb 28", "Feb 29"] + ["Mar {:02d}".format(day) for day in range(1, 21)]
+population_url = "https://www.worldometers.info/world-population/population-by-country/"
+global_charts_script = (
+    "Highcharts.chart('coronavirus-cases-linear', { xAxis: { categories: [\"Jan 22\",\"Jan 23\",\"Jan 24\"] }, "
+    "series: [{ name: 'Cases', data: [580,845,1317] }] });"
+    "Highcharts.chart('deaths-cured-outcome-small', { xAxis: { categories: [\"Jan 23\",\"Jan 24\"] }, "
+    "series: [{ name: 'Death Rate', data: [41.8,39.85] }, { name: 'Recovery Rate', data: [58.2,60.15] }] });"
+)
+
+
+def append(frame, other):
+    '''
+    DataFrame.append, as used by the previous implementations. It was removed in pandas 2, where it is emulated
+    the way pandas 1 implemented it: a Series is appended as a one-row frame whose values are type-inferred, and
+    the dtypes of an empty frame are ignored.
+    '''
+    is_row = isinstance(other, pd.Series)
+    if hasattr(pd.DataFrame, "append"):
+        return frame.append(other, ignore_index=is_row)
+    if is_row:
+        other = pd.DataFrame([other.tolist()], columns=other.index).infer_objects()
+        if len(frame) == 0:
+            return other
+    return pd.concat([frame, other], ignore_index=is_row)
+
+def appended_timeseries_frame(countries_timeseries_dict, dates):
+    # Previous Worldometer_LatestCountriesData: one row per (country, chart), appended one at a time
+    columns = ['Country', 'Data Type'] + list(dates)
+    timeseries_data = pd.DataFrame(columns=columns)
+    for country in countries_timeseries_dict:
+        for data_type in countries_timeseries_dict[country]:
+            if data_type == 'dates':
+                continue
+            chart = countries_timeseries_dict[country][data_type]
+            cur_timeseries = pd.Series(index=columns, dtype=object)
+            cur_timeseries['Country'] = country
+            cur_timeseries['Data Type'] = data_type
+            cur_timeseries[chart['chart_dates']] = list(chart['values'])
+            timeseries_data = append(timeseries_data, cur_timeseries)
+    return timeseries_data
+
+def appended_population_data(page_fetcher):
+    # Previous get_worldometer_population_data: every city row is appended, then the frame is sorted again. The
+    # previous sort wasn't stable, so the rows of the same country could come in any order; a stable sort is used.
+    scraper = WorldometerScraper(page_fetcher=page_fetcher)
+    population_table = scraper.get_page_soup(population_url).find_all('table')[0]
+    population_data, _, _, countries_w_href = scraper.parse_worldometertable_w_hrefs(population_table, 1,
+                                                                                     "https://www.worldometers.info")
+    population_data.insert(2, 'Region', 'All_Regions')
+    for country in countries_w_href:
+        country_population_soup = BeautifulSoup(page_fetcher.get(countries_w_href[country]), "html.parser")
+        rows = country_population_soup.find_all('table')[-1].find_all('tr')
+        column_names = [head.text.replace('\xa0', ' ') for head in rows[0].find_all('th')]
+        if 'CITY NAME' not in column_names:
+            continue
+        for i in range(1, len(rows)):
+            row_values = [row_el.text.replace('\n', ' ').replace('+', '') for row_el in rows[i].find_all('td')]
+            cur_country_index = population_data[population_data['Country (or dependency)'] == country].index.values[0]
+            cur_df = pd.DataFrame({'#': [str(cur_country_index + 1.5)], 'Country (or dependency)': [country.rstrip()],
+                                   'Region': [row_values[1]], 'Population (2020)': [row_values[-1]]},
+                                  index=[cur_country_index + 1]).reindex(columns=population_data.columns)
+            population_data = append(population_data, cur_df)
+            population_data = population_data.sort_values(by=['#'], kind='mergesort')
+    return population_data
+
+
+class ScraperFramesTest(unittest.TestCase):
+    def setUp(self):
+        self.page_fetcher = ReplayPageFetcher(pages_dir)
+        self.countries_w_href = {country: worldometer_path + "country/{}/".format(slug)
+                                 for country, slug in country_slugs.items()}
+
+    def scrape(self, dates):
+        return Worldometer_LatestCountriesData(countries_w_href=self.countries_w_href, dates=list(dates),
+                                               page_fetcher=self.page_fetcher)
+
+    def test_timeseries_frame_matches_appended_frame(self):
+        countries_data = self.scrape(all_dates)
+        timeseries = countries_data.countries_timeseries_data
+        expected = appended_timeseries_frame(countries_data.countries_timeseries_dict, all_dates)
+
+        pd.testing.assert_frame_equal(timeseries, expected)
+        self.assertEqual(list(timeseries.columns), ['Country', 'Data Type'] + all_dates)
+        self.assertTrue(all(dtype == np.float64 for dtype in timeseries.dtypes[all_dates]))
+        self.assertEqual(timeseries.shape, (4 * len(country_slugs), 2 + len(all_dates)))
+
+    def test_timeseries_frame_drops_dates_not_provided(self):
+        dates = all_dates[2:]
+        timeseries = self.scrape(dates).countries_timeseries_data
+        full = self.scrape(all_dates).countries_timeseries_data
+        self.assertEqual(list(timeseries.columns), ['Country', 'Data Type'] + dates)
+        pd.testing.assert_frame_equal(timeseries, full.drop(columns=all_dates[:2]))
+        # China's charts start on Feb 28, the other countries' after Mar 01
+        confirmed = full[full["Data Type"] == "Cumulative Confirmed (Linear)"].set_index("Country")
+        self.assertFalse(confirmed.loc["China", all_dates[:2]].isnull().any())
+        self.assertTrue(full[full["Country"] != "China"][all_dates[:2]].isnull().all().all())
+
+    def test_regional_frame(self):
+        # The previous implementation added the columns of every country after the first one as a single list
+        # column, so the expected frame is the one of the saved tables: the union of the countries' columns
+        regional = self.scrape(all_dates).countries_regional_data
+        expected = pd.DataFrame({
+            'Country': ["USA", "USA", "USA", "Italy", "Italy", "Brazil"],
+            'Region': ["New York", "New Jersey", "California", "Lombardy", "Veneto", "São Paulo"],
+            'Total Cases': ["31,039", "94,631", "20,412", "2,697", "38,029", "29,188"],
+            'New Cases': ["38", "50", "11", "51", "97", "66"],
+            'Total Deaths': ["13,622", "62,867", "8,818", np.nan, np.nan, "70,443"],
+            'Total Tests': [np.nan, np.nan, np.nan, "72,111", "7,813", np.nan],
+        })
+        pd.testing.assert_frame_equal(regional, expected)
+
+    def test_population_data_matches_appended_frame(self):
+        population_data = get_worldometer_population_data(self.page_fetcher)
+        expected = appended_population_data(self.page_fetcher)
+
+        pd.testing.assert_frame_equal(population_data, expected)
+        self.assertEqual(list(population_data['#']),
+                         ["1", "1.5", "1.5", "1.5", "2", "2.5", "2.5", "2.5", "2.5", "3", "3.5", "3.5", "3.5", "3.5", "4",
+                          "5", "5.5", "5.5"])
+        # Indonesia's page has no cities table
+        self.assertEqual(list(population_data['Region'][population_data['Country (or dependency)'] == "Indonesia"]),
+                         ["All_Regions"])
+
+    def test_population_data_is_the_same_with_one_or_four_workers(self):
+        pd.testing.assert_frame_equal(get_worldometer_population_data(self.page_fetcher, n_workers=4),
+                                      get_worldometer_population_data(self.page_fetcher, n_workers=1))
+
+
+class GlobalTimeseriesTest(unittest.TestCase):
+    def parse(self):
+        # Worldometer_LatestGlobalData without scraping the main page, on the charts of global_charts_script
+        global_data = Worldometer_LatestGlobalData.__new__(Worldometer_LatestGlobalData)
+        global_data.global_charts = [BeautifulSoup("<script>{}</script>".format(global_charts_script),
+                                                   "html.parser").script]
+        global_data.global_timeseries_dict = {}
+        global_data.domId_map = {'coronavirus-cases-linear': 'Cumulative Confirmed (Linear)',
+                                 'deaths-cured-outcome-small': 'Closed Cases'}
+        global_data.parse_global_timeseries()
+        return global_data
+
+    def test_counts_are_written_as_integers(self):
+        global_data = self.parse()
+        path = os.path.join(tempfile.mkdtemp(), "Main_Worldometer_TimeSeries.csv")
+        try:
+            global_data.write_globalTimeSeries_to_csv(path)
+            with open(path) as f:
+                lines = f.read().splitlines()
+        finally:
+            shutil.rmtree(os.path.dirname(path))
+        self.assertEqual(lines, [",Data Type,Jan 22,Jan 23,Jan 24",
+                                 "0,Cumulative Confirmed (Linear),580,845,1317",
+                                 "1,Closed Cases - Death Rate,0,41.8,39.85",
+                                 "2,Closed Cases - Recovery Rate,0,58.2,60.15"])
+
+
+if __name__ == "__main__":
+    unittest.main()
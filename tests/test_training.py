@@ -0,0 +1,90 @@
+"""
+Tests of the concurrent fitting of the models (training.fit_models): every call only sees its own training data,
+even when several calls overlap.
+
+Authored by: Josephine Monica (Github @josephinemonica)
+Co-authored by: Nicholas Sadjoli (Github @NickSadjoli)
+"""
+import os
+import sys
+import threading
+import unittest
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tools"))
+import training
+from training import fit_models
+
+
+class MeanModel():
+    # Remembers the mean of the target it was fitted on
+    def __init__(self, delay):
+        self.delay = delay
+
+    def fit(self, X, y):
+        threading.Event().wait(self.delay)
+        self.mean = float(np.mean(y))
+        return self
+
+def slow_factory(random_state, n_jobs):
+    return MeanModel(0.05)
+
+def dataset(value, num_rows=10):
+    return (pd.DataFrame({"x": np.arange(num_rows)}),
+            pd.DataFrame({"ConfirmedCases": np.full(num_rows, value, dtype=np.float64)}))
+
+
+class NestedFitModel(MeanModel):
+    # Runs another fit_models call while it is being fitted, as a backtest run from a model would
+    def fit(self, X, y):
+        self.nested = fit_models({"train": dataset(10.0)}, targets=["ConfirmedCases"], n_workers=1,
+                                 model_factory=slow_factory)["train"]["ConfirmedCases"].mean
+        return super().fit(X, y)
+
+def nested_factory(random_state, n_jobs):
+    return NestedFitModel(0)
+
+
+class FitModelsTest(unittest.TestCase):
+    def test_models_are_fitted_on_their_own_dataset(self):
+        for n_workers in [1, 2]:
+            models = fit_models({"a": dataset(1.0), "b": dataset(2.0)}, targets=["ConfirmedCases"],
+                                n_workers=n_workers, model_factory=slow_factory)
+            self.assertEqual((models["a"]["ConfirmedCases"].mean, models["b"]["ConfirmedCases"].mean), (1.0, 2.0))
+        self.assertEqual(training._shared_datasets, {})
+
+    def test_nested_call_keeps_the_datasets_of_the_outer_call(self):
+        models = fit_models({"train": dataset(1.0), "full": dataset(2.0)}, targets=["ConfirmedCases"], n_workers=1,
+                            model_factory=nested_factory)
+        self.assertEqual([models[name]["ConfirmedCases"].nested for name in ["train", "full"]], [10.0, 10.0])
+        self.assertEqual([models[name]["ConfirmedCases"].mean for name in ["train", "full"]], [1.0, 2.0])
+        self.assertEqual(training._shared_datasets, {})
+
+    def test_overlapping_calls_keep_their_own_datasets(self):
+        results = {}
+        errors = []
+
+        def fit(value, n_workers):
+            try:
+                # every call names its dataset "train", only the key of the call tells them apart
+                models = fit_models({"train": dataset(value)}, targets=["ConfirmedCases"], n_workers=n_workers,
+                                    model_factory=slow_factory)
+                results[(value, n_workers)] = models["train"]["ConfirmedCases"].mean
+            except Exception as error:
+                errors.append(error)
+
+        threads = [threading.Thread(target=fit, args=(value, n_workers))
+                   for value in [1.0, 2.0, 3.0] for n_workers in [1, 2]]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(results, {(value, n_workers): value for value in [1.0, 2.0, 3.0] for n_workers in [1, 2]})
+        self.assertEqual(training._shared_datasets, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
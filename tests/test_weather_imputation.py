@@ -0,0 +1,47 @@
+"""
+Tests of the imputation of the weather features (weather_imputation.impute_weather) on a hand-built panel.
+
+Authored by: Josephine Monica (Github @josephinemonica)
+Co-authored by: Nicholas Sadjoli (Github @NickSadjoli)
+"""
+import os
+import sys
+import unittest
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tools"))
+from weather_imputation import impute_weather
+
+
+class ImputeWeatherTest(unittest.TestCase):
+    def test_max_and_min_fall_back_to_the_temp_of_the_same_day(self):
+        # Rows are not in date order: regions are filled in date order
+        df = pd.DataFrame({
+            "Country_Region": ["A", "A", "A", "B", "B"],
+            "Province_State": [np.nan] * 5,
+            "Date": ["2020-03-02", "2020-03-01", "2020-03-03", "2020-03-01", "2020-03-02"],
+            "temp": [50.0, 40.0, np.nan, 60.0, 61.0],
+            "max": [np.nan, 45.0, 58.0, np.nan, 70.0],
+            "min": [44.0, np.nan, np.nan, 55.0, 56.0],
+            "prcp": [99.99, 0.5, np.nan, np.nan, 0.1],
+        })
+        imputed, report = impute_weather(df)
+
+        # temp is region filled from the previous day, max/min are the temp of their own (filled) day
+        self.assertEqual(imputed["temp"].tolist(), [50.0, 40.0, 50.0, 60.0, 61.0])
+        self.assertEqual(imputed["max"].tolist(), [50.0, 45.0, 58.0, 60.0, 70.0])
+        self.assertEqual(imputed["min"].tolist(), [44.0, 40.0, 50.0, 55.0, 56.0])
+        # the sentinel is filled from the previous day, B's first day from its next day
+        self.assertEqual(imputed["prcp"].tolist(), [0.5, 0.5, 0.5, 0.1, 0.1])
+
+        self.assertEqual(report.loc["temp", "region_fill"], 1)
+        self.assertEqual((report.loc["max", "region_fill"], report.loc["max", "fallbacks"]), (0, 2))
+        self.assertEqual((report.loc["min", "region_fill"], report.loc["min", "fallbacks"]), (0, 2))
+        self.assertEqual((report.loc["prcp", "sentinels"], report.loc["prcp", "region_fill"]), (1, 3))
+        self.assertEqual(report["still_missing"].sum(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
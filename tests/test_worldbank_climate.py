@@ -0,0 +1,144 @@
+"""
+Tests of the Worldbank climate data client (worldbank_climate.fetch_climate_data) against a local stub of the API:
+retries of server errors, client errors that are not retried, bodies that are not climate CSVs, and the merging of
+several countries, variables and periods into one typed DataFrame.
+
+Authored by: Nicholas Sadjoli (Github @NickSadjoli)
+Co-authored by: Josephine Monica (Github @josephinemonica)
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tools"))
+from http_cache import HttpCache
+from worldbank_climate import climate_api_url, expected_header, fetch_climate_data, start_end_dict
+
+from local_server import LocalServer
+
+
+def climate_csv(variable, start, values):
+    # One row per GCM, with the monthly values of values[i] on row i
+    lines = [expected_header]
+    for i, value in enumerate(values):
+        months = ",".join(str(value + month / 10) for month in range(12))
+        lines.append("gcm_{},{},a2,{},{},{}".format(i, variable, start, start_end_dict[start], months))
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+class ClimateApiStub(LocalServer):
+    '''
+    LocalServer answering the climate CSVs set with set_body. A path can first answer some errors (e.g. [503]) before
+    its body, and paths without a body answer 404.
+    '''
+    def __init__(self):
+        super().__init__(respond=self.respond)
+        self.bodies = {}
+        self.errors = {}
+
+    def path(self, iso_code, variable, start):
+        return climate_api_url(iso_code, variable, start, base_url="/")
+
+    def set_body(self, iso_code, variable, start, body, errors=()):
+        path = self.path(iso_code, variable, start)
+        self.bodies[path] = body
+        self.errors[path] = list(errors)
+
+    def respond(self, handler):
+        path = handler.path
+        if self.errors.get(path):
+            return self.errors[path].pop(0), {}, b"error"
+        if path not in self.bodies:
+            return 404, {}, b"not found"
+        return 200, {"Content-Type": "text/csv"}, self.bodies[path]
+
+    def num_requests(self, iso_code, variable, start):
+        path = self.path(iso_code, variable, start)
+        return sum(1 for request_path, _ in self.requests if request_path == path)
+
+
+class FetchClimateDataTest(unittest.TestCase):
+    def setUp(self):
+        self.server = ClimateApiStub().__enter__()
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.server.__exit__(None, None, None)
+        shutil.rmtree(self.cache_dir)
+
+    def fetch(self, iso_codes, variables, periods, retries=2):
+        return fetch_climate_data(iso_codes, variables=variables, periods=periods, retries=retries, backoff=0,
+                                  http_cache=HttpCache(self.cache_dir), base_url=self.server.url())
+
+    def test_server_error_is_retried(self):
+        self.server.set_body("FRA", "tas", "2020", climate_csv("tas", "2020", [10]), errors=[503, 500])
+        climate_data, failures = self.fetch({"France": "FRA"}, ["tas"], ["2020"])
+        self.assertEqual(failures, {})
+        self.assertEqual(self.server.num_requests("FRA", "tas", "2020"), 3)
+        self.assertEqual(list(climate_data["Country"]), ["France"])
+        self.assertEqual(climate_data.loc[0, "Jan"], 10.0)
+
+    def test_server_error_fails_after_all_retries(self):
+        self.server.set_body("FRA", "tas", "2020", climate_csv("tas", "2020", [10]), errors=[503, 503, 503])
+        climate_data, failures = self.fetch({"France": "FRA"}, ["tas"], ["2020"])
+        url = climate_api_url("FRA", "tas", "2020", base_url=self.server.url())
+        self.assertEqual(list(failures), [url])
+        self.assertIn("503", failures[url])
+        self.assertEqual(self.server.num_requests("FRA", "tas", "2020"), 3)
+        self.assertEqual(len(climate_data), 0)
+
+    def test_not_found_is_not_retried(self):
+        self.server.set_body("FRA", "tas", "2020", climate_csv("tas", "2020", [10]))
+        climate_data, failures = self.fetch({"France": "FRA", "Nowhere": "XXX"}, ["tas"], ["2020"])
+        url = climate_api_url("XXX", "tas", "2020", base_url=self.server.url())
+        self.assertEqual(list(failures), [url])
+        self.assertIn("404", failures[url])
+        self.assertEqual(self.server.num_requests("XXX", "tas", "2020"), 1)
+        self.assertEqual(list(climate_data["Country"]), ["France"])
+
+    def test_body_that_is_not_a_climate_csv_is_a_failure(self):
+        self.server.set_body("FRA", "tas", "2020", climate_csv("tas", "2020", [10]))
+        self.server.set_body("ATA", "tas", "2020", b"Invalid country code. Three letters ISO3 code expected")
+        climate_data, failures = self.fetch({"France": "FRA", "Antarctica": "ATA"}, ["tas"], ["2020"])
+        url = climate_api_url("ATA", "tas", "2020", base_url=self.server.url())
+        self.assertEqual(list(failures), [url])
+        self.assertTrue(failures[url].startswith("not a climate CSV: Invalid country code"))
+        self.assertEqual(self.server.num_requests("ATA", "tas", "2020"), 1)
+        self.assertEqual(list(climate_data["Country"]), ["France"])
+
+    def test_variables_and_periods_are_merged_into_one_typed_frame(self):
+        iso_codes = {"France": "FRA", "Japan": "JPN"}
+        for i, iso_code in enumerate(iso_codes.values()):
+            for variable in ["tas", "pr"]:
+                for start in ["2020", "2060"]:
+                    self.server.set_body(iso_code, variable, start, climate_csv(variable, start, [i, i + 100]))
+        climate_data, failures = self.fetch(iso_codes, ["tas", "pr"], ["2020", "2060"])
+        self.assertEqual(failures, {})
+
+        self.assertEqual(list(climate_data.columns), expected_header.split(",") + ["Country"])
+        self.assertEqual(len(climate_data), 2 * 2 * 2 * 2)
+        for column in ["GCM", "var", "scenario", "Country"]:
+            self.assertIsInstance(climate_data[column].dtype, pd.CategoricalDtype)
+        self.assertEqual(climate_data["from_year"].dtype, np.int64)
+        self.assertEqual(climate_data["to_year"].dtype, np.int64)
+        self.assertTrue((climate_data.dtypes[expected_header.split(",")[5:]] == np.float64).all())
+
+        # Rows come in the order of the requests: variables, then periods, then countries
+        self.assertEqual(list(climate_data["var"]), ["tas"] * 8 + ["pr"] * 8)
+        self.assertEqual(list(climate_data["Country"]), ["France", "France", "Japan", "Japan"] * 4)
+        expected = pd.DataFrame({
+            "from_year": ([2020] * 4 + [2060] * 4) * 2,
+            "to_year": ([2039] * 4 + [2079] * 4) * 2,
+            "Jan": [0.0, 100.0, 1.0, 101.0] * 4,
+            "Dec": [1.1, 101.1, 2.1, 102.1] * 4,
+        })
+        pd.testing.assert_frame_equal(climate_data[list(expected.columns)], expected, check_exact=False)
+
+
+if __name__ == "__main__":
+    unittest.main()
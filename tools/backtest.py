@@ -0,0 +1,158 @@
+"""
+Contains the rolling-origin backtesting functions, used to evaluate the forecasting models over several
+forecast origins and horizons instead of a single validation window.
+
+Authored by: Josephine Monica (Github @josephinemonica)
+Co-authored by: Nicholas Sadjoli (Github @NickSadjoli)
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from data_processing import preprocess, split_train_val_indices
+from forecasting import region_day_positions, rollout_validation
+from pipeline_cache import PipelineCache, cached_preprocess, cached_split_train_val_indices
+from training import (ebm_model_factory, get_shared_dataset, process_pool, release_shared_datasets, seed,
+                      share_datasets)
+
+default_targets = ["ConfirmedCases", "Fatalities"]
+
+
+def _evaluate_fold(X, Y, train_ix, val_ix, targets, model_factory, random_state, n_jobs):
+    # Fits the models on the train rows and returns the validation rows, their horizon and squared log errors
+    X_train, Y_train = X.iloc[train_ix], Y.iloc[train_ix]
+    X_val, Y_val = X.iloc[val_ix], Y.iloc[val_ix]
+    models = {}
+    for target in targets:
+        models[target] = model_factory(random_state, n_jobs)
+        models[target].fit(X_train, Y_train[target])
+    Y_val_predicted = rollout_validation(models, X_val, targets)
+
+    # horizon = number of days since the forecast origin of each validation row
+    _, positions = region_day_positions(X_val)
+    horizon = np.zeros(X_val.shape[0], dtype=np.int64)
+    horizon[positions[positions >= 0]] = np.nonzero(positions >= 0)[1] + 1
+
+    # targets are already log1p-transformed, so squared errors are squared log errors
+    squared_errors = (Y_val_predicted - Y_val[targets].to_numpy()) ** 2
+    return X_val, horizon, squared_errors
+
+def peak_rss():
+    '''
+    Returns the peak resident set size of the current process so far, in bytes (NaN where the resource module
+    isn't available, e.g. on Windows). Unlike tracemalloc, it includes the memory allocated by native code.
+    '''
+    try:
+        import resource
+    except ImportError:
+        return np.nan
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+def _run_fold(key, fold, train_ix, val_ix, targets, model_factory, random_state, n_jobs):
+    '''
+    Trains and validates one fold on the (X, Y) dataset shared under key. Returns the squared log errors of every
+    validation row and the fold statistics, with the wall-clock time and the peak RSS of the process running it.
+    '''
+    X, Y = get_shared_dataset(key, "backtest")
+    rss_before = peak_rss()
+    start = time.perf_counter()
+    X_val, horizon, squared_errors = _evaluate_fold(X, Y, train_ix, val_ix, targets, model_factory, random_state,
+                                                    n_jobs)
+    elapsed = time.perf_counter() - start
+    rss_after = peak_rss()
+
+    errors = pd.DataFrame({"Fold": fold, "Region": X_val["Region"].to_numpy(), "Horizon": horizon})
+    for j, target in enumerate(targets):
+        errors[target] = squared_errors[:, j]
+
+    stats = {"Fold": fold, "Train rows": len(train_ix), "Validation rows": len(val_ix),
+             "Seconds": elapsed, "Peak RSS (MB)": rss_after / 2**20,
+             "Peak RSS increase (MB)": (rss_after - rss_before) / 2**20}
+    for j, target in enumerate(targets):
+        stats["RMSLE {}".format(target)] = np.sqrt(squared_errors[:, j].mean())
+    return errors, stats
+
+def run_backtest(X, Y, num_of_val_days=10, num_folds=5, fold_step=None, targets=default_targets, n_workers=None,
+                 random_state=seed, model_factory=ebm_model_factory, output_path=None, cache=None):
+    '''
+    Evaluates the models over num_folds rolling forecast origins. Every fold trains on the days of each region
+    before its origin, and recursively predicts the next num_of_val_days days. Folds run in a process pool,
+    all sharing the same preprocessed X and Y.
+
+    Arguments:
+    - X, Y => features and (log1p) targets, as returned by data_processing.preprocess
+    - num_of_val_days => (Optional) forecast horizon of each fold, in days
+    - num_folds => (Optional) number of forecast origins
+    - fold_step => (Optional) number of days between two origins. Default is num_of_val_days.
+    - targets => (Optional) list of targets to fit and evaluate
+    - n_workers => (Optional) number of worker processes. Default is one per fold, up to the number of CPUs.
+      With n_workers=1 the folds run one after another in the current process.
+    - random_state => (Optional) seed given to every model
+    - model_factory => (Optional) picklable function (random_state, n_jobs) -> unfitted model
+    - output_path => (Optional) path of a CSV file the per-region/per-horizon RMSLE table is written to
+    - cache => (Optional) PipelineCache the folds are memoized in (see pipeline_cache)
+
+    Returns:
+    - rmsle_table => DataFrame of the RMSLE of each target per (Region, Horizon), over all folds
+    - fold_stats => DataFrame with the size, wall-clock time, peak memory and RMSLE of each fold. The peak RSS
+      is the high-water mark of the process that ran the fold, so it includes the previous folds run by the
+      same worker; the increase is how much the fold raised it.
+    '''
+    if cache is not None:
+        folds = cached_split_train_val_indices(X["Region"], num_of_val_days, num_folds=num_folds, fold_step=fold_step,
+                                               cache=cache)
+    else:
+        folds = split_train_val_indices(X["Region"], num_of_val_days, num_folds=num_folds, fold_step=fold_step)
+    num_cpus = os.cpu_count() or 1
+    if n_workers is None:
+        n_workers = min(num_folds, num_cpus)
+    n_workers = max(1, min(n_workers, num_folds))
+    n_jobs = max(1, num_cpus // n_workers)
+
+    datasets = {"backtest": (X, Y)}
+    key = share_datasets(datasets)
+    try:
+        if n_workers == 1:
+            results = [_run_fold(key, fold, train_ix, val_ix, targets, model_factory, random_state, n_jobs)
+                       for fold, (train_ix, val_ix) in enumerate(folds)]
+        else:
+            with process_pool(n_workers, key, datasets) as executor:
+                futures = [executor.submit(_run_fold, key, fold, train_ix, val_ix, targets, model_factory, random_state,
+                                           n_jobs)
+                           for fold, (train_ix, val_ix) in enumerate(folds)]
+                results = [future.result() for future in futures]
+    finally:
+        release_shared_datasets(key)
+
+    errors = pd.concat([fold_errors for fold_errors, _ in results], ignore_index=True)
+    rmsle_table = np.sqrt(errors.groupby(["Region", "Horizon"])[targets].mean()).reset_index()
+    fold_stats = pd.DataFrame([stats for _, stats in results])
+
+    if output_path is not None:
+        rmsle_table.to_csv(output_path, index=False)
+    return rmsle_table, fold_stats
+
+def backtest_file(filename, features, targets=default_targets, cache=None, **kwargs):
+    '''
+    Preprocesses the given data file once, then runs run_backtest on it. Extra keyword arguments are passed
+    to run_backtest. If a PipelineCache is given, the preprocessed data and the folds are read from it when
+    the file and the parameters haven't changed since a previous run.
+    '''
+    if cache is not None:
+        X, Y = cached_preprocess(filename, features, targets, cache=cache)
+    else:
+        X, Y = preprocess(filename, features, targets)
+    return run_backtest(X, Y, targets=targets, cache=cache, **kwargs)
+
+
+if __name__ == "__main__":
+    features = ['Region', "prev_ConfirmedCases", "prev_Fatalities", 'Days']
+    rmsle_table, fold_stats = backtest_file("../input/train.csv", features, output_path="./backtest_rmsle.csv",
+                                            cache=PipelineCache())
+    print(fold_stats)
+    print(rmsle_table.groupby("Horizon")[default_targets].mean())
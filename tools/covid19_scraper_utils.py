@@ -8,18 +8,185 @@ Authored by: Nicholas Sadjoli (Github @NickSadjoli)
 Co-authored by: Josephine Monica (Github @josephinemonica)
 """
 
-from selenium import webdriver
+import numpy as np
 import pandas as pd
 from bs4 import BeautifulSoup
+from bs4.element import Tag
 import sys
 import re
 
+from data_store import parse_number_strings
+from page_fetching import SeleniumPagePool
+
+try:
+    import lxml.html as lxml_html
+except ImportError:
+    lxml_html = None
+
 worldometer_path = ("https://www.worldometers.info/coronavirus/")
 
+_chart_start_re = re.compile(r"Highcharts\.chart\(\s*['\"]([^'\"]*)['\"]")
+_categories_re = re.compile(r"categories\s*:\s*\[([^\]]*)\]")
+_series_re = re.compile(r"series\s*:\s*\[")
+_series_values_re = re.compile(r"name\s*:\s*'((?:[^'\\]|\\.)*)'.*?data\s*:\s*\[([^\]]*)\]", re.S)
+
+
+def parse_series_values(values_str):
+    '''
+    Converts the content of a Highcharts data array (e.g. '1,5,null,7.5') to a float NumPy array, with NaN
+    for null values
+    '''
+    values = values_str.replace("null", "nan").replace('"', "").replace("'", "").split(",")
+    if len(values) == 1 and values[0].strip() == "":
+        return np.empty(0)
+    try:
+        return np.array(values, dtype=np.float64)
+    except ValueError:
+        return pd.to_numeric(pd.Series(values).str.strip(), errors="coerce").to_numpy(dtype=np.float64)
+
+def extract_highcharts(js_text, domId_map=None):
+    '''
+    Finds all the Highcharts.chart(...) calls of a script in one linear scan. Every chart spans from its
+    Highcharts.chart call up to the next one, and its categories and series are searched in that span only.
+
+    Arguments:
+    - js_text => text of the script
+    - domId_map => (Optional) dictionary to rename the charts' domIds with
+
+    Returns:
+    - dictionary of {domId: {'categories': list of strings, 'series': {series name: float NumPy array}}},
+      in the order of the charts in the script
+    '''
+    starts = list(_chart_start_re.finditer(js_text))
+    charts = {}
+    for i, match in enumerate(starts):
+        begin = match.end()
+        end = starts[i + 1].start() if i + 1 < len(starts) else len(js_text)
+
+        categories = []
+        categories_match = _categories_re.search(js_text, begin, end)
+        if categories_match is not None:
+            categories = [category.strip().strip("'\"") for category in categories_match.group(1).split(",")]
+
+        series = {}
+        series_match = _series_re.search(js_text, begin, end)
+        if series_match is not None:
+            for values_match in _series_values_re.finditer(js_text, series_match.end(), end):
+                series[values_match.group(1)] = parse_series_values(values_match.group(2))
+
+        domId = match.group(1)
+        if domId_map is not None:
+            domId = domId_map[domId]
+        charts[domId] = {'categories': categories, 'series': series}
+    return charts
+
+
+def read_html_tables(html, use_lxml=None):
+    '''
+    Returns the table elements of an HTML page source. Tables are parsed with lxml when it is installed (much
+    faster than BeautifulSoup for big tables), and with BeautifulSoup otherwise.
+
+    Arguments:
+    - html => page source
+    - use_lxml => (Optional) True/False to force/prevent the use of lxml. Default is to use it if installed.
+    '''
+    if use_lxml is None:
+        use_lxml = lxml_html is not None
+    if use_lxml:
+        return lxml_html.fromstring(html).findall(".//table")
+    return BeautifulSoup(html, "html.parser").find_all('table')
+
+def _iter_table_rows(table, href_column=None):
+    # Yields the header texts, the cell texts and the href of the href_column cell (or None) of every row, for
+    # both BeautifulSoup and lxml table elements
+    if isinstance(table, Tag):
+        for row in table.find_all('tr'):
+            cells = row.find_all('td')
+            href = None
+            if href_column is not None and href_column < len(cells):
+                link = cells[href_column].find('a', href=True)
+                if link is not None:
+                    href = link['href']
+            yield [head.text for head in row.find_all('th')], [cell.text for cell in cells], href
+    else:
+        for row in table.iter('tr'):
+            cells = list(row.iter('td'))
+            href = None
+            if href_column is not None and href_column < len(cells):
+                links = cells[href_column].xpath(".//a[@href]")
+                if len(links) > 0:
+                    href = links[0].get('href')
+            yield [head.text_content() for head in row.iter('th')], [cell.text_content() for cell in cells], href
+
+def extract_table(table, href_column=None, href_prefix="", numbers=True, replace_nbsp=False):
+    '''
+    Extracts the content of an HTML table in one pass, collecting the cells into column lists before building
+    the DataFrame once. The first row holds the column names, rows without any <td> cell are skipped.
+
+    Arguments:
+    - table => BeautifulSoup or lxml table element (see read_html_tables)
+    - href_column => (Optional) position of the column whose cells may link to a dedicated page
+    - href_prefix => (Optional) prefix added to the hrefs found in href_column (e.g. the site's root path)
+    - numbers => (Optional) If True, columns where every value is a Worldometer-style number string
+      ('1,234', '+56', '0.39 %', 'N/A', ...) are converted to float columns
+    - replace_nbsp => (Optional) If True, non-breaking spaces in the cells are replaced by normal spaces
+
+    Returns:
+    - table_data => the table's DataFrame
+    - column_names => list of the column names
+    - hrefs => dictionary of {cell text of href_column: href_prefix + href} for the rows that have a link
+    '''
+    rows = _iter_table_rows(table, href_column=href_column)
+    header, _, _ = next(rows, ([], [], None))
+    column_names = [head.replace('\xa0', ' ') for head in header] #&nbsp gets turned into \xa0 by the parsers
+    num_of_columns = len(column_names)
+    columns = [[] for _ in range(num_of_columns)]
+    hrefs = {}
+
+    for _, cell_texts, href in rows:
+        if len(cell_texts) == 0:
+            continue
+        row_values = [text.replace('\n', ' ').replace('+', '') for text in cell_texts]
+        if replace_nbsp:
+            row_values = [value.replace('\xa0', ' ') for value in row_values]
+        #check whether the row links to a more dedicated page
+        if href is not None:
+            hrefs[row_values[href_column]] = href_prefix + href
+        if len(row_values) < num_of_columns:
+            row_values += [None] * (num_of_columns - len(row_values))
+        for column, value in zip(columns, row_values):
+            column.append(value)
+
+    # built from positions, as column names of scraped tables are not always unique
+    table_data = pd.DataFrame({j: pd.Series(column, dtype=object) for j, column in enumerate(columns)},
+                              columns=range(num_of_columns))
+    if numbers:
+        for j in range(num_of_columns):
+            parsed = parse_number_strings(table_data[j])
+            if parsed is not None:
+                table_data[j] = parsed
+    table_data.columns = column_names
+    return table_data, column_names, hrefs
+
+
 class BasicScraper():
-    def __init__(self, driver=None, verbose=False, default_site="https://www.worldometers.info/coronavirus/"):
-        
-        self.driver = self.check_webdriver(driver=driver, default_site=default_site, verbose=verbose)
+    def __init__(self, driver=None, verbose=False, default_site="https://www.worldometers.info/coronavirus/", page_fetcher=None):
+        '''
+        Page sources are read through page_fetcher (any PageFetcher, e.g. an HttpPageFetcher or a ReplayPageFetcher).
+        If no page_fetcher is given, a Selenium driver is used (the given driver, or a new Chrome driver).
+        '''
+        if page_fetcher is not None:
+            self.driver = driver
+            self.page_fetcher = page_fetcher
+        else:
+            self.driver = self.check_webdriver(driver=driver, default_site=default_site, verbose=verbose)
+            self.page_fetcher = SeleniumPagePool(drivers=[self.driver])
+
+    def get_page_source(self, url):
+        return self.page_fetcher.get(url)
+
+    def get_page_soup(self, url):
+        return BeautifulSoup(self.get_page_source(url), "html.parser")
 
     def check_webdriver(self, driver, default_site, verbose=False):
         if driver is not None:
@@ -29,31 +196,22 @@ class BasicScraper():
         else:
             if verbose:
                 print("no drivers initated yet. Intiating...")
+            from selenium import webdriver #only needed when no page fetcher is given
             cur_driver = webdriver.Chrome()
             cur_driver.get(default_site)
             return cur_driver
 
     #### Functions for Scraping the Table from Main Coronavirus Page ###
-    def parse_table(self, table_element):
+    def parse_table(self, table_element, numbers=False):
         '''
         Given a table element (assumed already obtained from a page_soup), pare content of table and return it as a 
-        Pandas Dataframe object. Also returns the name of the table columns and rows
+        Pandas Dataframe object. Also returns the name of the table columns and rows.
+        If numbers is True, number columns are converted to floats (see extract_table).
         '''
-        rows = table_element.find_all('tr')
-        header_row = rows[0].find_all('th')
-        column_names = [head.text.replace('\xa0', ' ') for head in header_row] #&nbsp gets turned into \xa0 by BeautifulSoup
-        num_of_columns = len(column_names)
-        table_data = pd.DataFrame(index=range(0, len(rows[1:])), columns=column_names)
-
-        #HTML seems to use the 1-indexing system instead of the normal 0-indexing system
-        for i in range(1, len(rows)):
-            row_elements = rows[i].find_all('td')
-            row_values = [row_el.text.replace('\n', ' ').replace('+', '') for row_el in row_elements]
-            table_data.loc[i-1] = row_values
-
-        return table_data, column_names, num_of_columns
+        table_data, column_names, _ = extract_table(table_element, numbers=numbers)
+        return table_data, column_names, len(column_names)
 
-    def parse_worldometertable_w_hrefs(self, table_element, href_element_pos, cur_path):
+    def parse_worldometertable_w_hrefs(self, table_element, href_element_pos, cur_path, numbers=False):
         '''
         Special variation of the normal parse_table that also returns any country elements (specifically countries) any countries in 
         a Worldometer table with potential href elements to a more dedicated page on the Worldometer site. Note that the href_element_pos 
@@ -62,91 +220,17 @@ class BasicScraper():
 
         A more generic version of the parse_global_worldometer_table function. 
         '''
-        rows = table_element.find_all('tr')
-        header_row = rows[0].find_all('th')
-        column_names = [head.text.replace('\xa0', ' ') for head in header_row] #&nbsp gets turned into \xa0 by BeautifulSoup
-        num_of_columns = len(column_names)
-        table_data = pd.DataFrame(index=range(0, len(rows[1:])), columns=column_names)
-
-        countries_w_href = {}
-
-        #HTML seems to use the 1-indexing system instead of the normal 0-indexing system
-        for i in range(1, len(rows)):
-            row_elements = rows[i].find_all('td')
-            row_values = [row_el.text.replace('\n', ' ').replace('+', '') for row_el in row_elements]
-
-            #check whether worldometer has extra page for this country
-            href_check = row_elements[href_element_pos].find_all('a', href=True)
-            if len(href_check) > 0:
-                countries_w_href[row_elements[href_element_pos].text] = cur_path + href_check[0]['href']
-
-            table_data.loc[i-1] = row_values
-
-        return table_data, column_names, num_of_columns, countries_w_href
+        table_data, column_names, countries_w_href = extract_table(table_element, href_column=href_element_pos,
+                                                                   href_prefix=cur_path, numbers=numbers)
+        return table_data, column_names, len(column_names), countries_w_href
 
 
     def find_all_highcharts(self, js_text, domId_map=None, verbose=False):
         '''
-        Function that parses a given js_text string for all possible strings
-        containing a Highchart.js section. Returns dictionary containing
-        all parsed Highchart sections
-        '''
-
-        listed_charts = {}
-
-        def find_highchart_recur(js_text, listed_charts, domId_map, verbose=False):
-            
-            #if verbose: #Only uncomment for debug purposes!
-            #    print(js_text.count("Highcharts.chart("))
-            
-            if js_text.count("Highcharts.chart(") <= 1:
-                cur_domId = js_text.split("Highcharts.chart(" )[1].split("'")[1]
-                previous_data, cur_chartData = js_text.split("Highcharts.chart('" + cur_domId + "',")
-                if domId_map is not None:
-                    listed_charts[domId_map[cur_domId]] = cur_chartData
-                else:
-                    listed_charts[cur_domId] = cur_chartData
-                #listed_charts[cur_domId] = cur_chartData
-                return previous_data, listed_charts
-            else:
-                cur_domId = js_text.split("Highcharts.chart(")[1].split("'")[1]
-                subsequent_strings = js_text.split("Highcharts.chart('" + cur_domId + "',")[1]
-                cur_chartData, listed_charts = find_highchart_recur(subsequent_strings, listed_charts, domId_map)
-                if domId_map is not None:
-                    listed_charts[domId_map[cur_domId]] = cur_chartData
-                else:
-                    listed_charts[cur_domId] = cur_chartData
-                return cur_chartData, listed_charts
-
-        _, listed_charts = find_highchart_recur(js_text, listed_charts, domId_map=domId_map, verbose=verbose)
-        return listed_charts
-
-    def find_all_chart_series_values(self, series_data, verbose=False):
-        '''
-        Given a Highchart's series data, function parses all values and returns a
-        dictionary containing all the data's 'name' (i.e type of data), and their
-        data values
+        Function that parses a given js_text string for all Highchart.js charts. Returns dictionary containing
+        the categories and series values of all parsed charts (see extract_highcharts)
         '''
-
-        values_dict = {}
-        def find_values_recur(series_data, values_dict, verbose=False):
-            
-            #if verbose: #Only uncomment for debug purposes!
-            #    print(series_data.count("name: '"))
-
-            val_name = series_data.split("name: '")[1].split("',")[0]
-            values_str = series_data.split("data: [")[1].split("]")[0]#.replace('\"', '')
-            values = values_str.split(',')
-            values_dict[val_name] = values
-
-            if series_data.count("name: '") <= 1:
-                return values_dict
-            else:
-                next_vals = series_data.split("data: [" + values_str + "]")[1]#.split("]")[1]
-                values_dict = find_values_recur(next_vals, values_dict=values_dict)
-                return values_dict
-
-        return find_values_recur(series_data, values_dict, verbose)
+        return extract_highcharts(js_text, domId_map=domId_map)
 
 
 class WorldometerScraper(BasicScraper):
@@ -155,32 +239,12 @@ class WorldometerScraper(BasicScraper):
         super().__init__(*args, **kwargs)
     
     #### Functions for Scraping the Table from Main Coronavirus Page ###
-    def parse_global_worldometer_table(self, table_element):
+    def parse_global_worldometer_table(self, table_element, numbers=True):
         '''
         Special variation of the normal parse_table that also returns any countries with potential hrefs to a more 
-        dedicated country page on the Worldometer site.
+        dedicated country page on the Worldometer site. Number columns are converted to floats unless numbers is False.
         '''
-        rows = table_element.find_all('tr')
-        header_row = rows[0].find_all('th')
-        column_names = [head.text.replace('\xa0', ' ') for head in header_row] #&nbsp gets turned into \xa0 by BeautifulSoup
-        num_of_columns = len(column_names)
-        table_data = pd.DataFrame(index=range(0, len(rows[1:])), columns=column_names)
-
-        countries_w_href = {}
-
-        #HTML seems to use the 1-indexing system instead of the normal 0-indexing system
-        for i in range(1, len(rows)):
-            row_elements = rows[i].find_all('td')
-            row_values = [row_el.text.replace('\n', ' ').replace('+', '') for row_el in row_elements]
-
-            #check whether worldometer has extra page for this country
-            href_check = row_elements[0].find_all('a', href=True)
-            if len(href_check) > 0:
-                countries_w_href[row_elements[0].text] = worldometer_path + href_check[0]['href']
-
-            table_data.loc[i-1] = row_values
-
-        return table_data, column_names, num_of_columns, countries_w_href
+        return self.parse_worldometertable_w_hrefs(table_element, 0, worldometer_path, numbers=numbers)
 
     def parse_country_table(self, country, table_element, cur_dict=None):
         '''
@@ -190,21 +254,142 @@ class WorldometerScraper(BasicScraper):
         if cur_dict is None:
             cur_dict = {}
 
-        rows = table_element.find_all('tr')
-        header_row = rows[0].find_all('th')
-        column_names = [head.text.replace('\xa0', ' ') for head in header_row] #&nbsp gets turned into \xa0 by BeautifulSoup
+        table_data, column_names, _ = extract_table(table_element, numbers=False, replace_nbsp=True)
         column_names[0] = 'Region'
         column_names.insert(0, 'Country')
         column_names.pop() #remove the 'Source' column
         cur_dict[country] = {}
         cur_dict[country]['columns'] = column_names
-        cur_dict[country]['regions'] = []
-
-        #HTML seems to use the 1-indexing system instead of the normal 0-indexing system
-        for i in range(1, len(rows)):
-            row_elements = rows[i].find_all('td')
-            row_values = [row_el.text.replace('\n', ' ').replace('+', '').replace('\xa0', ' ') for row_el in row_elements]
-            #cur_dict[country]['regions] = row_values
-            cur_dict[country]['regions'].append(row_values[:-1])
+        cur_dict[country]['regions'] = table_data.iloc[:, :-1].values.tolist()
 
         return cur_dict
+
+
+#### Reference recursive chart parsing (the previous implementation), used by benchmark_highcharts ###
+def _find_all_highcharts_recursive(js_text, domId_map=None, verbose=False):
+    '''
+    Function that parses a given js_text string for all possible strings
+    containing a Highchart.js section. Returns dictionary containing
+    all parsed Highchart sections
+    '''
+
+    listed_charts = {}
+
+    def find_highchart_recur(js_text, listed_charts, domId_map, verbose=False):
+        
+        #if verbose: #Only uncomment for debug purposes!
+        #    print(js_text.count("Highcharts.chart("))
+        
+        if js_text.count("Highcharts.chart(") <= 1:
+            cur_domId = js_text.split("Highcharts.chart(" )[1].split("'")[1]
+            previous_data, cur_chartData = js_text.split("Highcharts.chart('" + cur_domId + "',")
+            if domId_map is not None:
+                listed_charts[domId_map[cur_domId]] = cur_chartData
+            else:
+                listed_charts[cur_domId] = cur_chartData
+            #listed_charts[cur_domId] = cur_chartData
+            return previous_data, listed_charts
+        else:
+            cur_domId = js_text.split("Highcharts.chart(")[1].split("'")[1]
+            subsequent_strings = js_text.split("Highcharts.chart('" + cur_domId + "',")[1]
+            cur_chartData, listed_charts = find_highchart_recur(subsequent_strings, listed_charts, domId_map)
+            if domId_map is not None:
+                listed_charts[domId_map[cur_domId]] = cur_chartData
+            else:
+                listed_charts[cur_domId] = cur_chartData
+            return cur_chartData, listed_charts
+
+    _, listed_charts = find_highchart_recur(js_text, listed_charts, domId_map=domId_map, verbose=verbose)
+    return listed_charts
+
+def _find_all_chart_series_values_recursive(series_data, verbose=False):
+    '''
+    Given a Highchart's series data, function parses all values and returns a
+    dictionary containing all the data's 'name' (i.e type of data), and their
+    data values
+    '''
+
+    values_dict = {}
+    def find_values_recur(series_data, values_dict, verbose=False):
+        
+        #if verbose: #Only uncomment for debug purposes!
+        #    print(series_data.count("name: '"))
+
+        val_name = series_data.split("name: '")[1].split("',")[0]
+        values_str = series_data.split("data: [")[1].split("]")[0]#.replace('\"', '')
+        values = values_str.split(',')
+        values_dict[val_name] = values
+
+        if series_data.count("name: '") <= 1:
+            return values_dict
+        else:
+            next_vals = series_data.split("data: [" + values_str + "]")[1]#.split("]")[1]
+            values_dict = find_values_recur(next_vals, values_dict=values_dict)
+            return values_dict
+
+    return find_values_recur(series_data, values_dict, verbose)
+
+
+def make_synthetic_charts_script(num_charts=200, num_days=120, num_series=2, seed=0):
+    '''
+    Builds a script with num_charts Worldometer-like Highcharts.chart calls, used to benchmark chart parsing
+    '''
+    rng = np.random.RandomState(seed)
+    categories = ",".join('"Day {}"'.format(day) for day in range(num_days))
+    charts = []
+    for i in range(num_charts):
+        series = ",".join("{{ name: 'Series {}', color: '#33CCFF', data: [{}] }}".format(
+            j, ",".join(str(value) for value in rng.randint(0, 10**6, num_days))) for j in range(num_series))
+        charts.append("Highcharts.chart('chart-{}', {{ chart: {{ type: 'line' }}, xAxis: {{ categories: [{}] }}, "
+                      "series: [{}], responsive: {{}} }});".format(i, categories, series))
+    return "\n".join(charts)
+
+def benchmark_highcharts(pages_dir=None, num_charts_list=(10, 100, 400, 1600), repeat=3):
+    '''
+    Times extract_highcharts against the previous recursive parsing, on the chart scripts of the saved pages
+    of pages_dir (e.g. recorded with page_fetching.RecordingPageFetcher) if given, or on synthetic scripts of
+    increasing size otherwise. The recursive parsing fails (RecursionError) on scripts with many charts.
+    '''
+    import os
+    import time
+
+    if pages_dir is not None:
+        scripts = {}
+        for file_name in sorted(os.listdir(pages_dir)):
+            with open(os.path.join(pages_dir, file_name), encoding="utf-8") as f:
+                soup = BeautifulSoup(f.read(), "html.parser")
+            charts = [script.text for script in soup.find_all('script', string=re.compile("Highcharts.chart"))]
+            scripts[file_name] = "\n".join(charts)
+    else:
+        scripts = {"{} charts".format(num_charts): make_synthetic_charts_script(num_charts)
+                   for num_charts in num_charts_list}
+
+    def best_time(function):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function()
+            times.append(time.perf_counter() - start)
+        return min(times)
+
+    def recursive_parse(js_text):
+        charts = _find_all_highcharts_recursive(js_text)
+        return {domId: _find_all_chart_series_values_recursive(charts[domId].split("series: [{")[1])
+                for domId in charts}
+
+    results = []
+    for name, js_text in scripts.items():
+        if "Highcharts.chart(" not in js_text:
+            continue
+        linear_time = best_time(lambda: extract_highcharts(js_text))
+        try:
+            recursive_time = best_time(lambda: recursive_parse(js_text))
+        except RecursionError:
+            recursive_time = float("nan")
+        results.append({"Script": name, "Size (kB)": len(js_text) / 1000, "Linear (ms)": 1000 * linear_time,
+                        "Recursive (ms)": 1000 * recursive_time})
+    return pd.DataFrame(results)
+
+
+if __name__ == "__main__":
+    print(benchmark_highcharts(pages_dir=sys.argv[1] if len(sys.argv) > 1 else None))
@@ -7,110 +7,151 @@ Co-authored by: Nicholas Sadjoli (Github @NickSadjoli)
 import pandas as pd
 import numpy as np
 
+from data_store import load_csv
 
-def append_population_data(population, path_file_toappend):
+
+def append_population_data(population, path_file_toappend, output_path="data/appended_data.csv"):
     '''
     Adds data from a population instance to a target data file, and saves it
-    to appended_data.csv file
+    to an output CSV file
 
     Arguments:
     - population => A Population class instance
     - path_file_toappend => Path of CSV data file to append
+    - output_path => (Optional) Path of the CSV file the appended DataFrame is saved to.
+      Default is "data/appended_data.csv". If None, nothing is saved.
 
     Returns:
-    - a list of countries missing in the target path file
-    [Also saves appended dataFrame to an "appended_data.csv" file]
+    - a list of countries missing in the target path file, in order of first appearance
+    [Also saves appended dataFrame to the output_path file]
     '''
-    df = pd.read_csv(path_file_toappend)
+    df = load_csv(path_file_toappend)
 
-    missing_country_list = []
     missing_value_median_age = -1
     missing_value_population = 100000
     missing_value_population_density = 1
-    median_age_list = []
-    population_list = []
-    population_density_list = []
-    for country in df["Country_Region"]:
-        
-        ##############
-        # Median age
-        ##############
-        median_age_ = population.get_median_age(country)
-        if(median_age_ is None):
-
-            median_age_list.append(missing_value_median_age)
-
-            # Report/ note that this country is not available
-            if(country not in missing_country_list):
-                missing_country_list.append(country)
-        else:
-            median_age_list.append(median_age_)
-        
-        ###############
-        # Population
-        ###############
-        population_ = population.get_population(country)
-        if(population_ is None):
-            population_list.append(missing_value_population)
-        else:
-            population_list.append(population_)
-        
-        #####################
-        # Population density
-        #####################
-        population_density_ = population.get_population_density(country)
-        if(population_density_ is None):
-            population_density_list.append(missing_value_population_density)
-        else:
-            population_density_list.append(population_density_)
-    
-    df["Median_Age"] = median_age_list
-    df["Population"] = population_list
-    df["Population_Density"] = population_density_list
-    df.to_csv("data/appended_data.csv")
+
+    # Look up every unique country once, then broadcast the results back to the rows
+    country_codes, unique_countries = pd.factorize(df["Country_Region"])
+    population_, population_density_, median_age_ = population.lookup_many(unique_countries)
+
+    # Report/ note the countries that are not available (i.e. have no median age)
+    missing_country_list = list(unique_countries[np.isnan(median_age_)])
+
+    for column, values, missing_value in [("Median_Age", median_age_, missing_value_median_age),
+                                          ("Population", population_, missing_value_population),
+                                          ("Population_Density", population_density_, missing_value_population_density)]:
+        values = np.where(np.isnan(values), missing_value, values).astype(np.int64)
+        # Rows without a country (code -1) point to an extra slot holding the missing value
+        values = np.append(values, missing_value)
+        df[column] = values[np.where(country_codes < 0, len(unique_countries), country_codes)]
+
+    if output_path is not None:
+        df.to_csv(output_path)
     
     return missing_country_list
 
-def preprocess(filename, features, targets):
+def make_region_names(df):
     '''
-    Preprocess data to specify the features to be chosen and imputed, as well as the targeted fields to predict.
+    Returns the "<Country_Region>_<Province_State>" region name of every row of df, as a NumPy object array.
+    Only the unique (country, province) pairs are formatted, every row then just takes its pair's name.
+    '''
+    country_codes, countries = pd.factorize(df["Country_Region"])
+    province_codes, provinces = pd.factorize(df["Province_State"])
+    countries = np.append(np.asarray(countries, dtype=object), np.nan)  # missing values are coded as -1
+    provinces = np.append(np.asarray(provinces, dtype=object), np.nan)
+    pair_codes, pair_uniques = pd.factorize(country_codes.astype(np.int64) * len(provinces) + province_codes % len(provinces))
+    pair_names = []
+    for pair in pair_uniques:
+        country_ix, province_ix = divmod(int(pair), len(provinces))
+        pair_names.append("{}_{}".format(countries[country_ix], provinces[province_ix]))
+    return np.array(pair_names, dtype=object)[pair_codes]
+
+def add_region_features(df, targets):
+    '''
+    Adds the "Region", "Days" and "prev_<target>" columns to a training-style DataFrame in one pass.
+
+    Rows are grouped by region with a stable sort, so every region keeps the row order it has in the
+    original file (which is what the previous per-region loop and groupby().shift() relied on).
 
     Arguments:
-    - filename => Pathfile to data to be pre-processed and used
-    - features => a list of features to be chosen and used from the dataset
-    - targets => a list of fields to be chosen and predicted from dataset
+    - df => DataFrame containing at least Country_Region, Province_State, Date and the target columns
+    - targets => a list of fields for which a "prev_<target>" (previous day value) column is created
 
     Returns:
-    - X => the X-component of training data containing the chosen list of features
-    - Y => the Y-component of training data containing the chosen list of targets
+    - df => the same DataFrame, with the Region, Days and prev_<target> columns added
     '''
-    df = pd.read_csv(filename)
+    num_rows = df.shape[0]
 
     # Create category called Region: country_province
-    region_list = ["{}_{}".format(df["Country_Region"][i], df["Province_State"][i]) for i in range(df.shape[0])]
-    df["Region"]=region_list
-
-    # Get first day of corona virus for each region
-    unique_region_list = list(set(region_list))
-    unique_region_list.sort()
-    first_date_dict = {}
-    for region in unique_region_list:
-        mask = df["Region"]==region
-        first_ix = np.where(df[mask]["ConfirmedCases"]>0)[0][0] -1    
-        first_date = df[mask]["Date"].iloc[first_ix]
-        first_date_dict[region] = first_date
+    df["Region"] = make_region_names(df)
+
+    # Regions can be made of several (country, province) pairs with the same name (e.g. "nan" provinces)
+    region_codes, region_names = pd.factorize(df["Region"])
+    order = np.argsort(region_codes, kind="mergesort")
+    sorted_codes = region_codes[order]
+    starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+    ends = np.r_[starts[1:], num_rows]
+
+    # Get first day of corona virus for each region: the day before the first positive ConfirmedCases.
+    # NOTE: a region that already has cases on its first row wraps around to its last row, exactly as
+    # the previous iloc[first_ix - 1] lookup did.
+    positions = np.arange(num_rows)
+    positive = np.asarray(df["ConfirmedCases"])[order] > 0
+    first_positive = np.minimum.reduceat(np.where(positive, positions, num_rows), starts)
+    if np.any(first_positive >= ends):
+        missing = region_names[sorted_codes[starts[first_positive >= ends]]]
+        raise ValueError("Regions without any positive ConfirmedCases: {}".format(list(missing)))
+    first_ix = np.where(first_positive == starts, ends, first_positive) - 1
 
     # add column "Days": number of days since the first day of case per each region
-    def get_days(dt):
-        return dt.days
-    dummy = [first_date_dict[region] for region in df["Region"]]
-    df["Days"]=(pd.to_datetime(df['Date'])-pd.to_datetime(dummy)).apply(get_days)
+    dates_sorted = pd.to_datetime(df["Date"]).values[order]
+    region_lengths = ends - starts
+    first_dates = np.repeat(dates_sorted[first_ix], region_lengths)
+    days_sorted = (dates_sorted - first_dates) // np.timedelta64(1, "D")
 
     # Add previous confirmed cases and previous fatalities to df
-    loc_group=["Region"]
+    new_columns = {"Days": days_sorted.astype(np.int64)}
     for target in targets:
-        df["prev_{}".format(target)] = df.groupby(loc_group)[target].shift()
-        df["prev_{}".format(target)].fillna(0, inplace=True)
+        values_sorted = np.asarray(df[target], dtype=np.float64)[order]
+        prev_sorted = np.empty(num_rows, dtype=np.float64)
+        prev_sorted[1:] = values_sorted[:-1]
+        prev_sorted[starts] = 0
+        new_columns["prev_{}".format(target)] = np.nan_to_num(prev_sorted, nan=0.0)
+
+    for column, values_sorted in new_columns.items():
+        values = np.empty_like(values_sorted)
+        values[order] = values_sorted
+        df[column] = values
+
+    return df
+
+def preprocess(data, features, targets, feature_spec=None):
+    '''
+    Preprocess data to specify the features to be chosen and imputed, as well as the targeted fields to predict.
+
+    Arguments:
+    - data => Pathfile to data to be pre-processed and used, or the DataFrame itself (which is left unchanged)
+    - features => a list of features to be chosen and used from the dataset
+    - targets => a list of fields to be chosen and predicted from dataset
+    - feature_spec => (Optional) lag and rolling-window features to add to the dataset, which can then be chosen
+      in features (see feature_generation.default_feature_spec). Count features are log1p-ed like the targets.
+
+    Returns:
+    - X => the X-component of training data containing the chosen list of features
+    - Y => the Y-component of training data containing the chosen list of targets
+    '''
+    df = load_csv(data) if isinstance(data, str) else data.copy()
+
+    # Region, Days and prev_<target> columns
+    df = add_region_features(df, targets)
+
+    count_features = []
+    if feature_spec is not None:
+        from feature_generation import FeatureGenerator, count_feature_names
+        generated = FeatureGenerator(feature_spec).generate(df)
+        df = pd.concat([df, generated], axis=1)
+        count_features = count_feature_names(feature_spec)
     
     # TODO
     df = df[df["Days"]>=-1].copy(deep=True)
@@ -119,10 +160,107 @@ def preprocess(filename, features, targets):
     for target in targets:
         df[target] = np.log1p(df[target])
         df["prev_{}".format(target)] = np.log1p(df["prev_{}".format(target)])
+    for feature in count_features:
+        df[feature] = np.log1p(df[feature])
     
     # ConfirmCases, Fatilies
     X = df[features]
     # TODO use log1p
     Y = df[targets]
     
-    return X,Y
\ No newline at end of file
+    return X,Y
+
+def split_train_val_indices(regions, num_of_val_days, num_folds=1, fold_step=None, unique_region_list=None):
+    '''
+    Computes the row positions of a last-N-days-per-region train/validation split, for one or several
+    rolling forecast origins at once. Rows are expected to be in chronological order within each region.
+
+    Arguments:
+    - regions => array/Series with the region of each row (e.g. X["Region"])
+    - num_of_val_days => number of days per region used for validation
+    - num_folds => (Optional) number of rolling-origin folds. Fold 0 validates on the last num_of_val_days
+      days of each region, fold k moves the validation window fold_step days further back in time.
+    - fold_step => (Optional) number of days between the origins of two folds. Default is num_of_val_days.
+    - unique_region_list => (Optional) regions to use, and their order in the output. Default is all
+      regions, sorted.
+
+    Returns:
+    - list of num_folds (train_ix, val_ix) tuples of NumPy int arrays, to be used with iloc.
+      Train rows of a fold are all the rows of each region before its validation window.
+    '''
+    if fold_step is None:
+        fold_step = num_of_val_days
+    region_codes, unique_regions = pd.factorize(np.asarray(regions))
+    if unique_region_list is None:
+        unique_region_list = np.sort(np.asarray(unique_regions, dtype=str))
+    region_rank = pd.Index(unique_region_list).get_indexer(unique_regions)[region_codes]
+
+    # Group rows by region (in unique_region_list order) with a stable sort, then count days back from
+    # the last row of each region
+    order = np.argsort(region_rank, kind="mergesort")
+    order = order[region_rank[order] >= 0]
+    sorted_rank = region_rank[order]
+    is_last = np.r_[sorted_rank[1:] != sorted_rank[:-1], True]
+    group_end = np.flatnonzero(is_last)
+    days_from_end = np.repeat(group_end, np.diff(np.r_[-1, group_end])) - np.arange(len(order))
+
+    folds = []
+    for k in range(num_folds):
+        origin = k * fold_step
+        val_mask = (days_from_end >= origin) & (days_from_end < origin + num_of_val_days)
+        train_mask = days_from_end >= origin + num_of_val_days
+        folds.append((order[train_mask], order[val_mask]))
+    return folds
+
+def split_train_val(X, Y, num_of_val_days, unique_region_list=None):
+    '''
+    Splits X and Y so that the last num_of_val_days days of every region are used for validation.
+
+    Returns:
+    - X_train, X_val, Y_train, Y_val
+    '''
+    train_ix, val_ix = split_train_val_indices(X["Region"], num_of_val_days, unique_region_list=unique_region_list)[0]
+    return X.iloc[train_ix], X.iloc[val_ix], Y.iloc[train_ix], Y.iloc[val_ix]
+
+def make_synthetic_panel(num_regions, num_days, seed=0):
+    '''
+    Creates a synthetic train.csv-like panel (num_regions * num_days rows) for benchmarking purposes.
+    '''
+    rng = np.random.RandomState(seed)
+    dates = pd.date_range("2020-01-22", periods=num_days).strftime("%Y-%m-%d").values
+    countries = np.array(["Country{}".format(i // 10) for i in range(num_regions)], dtype=object)
+    provinces = np.array(["Province{}".format(i) if i % 3 else np.nan for i in range(num_regions)], dtype=object)
+    onset = rng.randint(1, max(num_days - 1, 2), size=num_regions)
+    day_ix = np.tile(np.arange(num_days), num_regions)
+    region_ix = np.repeat(np.arange(num_regions), num_days)
+    cases = np.maximum(day_ix - onset[region_ix] + 1, 0).astype(np.float64) ** 2
+    return pd.DataFrame({"Id": np.arange(1, num_regions * num_days + 1),
+                         "Province_State": provinces[region_ix],
+                         "Country_Region": countries[region_ix],
+                         "Date": dates[day_ix],
+                         "ConfirmedCases": cases,
+                         "Fatalities": np.floor(cases * 0.01)})
+
+def benchmark_preprocess(train_path="../input/train.csv", num_days=100, region_counts=(1000, 10000, 100000)):
+    '''
+    Times add_region_features on the given train.csv and on synthetic panels of increasing size.
+    The default region counts go up to a 10M-row panel, so the time per row should stay flat.
+    '''
+    import time
+
+    targets = ["ConfirmedCases", "Fatalities"]
+    df = load_csv(train_path)
+    start = time.perf_counter()
+    add_region_features(df, targets)
+    elapsed = time.perf_counter() - start
+    print("{}: {} rows in {:.3f}s".format(train_path, df.shape[0], elapsed))
+
+    for num_regions in region_counts:
+        df = make_synthetic_panel(num_regions, num_days)
+        start = time.perf_counter()
+        add_region_features(df, targets)
+        elapsed = time.perf_counter() - start
+        print("synthetic: {} rows in {:.3f}s ({:.1f} ns/row)".format(df.shape[0], elapsed, 1e9 * elapsed / df.shape[0]))
+
+if __name__ == "__main__":
+    benchmark_preprocess()
@@ -0,0 +1,286 @@
+"""
+Contains the data store used to load the CSV files of the input folder. Each CSV is converted once into a
+typed columnar file (Feather if pyarrow is installed, pickle otherwise) kept in a cache folder next to it,
+and is only converted again when the source file changes.
+
+Authored by: Nicholas Sadjoli (Github @NickSadjoli)
+Co-authored by: Josephine Monica (Github @josephinemonica)
+"""
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+default_input_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "input")
+cache_dir_name = ".cache"
+
+# Strings used by the different sources for missing numbers
+missing_number_strings = ["", "N/A", "N.A.", "NA", "nan"]
+
+# Columns that need more than the automatic number parsing, per CSV file name:
+# - dates => parsed to datetime64 (a dict of {column: format} can be used for non-ISO dates)
+# - categories => stored as categorical columns
+# - strings => never parsed as numbers
+_training_schema = {"dates": ["Date"], "categories": ["Province_State", "Country_Region"]}
+_weather_schema = {"dates": ["Date"], "categories": ["Province_State", "Country_Region", "country+province"]}
+_population_schema = {"categories": ["Country (or dependency)", "Region"]}
+_covidtracking_schema = {"dates": {"date": "%Y%m%d", "dateChecked": None}, "categories": ["state", "states"],
+                         "strings": ["hash"]}
+schemas = {
+    "train.csv": _training_schema,
+    "test.csv": _training_schema,
+    "appended_data.csv": _training_schema,
+    "training_data_with_weather_info_week_3.csv": _weather_schema,
+    "training_data_with_weather_info_week_4.csv": _weather_schema,
+    "Worldometer_Population_Latest.csv": _population_schema,
+    "Worldometer_Population_Regional_Latest.csv": _population_schema,
+    "OECD_PopulationDensity_and_Area-T2_T3_Regions-2018_2019.csv": {"categories": ["REG_ID", "Region", "VAR"]},
+    "Worldometer_COVID19-Countries_TimeSeries.csv": {"categories": ["Country", "Data Type"]},
+    "Worldometer_COVID19-Countries_Regional.csv": {"categories": ["Country", "Region"]},
+    "COVIDTracking-US_PerStates-Timeseries.csv": _covidtracking_schema,
+    "COVIDTracking-US_Whole-Timeseries.csv": _covidtracking_schema,
+    "OurWorldinData-COVID_testing-all_observations.csv": {"dates": ["Date"], "categories": ["Entity"]},
+    "OurWorldinData-COVID_testing-latest_datasource_details.csv": {"dates": ["Date"], "categories": ["Entity"]},
+    "Climate_Data_Worldbank.csv": {"categories": ["GCM", "var", "scenario", "Country"]},
+}
+
+
+def parse_number_strings(values):
+    '''
+    Converts a column of Worldometer-style number strings (e.g. '1,439,323,776', '+56', '0.39 %', 'N/A')
+    to floats. Returns None if some non-missing value isn't a number.
+    '''
+    strings = values.astype(str).str.strip()
+    cleaned = strings.str.replace(",", "", regex=False).str.replace("+", "", regex=False).str.rstrip("%").str.strip()
+    numbers = pd.to_numeric(cleaned, errors="coerce")
+    missing = values.isnull().to_numpy() | strings.isin(missing_number_strings).to_numpy()
+    if np.any(numbers.isnull().to_numpy() & ~missing):
+        return None
+    return numbers.where(~missing)
+
+def apply_schema(df, schema):
+    '''
+    Types the columns of a freshly read CSV DataFrame according to schema (see schemas). Object columns that
+    are not dates, categories or strings are parsed as numbers whenever all their values are numbers.
+    '''
+    dates = schema.get("dates", [])
+    if not isinstance(dates, dict):
+        dates = {column: None for column in dates}
+    categories = schema.get("categories", [])
+    strings = schema.get("strings", [])
+
+    for column in df.columns:
+        if column in dates:
+            df[column] = pd.to_datetime(df[column], format=dates[column])
+        elif column in categories:
+            df[column] = df[column].astype("category")
+        elif column not in strings and pd.api.types.is_string_dtype(df[column].dtype):
+            numbers = parse_number_strings(df[column])
+            if numbers is not None:
+                df[column] = numbers
+    return df
+
+def file_hash(path, chunk_size=2**20):
+    '''
+    Returns the SHA-1 hex digest of the content of the file at path
+    '''
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+def write_bytes_atomic(path, data):
+    '''
+    Writes data to path through a temporary file in the same folder and os.replace, so that readers never see a
+    partially written file. The file is left untouched (same mtime) if its content wouldn't change.
+
+    Returns:
+    - True if the file was written
+    '''
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            if f.read() == data:
+                return False
+    folder = os.path.dirname(os.path.abspath(path))
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=folder, prefix=".tmp-", suffix=os.path.splitext(path)[1])
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return True
+
+def write_text_atomic(path, text):
+    '''
+    Text version of write_bytes_atomic (UTF-8)
+    '''
+    return write_bytes_atomic(path, text.encode("utf-8"))
+
+def write_csv_atomic(df, path, **to_csv_kwargs):
+    '''
+    Same as df.to_csv(path, **to_csv_kwargs), but written atomically (see write_text_atomic)
+    '''
+    return write_text_atomic(path, df.to_csv(**to_csv_kwargs))
+
+def write_chunks_atomic(path, chunks):
+    '''
+    Same as write_text_atomic, for a text written piece by piece (e.g. a CSV too big to be built in memory):
+    the chunks are written to a temporary file as they come, which then replaces path, unless its content is
+    the same as the one of path.
+
+    Arguments:
+    - path => path of the file
+    - chunks => iterable of strings
+
+    Returns:
+    - True if the file was written
+    '''
+    folder = os.path.dirname(os.path.abspath(path))
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=folder, prefix=".tmp-", suffix=os.path.splitext(path)[1])
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+            for chunk in chunks:
+                f.write(chunk)
+        if os.path.exists(path) and file_hash(path) == file_hash(tmp_path):
+            os.remove(tmp_path)
+            return False
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return True
+
+def _write_frame(df, cache_path):
+    # Feather keeps categoricals and datetimes and is the fastest to read back, pickle is the fallback
+    # when pyarrow is missing or can't store a column. Written to a temporary file and moved in place with
+    # os.replace, so that a concurrent reader never sees a partially written frame.
+    folder = os.path.dirname(os.path.abspath(cache_path))
+    for file_format, suffix in [("feather", ".feather"), ("pickle", ".pkl")]:
+        fd, tmp_path = tempfile.mkstemp(dir=folder, prefix=".tmp-", suffix=suffix)
+        os.close(fd)
+        try:
+            if file_format == "feather":
+                df.reset_index(drop=True).to_feather(tmp_path)
+            else:
+                df.to_pickle(tmp_path)
+            os.replace(tmp_path, cache_path + suffix)
+            return file_format
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            if file_format == "pickle":
+                raise
+
+def _read_frame(cache_path, file_format):
+    if file_format == "feather":
+        return pd.read_feather(cache_path + ".feather")
+    return pd.read_pickle(cache_path + ".pkl")
+
+def _read_cached_frame(cache_path, file_format):
+    # None if the cached file can't be read (e.g. removed by hand, or partially written by an older version), so
+    # that it is rebuilt from the CSV
+    try:
+        return _read_frame(cache_path, file_format)
+    except (OSError, ValueError, EOFError, pickle.UnpicklingError):
+        return None
+
+def load_csv(path, schema=None, cache_dir=None, refresh=False, **read_csv_kwargs):
+    '''
+    Loads a CSV file as a typed DataFrame, through its columnar cache.
+
+    Arguments:
+    - path => path of the CSV file
+    - schema => (Optional) column typing to use (see schemas). Default is the schema registered for the
+      file name, if any.
+    - cache_dir => (Optional) folder of the cached columnar files. Default is a ".cache" folder next to the CSV.
+    - refresh => (Optional) If True, the CSV is converted again even if the cache is up to date
+    - read_csv_kwargs => (Optional) extra arguments for pd.read_csv, used when (re)building the cache
+
+    Returns:
+    - the typed DataFrame
+    '''
+    file_name = os.path.basename(path)
+    if schema is None:
+        schema = schemas.get(file_name, {})
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(path)), cache_dir_name)
+    cache_path = os.path.join(cache_dir, file_name)
+    manifest_path = cache_path + ".json"
+
+    source_stat = os.stat(path)
+    source = {"mtime_ns": source_stat.st_mtime_ns, "size": source_stat.st_size}
+    settings = json.dumps({"schema": schema, "read_csv": read_csv_kwargs}, sort_keys=True, default=str)
+
+    manifest = None
+    if not refresh and os.path.exists(manifest_path):
+        try:
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            manifest = None
+        if manifest is not None and manifest.get("settings") != settings:
+            manifest = None
+
+    if manifest is not None:
+        touched = manifest["mtime_ns"] != source["mtime_ns"] or manifest["size"] != source["size"]
+        # The file was touched, only rebuild if its content really changed
+        if touched:
+            source["sha1"] = file_hash(path)
+        if not touched or manifest["sha1"] == source["sha1"]:
+            df = _read_cached_frame(cache_path, manifest["format"])
+            if df is not None:
+                if touched:
+                    manifest.update(source)
+                    write_text_atomic(manifest_path, json.dumps(manifest))
+                return df
+
+    df = apply_schema(pd.read_csv(path, **read_csv_kwargs), schema)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    if "sha1" not in source:
+        source["sha1"] = file_hash(path)
+    # The frame is in place before the manifest that validates it
+    manifest = dict(source, settings=settings, format=_write_frame(df, cache_path))
+    write_text_atomic(manifest_path, json.dumps(manifest))
+    return df
+
+def load(file_name, input_dir=default_input_dir, **kwargs):
+    '''
+    Loads one of the CSV files of the input folder by name (e.g. load("train.csv")), see load_csv
+    '''
+    return load_csv(os.path.join(input_dir, file_name), **kwargs)
+
+def build_cache(input_dir=default_input_dir, verbose=False):
+    '''
+    Converts every CSV file of the input folder that has no up to date cache yet
+    '''
+    for file_name in sorted(os.listdir(input_dir)):
+        if file_name.endswith(".csv"):
+            df = load(file_name, input_dir=input_dir)
+            if verbose:
+                print(file_name, df.shape)
+
+
+if __name__ == "__main__":
+    import time
+
+    build_cache(verbose=True)
+    for file_name in ["train.csv", "training_data_with_weather_info_week_4.csv", "Worldometer_Population_Regional_Latest.csv"]:
+        start = time.perf_counter()
+        pd.read_csv(os.path.join(default_input_dir, file_name))
+        csv_time = time.perf_counter() - start
+        start = time.perf_counter()
+        load(file_name)
+        cached_time = time.perf_counter() - start
+        print("{}: read_csv {:.1f}ms, cached load {:.1f}ms".format(file_name, 1000 * csv_time, 1000 * cached_time))
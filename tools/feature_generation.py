@@ -0,0 +1,263 @@
+"""
+Contains the generation of the lag and rolling-window features of every region (previous days' values, rolling
+means, growth rates, days since the Nth case), computed with grouped NumPy operations on the rows sorted by
+region. When new days are appended, only the last days of each region are used to compute the new rows'
+features instead of the whole history.
+
+Authored by: Josephine Monica (Github @josephinemonica)
+Co-authored by: Nicholas Sadjoli (Github @NickSadjoli)
+"""
+import numpy as np
+import pandas as pd
+
+from data_processing import make_region_names
+
+# Features computed for every target, from the previous days only (the value of the day itself is what is
+# predicted):
+# - lags => value k days before, "lag<k>_<target>" (0 before the first day of the region, as prev_<target>)
+# - rolling_means => mean of the previous w days, "rolling_mean<w>_<target>"
+# - growth_rates => mean daily growth of log1p(value) over w days, up to the previous day, "growth<w>_<target>"
+# - days_since => days since the previous day's value first reached N, "days_since<N>_<target>" (-1 before)
+default_feature_spec = {
+    "lags": {"ConfirmedCases": [1, 2, 3, 7], "Fatalities": [1, 2, 3, 7]},
+    "rolling_means": {"ConfirmedCases": [3, 7], "Fatalities": [3, 7]},
+    "growth_rates": {"ConfirmedCases": [3, 7], "Fatalities": [3, 7]},
+    "days_since": {"ConfirmedCases": [1, 100], "Fatalities": [1, 10]},
+}
+
+
+def feature_names(spec=default_feature_spec):
+    '''
+    Returns the names of the features generated for spec, in the order of the generated columns
+    '''
+    names = []
+    for target, lags in spec.get("lags", {}).items():
+        names += ["lag{}_{}".format(k, target) for k in lags]
+    for target, windows in spec.get("rolling_means", {}).items():
+        names += ["rolling_mean{}_{}".format(w, target) for w in windows]
+    for target, windows in spec.get("growth_rates", {}).items():
+        names += ["growth{}_{}".format(w, target) for w in windows]
+    for target, thresholds in spec.get("days_since", {}).items():
+        names += ["days_since{}_{}".format(n, target) for n in thresholds]
+    return names
+
+def count_feature_names(spec=default_feature_spec):
+    '''
+    Returns the names of the features that are counts (lags and rolling means), e.g. to log1p them like the targets
+    '''
+    return [name for name in feature_names(spec) if name.startswith(("lag", "rolling_mean"))]
+
+def lookback(spec=default_feature_spec):
+    '''
+    Returns the number of previous days of a region needed to compute the features of a day (days_since excepted,
+    see FeatureGenerator)
+    '''
+    days = [1]
+    days += [k for lags in spec.get("lags", {}).values() for k in lags]
+    days += [w for windows in spec.get("rolling_means", {}).values() for w in windows]
+    days += [w + 1 for windows in spec.get("growth_rates", {}).values() for w in windows]
+    return max(days)
+
+def _group_rows(regions):
+    # Stable sort of the rows by region: every region keeps the (chronological) order its rows have in the input
+    region_codes, region_names = pd.factorize(regions)
+    order = np.argsort(region_codes, kind="mergesort")
+    sorted_codes = region_codes[order]
+    starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+    group_start = np.repeat(starts, np.diff(np.r_[starts, len(order)]))
+    return order, region_names[sorted_codes[starts]], starts, group_start
+
+def _shift(values, group_start, k):
+    # value k rows before in the same group, and whether there is one
+    positions = np.arange(len(values)) - k
+    valid = positions >= group_start
+    return np.where(valid, values[np.maximum(positions, 0)], 0.0), valid
+
+def _compute_features(values, dates, group_start, starts, spec, first_dates=None):
+    '''
+    Computes the features of rows sorted by group (see _group_rows).
+
+    Arguments:
+    - values => dictionary of {target: float array of the sorted rows}
+    - dates => datetime64[D] array of the sorted rows
+    - group_start, starts => position of the first row of the group of every row, and of every group
+    - first_dates => (Optional) dictionary of {(target, N): datetime64[D] array per group} of the dates already
+      known for days_since (NaT if not reached yet), e.g. from the days before the rows
+
+    Returns:
+    - features => dictionary of {feature name: array of the sorted rows}
+    - first_dates => updated first_dates
+    '''
+    features = {}
+    shifted = {}
+    def shift(target, k):
+        if (target, k) not in shifted:
+            shifted[(target, k)] = _shift(values[target], group_start, k)
+        return shifted[(target, k)]
+
+    for target, lags in spec.get("lags", {}).items():
+        for k in lags:
+            features["lag{}_{}".format(k, target)] = shift(target, k)[0]
+
+    for target, windows in spec.get("rolling_means", {}).items():
+        for w in windows:
+            total = np.zeros(len(dates))
+            count = np.zeros(len(dates))
+            for k in range(1, w + 1):
+                lagged, valid = shift(target, k)
+                total += lagged
+                count += valid
+            features["rolling_mean{}_{}".format(w, target)] = np.where(count > 0, total / np.maximum(count, 1), 0.0)
+
+    for target, windows in spec.get("growth_rates", {}).items():
+        for w in windows:
+            latest, _ = shift(target, 1)
+            oldest, valid = shift(target, w + 1)
+            growth = (np.log1p(np.maximum(latest, 0)) - np.log1p(np.maximum(oldest, 0))) / w
+            features["growth{}_{}".format(w, target)] = np.where(valid, growth, 0.0)
+
+    first_dates = dict(first_dates or {})
+    group_ids = np.cumsum(np.isin(np.arange(len(dates)), starts)) - 1
+    for target, thresholds in spec.get("days_since", {}).items():
+        previous, valid = shift(target, 1)
+        for n in thresholds:
+            reached = valid & (previous >= n)
+            first_reached = np.minimum.reduceat(np.where(reached, np.arange(len(dates)), len(dates)), starts)
+            found = first_reached < len(dates)
+            group_first = np.full(len(starts), np.datetime64("NaT"), dtype="datetime64[D]")
+            group_first[found] = dates[first_reached[found]]
+            known = first_dates.get((target, n))
+            if known is not None:
+                group_first = np.where(np.isnat(known), group_first, known)
+            first_dates[(target, n)] = group_first
+
+            row_first = group_first[group_ids]
+            not_reached = np.isnat(row_first)
+            since = (dates - np.where(not_reached, dates, row_first)) // np.timedelta64(1, "D")
+            features["days_since{}_{}".format(n, target)] = np.where(not_reached | (since < 0), -1, since)
+    return features, first_dates
+
+
+class FeatureGenerator():
+    '''
+    Generates the lag and rolling-window features of spec (see default_feature_spec) for every region of a
+    training-style DataFrame, and updates them incrementally when new days are appended.
+
+    generate computes the features of a whole DataFrame, and keeps the last lookback(spec) days of every region
+    (and the dates the days_since thresholds were reached). update then computes the features of new days from
+    these last days only, and gives the same values as generate on the whole appended DataFrame.
+
+    Arguments:
+    - spec => (Optional) features to generate, see default_feature_spec
+    - region_column => (Optional) column of the regions. If missing from the DataFrames, it is made from
+      Country_Region and Province_State (see data_processing.make_region_names).
+    - date_column => (Optional) column of the dates
+    '''
+    def __init__(self, spec=default_feature_spec, region_column="Region", date_column="Date"):
+        self.spec = spec
+        self.region_column = region_column
+        self.date_column = date_column
+        self.targets = list(dict.fromkeys(target for kind in spec.values() for target in kind))
+        self.lookback = lookback(spec)
+        self.tail = None
+        self.first_dates = {}
+
+    def _regions(self, df):
+        if self.region_column in df.columns:
+            return np.asarray(df[self.region_column], dtype=object)
+        return make_region_names(df)
+
+    def _frame(self, df):
+        frame = pd.DataFrame({"Region": self._regions(df),
+                              "Date": pd.to_datetime(df[self.date_column]).values.astype("datetime64[D]")})
+        for target in self.targets:
+            frame[target] = np.asarray(df[target], dtype=np.float64)
+        return frame
+
+    def _run(self, frame, known_regions=None):
+        order, regions, starts, group_start = _group_rows(frame["Region"].to_numpy())
+        values = {target: frame[target].to_numpy()[order] for target in self.targets}
+        # pandas may store the dates of the frame with another unit (e.g. datetime64[s])
+        dates = frame["Date"].to_numpy().astype("datetime64[D]")[order]
+
+        first_dates = {}
+        if known_regions is not None:
+            positions = pd.Index(known_regions).get_indexer(regions)
+            for key, known in self.first_dates.items():
+                first_dates[key] = np.where(positions >= 0, known[np.maximum(positions, 0)], np.datetime64("NaT"))
+        features, first_dates = _compute_features(values, dates, group_start, starts, self.spec, first_dates)
+
+        unsorted = {}
+        for name in feature_names(self.spec):
+            unsorted[name] = np.empty_like(features[name])
+            unsorted[name][order] = features[name]
+        return unsorted, regions, first_dates, order, starts
+
+    def _keep_tail(self, frame, order, starts):
+        # last lookback rows of every region, in their sorted (chronological) order
+        ends = np.r_[starts[1:], len(order)]
+        keep = np.zeros(len(order), dtype=bool)
+        positions = np.arange(len(order))
+        keep[positions >= np.repeat(np.maximum(ends - self.lookback, starts), ends - starts)] = True
+        self.tail = frame.iloc[order[keep]].reset_index(drop=True)
+
+    def generate(self, df):
+        '''
+        Returns the DataFrame of the features of every row of df (same index as df)
+        '''
+        frame = self._frame(df)
+        features, regions, first_dates, order, starts = self._run(frame)
+        self.regions = regions
+        self.first_dates = first_dates
+        self._keep_tail(frame, order, starts)
+        return pd.DataFrame(features, index=df.index, columns=feature_names(self.spec))
+
+    def update(self, new_df):
+        '''
+        Returns the DataFrame of the features of the rows of new_df (same index as new_df), days that come after
+        the ones given to generate (or to the previous update). Only the last lookback days of every region
+        are used, so the cost doesn't grow with the length of the history.
+        '''
+        if self.tail is None:
+            raise ValueError("generate has to be called before update")
+        new_frame = self._frame(new_df)
+        frame = pd.concat([self.tail, new_frame], ignore_index=True)
+        features, regions, first_dates, order, starts = self._run(frame, known_regions=self.regions)
+        self.regions = regions
+        self.first_dates = first_dates
+        self._keep_tail(frame, order, starts)
+        new_rows = np.arange(len(frame) - len(new_frame), len(frame))
+        return pd.DataFrame({name: values[new_rows] for name, values in features.items()}, index=new_df.index,
+                            columns=feature_names(self.spec))
+
+def benchmark_incremental(filename, num_new_days=7, spec=default_feature_spec):
+    '''
+    Simulates num_new_days daily updates of the data file: times FeatureGenerator.update on each new day against
+    generating the features of the whole file again, and checks that both give exactly the same features.
+    '''
+    import time
+    from data_store import load_csv
+
+    df = load_csv(filename)
+    dates = pd.to_datetime(df["Date"])
+    new_dates = np.sort(dates.unique())[-num_new_days:]
+
+    generator = FeatureGenerator(spec)
+    generator.generate(df[dates < new_dates[0]])
+    full_time = update_time = 0
+    for date in new_dates:
+        start = time.perf_counter()
+        updated = generator.update(df[dates == date])
+        update_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        full = FeatureGenerator(spec).generate(df[dates <= date])
+        full_time += time.perf_counter() - start
+        assert np.array_equal(updated.to_numpy(), full.loc[updated.index].to_numpy()), "Features differ on {}".format(date)
+    print("{} daily updates of {} features ({} rows): full recompute {:.1f}ms/day, incremental {:.1f}ms/day ({:.1f}x)".format(
+        num_new_days, len(feature_names(spec)), len(df), 1000 * full_time / num_new_days, 1000 * update_time / num_new_days,
+        full_time / update_time))
+
+
+if __name__ == "__main__":
+    benchmark_incremental("../input/train.csv")
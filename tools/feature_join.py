@@ -0,0 +1,148 @@
+"""
+Contains the functions used to append the population features (Worldometer's population and population density,
+OECD's regional population density) to the training data, with keyed merges on the normalized (country, region)
+names of region_names instead of a loop over every country and province.
+
+Authored by: Nicholas Sadjoli (Github @NickSadjoli)
+Co-authored by: Josephine Monica (Github @josephinemonica)
+"""
+import numpy as np
+import pandas as pd
+
+from data_store import parse_number_strings
+from region_names import RegionResolver, name_keys
+
+population_features = ['Population (2020)', 'Population Density']
+#Features that fall back to the value of the whole country for the rows of a region. A population is a count, so
+#the population of the whole country would be wrong for its regions, while its density is a fair estimate.
+country_fallback_features = ['Population Density']
+country_level_region = "All_Regions" #Region of the Worldometer rows that are about the whole country
+
+
+def _numbers(values):
+    # Columns read with load_csv are already numbers, the ones read with pd.read_csv may still be '1,234' strings
+    if pd.api.types.is_numeric_dtype(values.dtype):
+        return values.astype(np.float64)
+    numbers = parse_number_strings(values)
+    if numbers is None:
+        raise ValueError("Column {} has values that are not numbers".format(values.name))
+    return numbers.astype(np.float64)
+
+def _unique_keys(df, columns):
+    # Keys found more than once are ambiguous (e.g. Worldometer's 'Victoria' regions), so they are dropped
+    return df[~df.duplicated(columns, keep=False)]
+
+def worldometer_population_tables(population_df):
+    '''
+    Splits Worldometer's population data (Worldometer_Population_Regional_Latest.csv) into the keyed tables
+    used by join_population_features.
+
+    Returns:
+    - countries => DataFrame of country_key, population, density, of the whole countries
+    - regions => DataFrame of country_key, region_key, population, of the regions of the countries
+    '''
+    table = pd.DataFrame({"country_key": name_keys(population_df['Country (or dependency)']),
+                          "region_key": name_keys(population_df['Region']),
+                          "population": _numbers(population_df['Population (2020)']).to_numpy(),
+                          "density": _numbers(population_df['Density (P/Km²)']).to_numpy()})
+    is_country = (population_df['Region'] == country_level_region).to_numpy()
+    countries = _unique_keys(table[is_country], ["country_key"])[["country_key", "population", "density"]]
+    regions = _unique_keys(table[~is_country], ["country_key", "region_key"])[["country_key", "region_key", "population"]]
+    return countries, regions
+
+def oecd_density_table(density_df, year=2019):
+    '''
+    Returns the keyed table (region_key, density) of the population densities of the given year in OECD's data
+    (OECD_PopulationDensity_and_Area-T2_T3_Regions-2018_2019.csv). OECD regions have no country column, so they
+    are matched by name only, and names used by several regions are dropped.
+    '''
+    density_df = density_df[(density_df['VAR'] == "POP_DEN") & (density_df['Year'] == year)]
+    table = pd.DataFrame({"region_key": name_keys(density_df['Region']),
+                          "density": _numbers(density_df['Value']).to_numpy()})
+    return _unique_keys(table, ["region_key"])
+
+def unmatched_keys(report):
+    '''
+    Returns the rows of a join_population_features report with at least one feature that wasn't found
+    '''
+    return report[(report[population_features] == "none").any(axis=1)]
+
+def join_population_features(df, population_df, density_df, country_column='Country_Region',
+                             region_column='Province_State', year=2019, verbose=False):
+    '''
+    Appends the population features to df (e.g. the training data), for every (country, region) pair:
+    - Population (2020) => Worldometer's population of the region of the country, else of the region itself
+      when Worldometer lists it as a country (e.g. Aruba, Hong Kong). Only the rows of whole countries get the
+      population of the country: regions without a population of their own are left NaN.
+    - Population Density => OECD's density of the region, else Worldometer's density of the region listed as a
+      country, else of the country
+
+    Countries (and regions listed as countries) are resolved to Worldometer's countries with a RegionResolver
+    (normalized names, aliases such as 'Korea, South' ---> 'South Korea', then fuzzy matching). A region is only
+    matched as a country if df doesn't also list that country on its own (e.g. the US state of Georgia isn't the
+    country Georgia). Regions are matched on their normalized names. The matching is done once per distinct pair
+    and mapped back to the rows of df.
+
+    Arguments:
+    - df => DataFrame with a country and a region column (regions are NaN for whole countries)
+    - population_df => Worldometer's population data, see worldometer_population_tables
+    - density_df => OECD's population density data, see oecd_density_table
+    - year => (Optional) year of OECD's data to use
+
+    Returns:
+    - joined => copy of df with the population_features columns, NaN where nothing matched
+    - report => DataFrame of every distinct (country, region) pair of df, with the level each feature was found
+      at ("region", "region as country", "country" or "none")
+    '''
+    countries, regions = worldometer_population_tables(population_df)
+    densities = oecd_density_table(density_df, year=year)
+
+    # missing names are factorized as "" so that all the rows of a whole country are one pair
+    pair_codes, pairs = pd.factorize(pd.MultiIndex.from_arrays([df[country_column].astype(object).fillna(""),
+                                                                df[region_column].astype(object).fillna("")]))
+    report = pd.DataFrame({"Country": pairs.get_level_values(0), "Region": pairs.get_level_values(1)})
+    report["Region"] = report["Region"].replace("", np.nan)
+    resolver = RegionResolver(population_df['Country (or dependency)'][population_df['Region'] == country_level_region])
+    resolved_countries = resolver.resolve_many(report["Country"])
+    resolved_regions = resolver.resolve_many(report["Region"])
+    resolved_regions[pd.Series(resolved_regions).isin(set(resolved_countries) - {None}).to_numpy()] = None
+    report["country_key"] = name_keys(resolved_countries)
+    report["region_key"] = name_keys(report["Region"])
+    report["region_country_key"] = name_keys(resolved_regions)
+    has_region = (report["region_key"] != "").to_numpy()
+
+    by_region = report.merge(regions, how="left", on=["country_key", "region_key"])
+    by_oecd = report.merge(densities, how="left", on="region_key")
+    by_region_as_country = report.merge(countries.rename(columns={"country_key": "region_country_key"}), how="left",
+                                        on="region_country_key")
+    by_country = report.merge(countries, how="left", on="country_key")
+
+    levels = ["region", "region as country", "country"]
+    candidates = {
+        'Population (2020)': [by_region["population"], by_region_as_country["population"], by_country["population"]],
+        'Population Density': [by_oecd["density"], by_region_as_country["density"], by_country["density"]],
+    }
+    joined = df.copy()
+    for feature in population_features:
+        values = np.full(len(report), np.nan)
+        level = np.full(len(report), "none", dtype=object)
+        for name, candidate in zip(levels, candidates[feature]):
+            candidate = candidate.to_numpy(dtype=np.float64)
+            use = np.isnan(values) & ~np.isnan(candidate)
+            if name != "country":
+                use &= has_region
+            elif feature not in country_fallback_features:
+                use &= ~has_region
+            values[use] = candidate[use]
+            level[use] = name
+        report[feature] = level
+        joined[feature] = values[pair_codes]
+
+    report = report.drop(columns=["country_key", "region_key", "region_country_key"])
+    if verbose:
+        print("Names not resolved to a Worldometer country:")
+        print(resolver.report().to_string())
+        unmatched = unmatched_keys(report)
+        print("{} of {} (country, region) pairs have unmatched features:".format(len(unmatched), len(report)))
+        print(unmatched.to_string())
+    return joined, report
@@ -0,0 +1,303 @@
+"""
+Contains the recursive forecasting functions used to roll trained models forward in time for every region.
+Each day of the forecast is predicted for all regions at once with a single predict call per target.
+
+Authored by: Josephine Monica (Github @josephinemonica)
+Co-authored by: Nicholas Sadjoli (Github @NickSadjoli)
+"""
+import numpy as np
+import pandas as pd
+
+default_targets = ["ConfirmedCases", "Fatalities"]
+
+
+def enforce_monotonic(predicted, previous):
+    '''
+    Clamps predictions so that cumulative targets never decrease, i.e. any prediction lower than the
+    previous day value is replaced by the previous day value.
+
+    Arguments:
+    - predicted => NumPy array of predicted values
+    - previous => NumPy array of previous day values, same shape as predicted
+
+    Returns:
+    - the clamped NumPy array
+    '''
+    return np.where(predicted < previous, previous, predicted)
+
+def last_rows_per_region(X_features):
+    '''
+    Returns the sorted list of unique regions, and the position of the last row of each region in X_features
+    '''
+    region_codes, regions = pd.factorize(X_features["Region"])
+    last_positions = np.zeros(len(regions), dtype=np.int64)
+    last_positions[region_codes] = np.arange(len(region_codes))
+
+    sort_ix = np.argsort(np.asarray(regions, dtype=str), kind="mergesort")
+    return list(regions[sort_ix]), last_positions[sort_ix]
+
+def forecast_regions(models, X_features, Y, num_days_to_predict, targets=default_targets, enforce_constraint=True):
+    '''
+    Recursively forecasts every region num_days_to_predict days after its last row, feeding each day's
+    predictions back as the next day's prev_<target> features.
+
+    Arguments:
+    - models => dictionary of {target: fitted model with a predict(X) function}
+    - X_features => DataFrame of features (must contain "Region", "Days" and "prev_<target>" for all targets)
+    - Y => DataFrame of targets aligned with X_features
+    - num_days_to_predict => number of days to forecast after the last day of each region
+    - targets => (Optional) list of targets to predict, also the order of the output columns
+    - enforce_constraint => (Optional) If True, predictions are never lower than the previous day value
+
+    Returns:
+    - unique_region_list => sorted list of regions
+    - Y_test_predicted => NumPy array of shape (len(unique_region_list)*num_days_to_predict, len(targets)),
+      ordered by region first and then by day
+    '''
+    unique_region_list, last_positions = last_rows_per_region(X_features)
+
+    X_step = X_features.iloc[last_positions].copy(deep=True)
+    previous = {target: Y[target].to_numpy()[last_positions] for target in targets}
+
+    Y_test_predicted = np.zeros((len(unique_region_list), num_days_to_predict, len(targets)))
+    for day in range(num_days_to_predict):
+        for target in targets:
+            X_step["prev_{}".format(target)] = previous[target]
+        X_step["Days"] = X_step["Days"] + 1
+
+        for j, target in enumerate(targets):
+            predicted = np.asarray(models[target].predict(X_step), dtype=np.float64)
+            if enforce_constraint:
+                predicted = enforce_monotonic(predicted, previous[target])
+            Y_test_predicted[:, day, j] = predicted
+
+        previous = {target: Y_test_predicted[:, day, j] for j, target in enumerate(targets)}
+
+    return unique_region_list, Y_test_predicted.reshape(-1, len(targets))
+
+def region_day_positions(X_val):
+    '''
+    Reshapes the rows of X_val into a (regions x days) block of row positions. Consecutive rows with the same
+    "Region" are treated as consecutive days of that region, regions with fewer days are padded with -1.
+
+    Returns:
+    - regions => NumPy array with the region of each row of the block
+    - positions => NumPy int array of shape (len(regions), max number of days)
+    '''
+    region_values = X_val["Region"].to_numpy()
+    num_rows = len(region_values)
+    starts = np.flatnonzero(np.r_[True, region_values[1:] != region_values[:-1]]) if num_rows else np.zeros(0, dtype=np.int64)
+    lengths = np.diff(np.r_[starts, num_rows])
+
+    positions = np.full((len(starts), lengths.max() if num_rows else 0), -1, dtype=np.int64)
+    day_ix = np.arange(num_rows) - np.repeat(starts, lengths)
+    positions[np.repeat(np.arange(len(starts)), lengths), day_ix] = np.arange(num_rows)
+    return region_values[starts], positions
+
+def rollout_validation(models, X_val, targets=default_targets, enforce_constraint=True):
+    '''
+    Predicts the validation rows of all regions together. The first day of each region uses its actual
+    prev_<target> features, every following day uses the predictions of the day before.
+
+    Arguments:
+    - models => dictionary of {target: fitted model with a predict(X) function}
+    - X_val => DataFrame of validation features, with the days of each region in consecutive rows
+    - targets => (Optional) list of targets to predict, also the order of the output columns
+    - enforce_constraint => (Optional) If True, predictions are never lower than the previous day value
+
+    Returns:
+    - Y_val_predicted => NumPy array of shape (X_val.shape[0], len(targets)), in the row order of X_val
+    '''
+    _, positions = region_day_positions(X_val)
+    Y_val_predicted = np.zeros((X_val.shape[0], len(targets)))
+    prev_columns = ["prev_{}".format(target) for target in targets]
+
+    # (regions x days x features) blocks of the columns of X_val, one per dtype, built once. The prev_<target>
+    # columns are kept as float64 so that each day's predictions can be written into the next day. Columns with a
+    # pandas extension dtype (e.g. categorical) are taken from their arrays by row position instead.
+    column_dtypes = {column: np.dtype(np.float64) if column in prev_columns else dtype
+                     for column, dtype in X_val.dtypes.items()}
+    extension_columns = [column for column in X_val.columns if not isinstance(column_dtypes[column], np.dtype)]
+    block_columns = {}
+    for column in X_val.columns:
+        if column not in extension_columns:
+            block_columns.setdefault(column_dtypes[column], []).append(column)
+    blocks = []
+    for dtype, columns in block_columns.items():
+        # Padded positions (-1) take the last row, they are never read
+        blocks.append((columns, X_val[columns].to_numpy(dtype=dtype)[positions]))
+    prev_block, prev_ix = next((values, [columns.index(column) for column in prev_columns])
+                               for columns, values in blocks if prev_columns[0] in columns)
+
+    for day in range(positions.shape[1]):
+        active = positions[:, day] >= 0
+        rows = positions[active, day]
+        if day > 0:
+            # A region active on this day was also active the day before
+            prev_block[np.flatnonzero(active)[:, None], day, prev_ix] = Y_val_predicted[positions[active, day - 1]]
+        previous = prev_block[active, day][:, prev_ix]
+
+        step_columns = {column: values[active, day, k] for columns, values in blocks for k, column in enumerate(columns)}
+        for column in extension_columns:
+            step_columns[column] = X_val[column].array.take(rows)
+        X_step = pd.DataFrame(step_columns, index=X_val.index[rows], columns=X_val.columns)
+
+        for j, target in enumerate(targets):
+            predicted = np.asarray(models[target].predict(X_step), dtype=np.float64)
+            if enforce_constraint:
+                predicted = enforce_monotonic(predicted, previous[:, j])
+            Y_val_predicted[rows, j] = predicted
+
+    return Y_val_predicted
+
+def evaluate_rmse(Y_predicted, Y_true):
+    """
+    Y_predicted: n-by-d n is the number of data points, d is the number of criteria
+    Y_true: n-by-d
+    OUTPUT
+    d elements
+    """
+    errors = np.asarray(Y_predicted, dtype=np.float64) - np.asarray(Y_true, dtype=np.float64)
+    return np.sqrt(np.mean(errors ** 2, axis=0))
+
+def evaluate_rmse_per_region(Y_predicted, Y_true, regions, targets=default_targets):
+    '''
+    Computes the RMSE of every target for every region.
+
+    Arguments:
+    - Y_predicted => n-by-d array of predictions
+    - Y_true => n-by-d array of true values
+    - regions => n region names, aligned with the rows of Y_predicted and Y_true
+    - targets => (Optional) names of the d columns
+
+    Returns:
+    - DataFrame indexed by region, with one RMSE column per target
+    '''
+    region_codes, unique_regions = pd.factorize(np.asarray(regions))
+    counts = np.bincount(region_codes, minlength=len(unique_regions))
+    squared_errors = (np.asarray(Y_predicted, dtype=np.float64) - np.asarray(Y_true, dtype=np.float64)) ** 2
+
+    region_rmse = pd.DataFrame(index=pd.Index(unique_regions, name="Region"))
+    for j, target in enumerate(targets):
+        region_rmse[target] = np.sqrt(np.bincount(region_codes, weights=squared_errors[:, j], minlength=len(unique_regions)) / counts)
+    return region_rmse
+
+def validate(models, X_val, Y_val, targets=default_targets, enforce_constraint=True):
+    '''
+    Runs rollout_validation and scores it.
+
+    Returns:
+    - Y_val_predicted => NumPy array of predictions in the row order of X_val
+    - val_rmse => overall RMSE of each target
+    - region_rmse => DataFrame of the RMSE of each target per region
+    '''
+    Y_val_predicted = rollout_validation(models, X_val, targets, enforce_constraint)
+    Y_true = Y_val[targets].to_numpy()
+    val_rmse = evaluate_rmse(Y_val_predicted, Y_true)
+    region_rmse = evaluate_rmse_per_region(Y_val_predicted, Y_true, X_val["Region"], targets)
+    return Y_val_predicted, val_rmse, region_rmse
+
+def _forecast_regions_rowwise(models, X_features, Y, num_days_to_predict, targets=default_targets, enforce_constraint=True):
+    '''
+    Reference implementation of forecast_regions, predicting one region and one day at a time
+    (as done originally in the experimental notebook). Only used for benchmarking.
+    '''
+    unique_region_list = list(set(X_features["Region"]))
+    unique_region_list.sort()
+
+    Y_test_predicted = np.zeros((len(unique_region_list)*num_days_to_predict, len(targets)))
+    count = 0
+    for region in unique_region_list:
+        mask = X_features["Region"]==region
+
+        X_dummy = X_features[mask].iloc[[-1]].copy(deep=True)
+        previous = {target: Y[mask][target].iloc[-1] for target in targets}
+
+        for days_ahead in range(num_days_to_predict):
+            for target in targets:
+                X_dummy["prev_{}".format(target)] = previous[target]
+            X_dummy["Days"] = X_dummy["Days"]+1
+
+            for j, target in enumerate(targets):
+                predicted = np.asarray(models[target].predict(X_dummy))[0]
+                if(enforce_constraint and predicted<X_dummy["prev_{}".format(target)].item()):
+                    predicted = X_dummy["prev_{}".format(target)].item()
+                Y_test_predicted[count, j] = predicted
+                previous[target] = predicted
+            count = count+1
+
+    return unique_region_list, Y_test_predicted
+
+def _rollout_validation_rowwise(models, X_val, targets=default_targets, enforce_constraint=True):
+    '''
+    Reference implementation of rollout_validation, walking X_val one row at a time
+    (as done originally in the experimental notebook). Only used for benchmarking.
+    '''
+    Y_val_predicted = np.zeros((X_val.shape[0], len(targets)))
+
+    for i in range(X_val.shape[0]):
+        X_dummy = X_val.iloc[[i]].copy(deep=True)
+        if(i!=0 and X_val.iloc[i-1]["Region"] == X_val.iloc[i]["Region"]):
+            for j, target in enumerate(targets):
+                X_dummy["prev_{}".format(target)] = Y_val_predicted[i-1, j]
+
+        for j, target in enumerate(targets):
+            predicted = np.asarray(models[target].predict(X_dummy))[0]
+            if(enforce_constraint and predicted<X_dummy["prev_{}".format(target)].item()):
+                predicted = X_dummy["prev_{}".format(target)].item()
+            Y_val_predicted[i, j] = predicted
+
+    return Y_val_predicted
+
+def benchmark_forecast(models, X_features, Y, num_days_to_predict=43, targets=default_targets):
+    '''
+    Times forecast_regions against the one-row-at-a-time reference implementation, and checks that both
+    give exactly the same forecasts.
+    '''
+    import time
+
+    start = time.perf_counter()
+    regions_rowwise, Y_rowwise = _forecast_regions_rowwise(models, X_features, Y, num_days_to_predict, targets)
+    rowwise_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    regions_batched, Y_batched = forecast_regions(models, X_features, Y, num_days_to_predict, targets)
+    batched_time = time.perf_counter() - start
+
+    assert regions_rowwise == regions_batched, "Region order differs"
+    assert np.array_equal(Y_rowwise, Y_batched), "Forecasts differ"
+    print("{} regions x {} days: row-by-row {:.2f}s, batched {:.2f}s ({:.1f}x)".format(
+        len(regions_batched), num_days_to_predict, rowwise_time, batched_time, rowwise_time / batched_time))
+
+def benchmark_validation(models, X_val, targets=default_targets):
+    '''
+    Times rollout_validation against the one-row-at-a-time reference implementation, and checks that both
+    give exactly the same predictions.
+    '''
+    import time
+
+    start = time.perf_counter()
+    Y_rowwise = _rollout_validation_rowwise(models, X_val, targets)
+    rowwise_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    Y_batched = rollout_validation(models, X_val, targets)
+    batched_time = time.perf_counter() - start
+
+    assert np.array_equal(Y_rowwise, Y_batched), "Validation predictions differ"
+    print("{} validation rows: row-by-row {:.2f}s, batched {:.2f}s ({:.1f}x)".format(
+        X_val.shape[0], rowwise_time, batched_time, rowwise_time / batched_time))
+
+
+if __name__ == "__main__":
+    from interpret.glassbox import ExplainableBoostingRegressor
+    from data_processing import preprocess
+
+    features = ['Region', "prev_ConfirmedCases", "prev_Fatalities", 'Days']
+    X, Y = preprocess("../input/train.csv", features, default_targets)
+    models = {}
+    for target in default_targets:
+        models[target] = ExplainableBoostingRegressor(random_state=1)
+        models[target].fit(X, Y[target])
+    benchmark_forecast(models, X, Y)
+    benchmark_validation(models, X.groupby("Region").tail(10))
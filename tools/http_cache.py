@@ -0,0 +1,284 @@
+"""
+Contains the on-disk HTTP response cache used to download the data sources of update_data. Responses are
+kept for a TTL, then revalidated with conditional requests (ETag / Last-Modified), so that an unchanged
+source costs no request at all while it is fresh and a single 304 round trip after that. Bodies are stored
+by the SHA-1 of their content, and the least recently used ones are evicted once the cache exceeds its size.
+The index of the responses is kept in memory and written to disk by flush (or close), at most once every
+save_interval seconds while fetching, so that a batch of cached requests doesn't rewrite it for every response.
+
+Authored by: Nicholas Sadjoli (Github @NickSadjoli)
+Co-authored by: Josephine Monica (Github @josephinemonica)
+"""
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+
+import pandas as pd
+
+from data_store import default_input_dir, write_bytes_atomic, write_text_atomic
+
+default_cache_dir = os.path.join(default_input_dir, ".cache", "http")
+default_ttl = 15 * 60 #seconds a response is used without revalidating it
+default_max_bytes = 512 * 2**20
+default_timeout = 30
+default_save_interval = 5.0 #seconds between two writes of the index while fetching
+index_file_name = "index.json"
+
+
+class _CacheReader():
+    def get(self, url, ttl=None):
+        '''
+        Returns the body of url as bytes, see fetch
+        '''
+        return self.fetch(url, ttl=ttl)[0]
+
+    def read_csv(self, url, ttl=None, **read_csv_kwargs):
+        '''
+        Same as pd.read_csv(url, **read_csv_kwargs), through the cache
+        '''
+        return pd.read_csv(io.BytesIO(self.get(url, ttl=ttl)), **read_csv_kwargs)
+
+
+class HttpCache(_CacheReader):
+    '''
+    On-disk cache of HTTP GET responses, safe to share between threads.
+
+    Arguments:
+    - cache_dir => (Optional) folder of the cache
+    - ttl => (Optional) default number of seconds a response is served without any request
+    - max_bytes => (Optional) maximum total size of the cached bodies, least recently used ones are evicted first
+    - timeout => (Optional) timeout of the requests, in seconds
+    - stale_if_error => (Optional) If True, the cached body is returned when revalidating it fails
+    - save_interval => (Optional) minimum number of seconds between two writes of the index while fetching. The
+      index is always written by flush and close.
+
+    The cache can be used as a context manager, which closes it on exit.
+    '''
+    def __init__(self, cache_dir=default_cache_dir, ttl=default_ttl, max_bytes=default_max_bytes,
+                 timeout=default_timeout, stale_if_error=True, save_interval=default_save_interval):
+        import requests
+        self.requests = requests
+        self.cache_dir = cache_dir
+        self.objects_dir = os.path.join(cache_dir, "objects")
+        self.index_path = os.path.join(cache_dir, index_file_name)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.stale_if_error = stale_if_error
+        self.save_interval = save_interval
+
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.index = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                self.index = json.load(f)
+        self.dirty = False
+        self.saved_at = time.time()
+        self.stats = {"fresh": 0, "not_modified": 0, "downloaded": 0, "stale": 0, "bytes_downloaded": 0}
+
+    def _session(self):
+        # requests Sessions aren't guaranteed to be thread-safe, so every thread gets its own
+        session = getattr(self.local, "session", None)
+        if session is None:
+            session = self.local.session = self.requests.Session()
+        return session
+
+    def _object_path(self, sha1):
+        return os.path.join(self.objects_dir, sha1)
+
+    def _read_object(self, entry):
+        path = self._object_path(entry["sha1"])
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as f:
+            return f.read()
+
+    def _save_index(self):
+        write_text_atomic(self.index_path, json.dumps(self.index))
+        self.dirty = False
+        self.saved_at = time.time()
+
+    def _index_changed(self):
+        # Called with the lock held: the index is only written once save_interval has passed since the last write
+        self.dirty = True
+        if time.time() - self.saved_at >= self.save_interval:
+            self._save_index()
+
+    def flush(self):
+        '''
+        Writes the index to disk if it changed since it was last written
+        '''
+        with self.lock:
+            if self.dirty:
+                self._save_index()
+
+    def close(self):
+        '''
+        Writes the index to disk (see flush). The cache can still be used afterwards.
+        '''
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _count(self, status, num_bytes=0):
+        with self.lock:
+            self.stats[status] += 1
+            self.stats["bytes_downloaded"] += num_bytes
+
+    def fetch(self, url, ttl=None):
+        '''
+        Returns the body of url, from the cache when possible.
+
+        Arguments:
+        - url => url to GET
+        - ttl => (Optional) number of seconds the cached response is used without revalidating it. Default is
+          the cache's ttl.
+
+        Returns:
+        - body => content of the response, as bytes
+        - info => dictionary with the 'status' of the request ("fresh": no request made, "not_modified":
+          revalidated with a 304, "downloaded": new content, "stale": revalidation failed and the cached body
+          was used), the 'sha1' of the body and the number of 'bytes_downloaded'
+        '''
+        ttl = self.ttl if ttl is None else ttl
+        with self.lock:
+            entry = self.index.get(url)
+            entry = dict(entry) if entry is not None else None
+        body = self._read_object(entry) if entry is not None else None
+        if body is None:
+            entry = None
+
+        now = time.time()
+        if entry is not None and now - entry["validated_at"] < ttl:
+            self._touch(url, now)
+            self._count("fresh")
+            return body, {"status": "fresh", "sha1": entry["sha1"], "bytes_downloaded": 0}
+
+        headers = {}
+        if entry is not None:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        try:
+            response = self._session().get(url, headers=headers, timeout=self.timeout)
+            if response.status_code != 304:
+                response.raise_for_status()
+        except self.requests.RequestException:
+            if entry is None or not self.stale_if_error:
+                raise
+            self._touch(url, now)
+            self._count("stale")
+            return body, {"status": "stale", "sha1": entry["sha1"], "bytes_downloaded": 0}
+
+        if response.status_code == 304 and entry is not None:
+            with self.lock:
+                if url in self.index:
+                    self.index[url]["validated_at"] = now
+                    self.index[url]["last_used"] = now
+                    self._index_changed()
+            self._count("not_modified")
+            return body, {"status": "not_modified", "sha1": entry["sha1"], "bytes_downloaded": 0}
+
+        body = response.content
+        sha1 = hashlib.sha1(body).hexdigest()
+        write_bytes_atomic(self._object_path(sha1), body)
+        with self.lock:
+            previous = self.index.get(url)
+            self.index[url] = {"sha1": sha1, "size": len(body), "etag": response.headers.get("ETag"),
+                               "last_modified": response.headers.get("Last-Modified"),
+                               "validated_at": now, "last_used": now}
+            if previous is not None and previous["sha1"] != sha1:
+                self._remove_object(previous["sha1"])
+            self._evict()
+            self._index_changed()
+        self._count("downloaded", len(body))
+        return body, {"status": "downloaded", "sha1": sha1, "bytes_downloaded": len(body)}
+
+    def stats_view(self):
+        '''
+        Returns a HttpCacheView of this cache, with its own request statistics
+        '''
+        return HttpCacheView(self)
+
+    def _touch(self, url, now):
+        with self.lock:
+            if url in self.index:
+                self.index[url]["last_used"] = now
+                self._index_changed()
+
+    def _evict(self):
+        # Bodies are shared by all the urls with the same content, so sizes are counted once per object, and an
+        # object is only removed with the last url referencing it
+        sizes = {}
+        references = {}
+        for entry in self.index.values():
+            sizes[entry["sha1"]] = entry["size"]
+            references[entry["sha1"]] = references.get(entry["sha1"], 0) + 1
+        total = sum(sizes.values())
+        if total <= self.max_bytes:
+            return
+        for url in sorted(self.index, key=lambda url: self.index[url]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            sha1 = self.index.pop(url)["sha1"]
+            references[sha1] -= 1
+            if references[sha1] == 0:
+                total -= sizes[sha1]
+                if os.path.exists(self._object_path(sha1)):
+                    os.remove(self._object_path(sha1))
+
+    def _remove_object(self, sha1):
+        if any(entry["sha1"] == sha1 for entry in self.index.values()):
+            return
+        if os.path.exists(self._object_path(sha1)):
+            os.remove(self._object_path(sha1))
+
+    def _remove_unreferenced_objects(self):
+        if not os.path.isdir(self.objects_dir):
+            return
+        referenced = {entry["sha1"] for entry in self.index.values()}
+        for file_name in os.listdir(self.objects_dir):
+            if file_name not in referenced and not file_name.startswith(".tmp-"):
+                os.remove(os.path.join(self.objects_dir, file_name))
+
+    def clear(self):
+        '''
+        Removes all the cached responses
+        '''
+        with self.lock:
+            self.index = {}
+            self._remove_unreferenced_objects()
+            self._save_index()
+
+
+class HttpCacheView(_CacheReader):
+    '''
+    View of a HttpCache that counts the requests made through it in its own stats (e.g. one view per update step),
+    while sharing the cache itself
+    '''
+    def __init__(self, cache):
+        self.cache = cache
+        self.stats = dict.fromkeys(cache.stats, 0)
+        self.lock = threading.Lock()
+
+    def fetch(self, url, ttl=None):
+        body, info = self.cache.fetch(url, ttl=ttl)
+        with self.lock:
+            self.stats[info["status"]] += 1
+            self.stats["bytes_downloaded"] += info["bytes_downloaded"]
+        return body, info
+
+    def flush(self):
+        '''
+        Writes the index of the cache to disk, see HttpCache.flush
+        '''
+        self.cache.flush()
@@ -0,0 +1,311 @@
+"""
+Contains the page fetchers used by the scrapers to get the source of web pages, and the functions used to fetch
+many web pages concurrently, with a bounded number of workers, per-host rate limiting, and readiness waits
+instead of fixed sleeps.
+
+All fetchers share the PageFetcher interface:
+- SeleniumPagePool => renders pages in (a pool of) Selenium browsers
+- HttpPageFetcher => plain HTTP GET requests, for pages that don't need JavaScript
+- ReplayPageFetcher => reads pages previously saved to disk (e.g. with RecordingPageFetcher), for offline runs and tests
+
+Authored by: Nicholas Sadjoli (Github @NickSadjoli)
+Co-authored by: Josephine Monica (Github @josephinemonica)
+"""
+
+import os
+import queue
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+default_min_interval = 0.5 #seconds between two requests to the same host
+default_wait_timeout = 10
+default_ready_timeout = 5
+default_ready_class = "footerlinks" #last element of every Worldometer page
+
+
+class HostRateLimiter():
+    '''
+    Makes sure that requests to the same host are at least min_interval seconds apart, across all threads
+    '''
+    def __init__(self, min_interval=default_min_interval):
+        self.min_interval = min_interval
+        self.next_request_time = {}
+        self.lock = threading.Lock()
+
+    def wait(self, url):
+        host = urlparse(url).netloc
+        with self.lock:
+            now = time.monotonic()
+            request_time = max(now, self.next_request_time.get(host, now))
+            self.next_request_time[host] = request_time + self.min_interval
+        if request_time > now:
+            time.sleep(request_time - now)
+
+
+class PageFetcher():
+    '''
+    Interface of all page fetchers
+    '''
+    def get(self, url):
+        '''
+        Returns the source of the page at url, as a string
+        '''
+        raise NotImplementedError
+
+    def close(self):
+        '''
+        Releases the resources (browsers, connections) held by the fetcher
+        '''
+        pass
+
+
+class SeleniumPagePool(PageFetcher):
+    '''
+    Pool of Selenium drivers, so that several pages can be rendered at the same time. Drivers are created
+    lazily (up to max_drivers) with driver_factory, and each page is returned once the ready_class element
+    is present instead of after a fixed sleep.
+    '''
+    def __init__(self, max_drivers=1, driver_factory=None, drivers=None, wait_timeout=default_ready_timeout,
+                 ready_class=default_ready_class):
+        if driver_factory is None:
+            from selenium import webdriver
+            driver_factory = webdriver.Chrome
+        self.driver_factory = driver_factory
+        self.max_drivers = max_drivers
+        self.wait_timeout = wait_timeout
+        self.ready_class = ready_class
+
+        self.idle_drivers = queue.Queue()
+        self.own_drivers = []
+        self.num_drivers = 0
+        self.lock = threading.Lock()
+        for driver in (drivers or []):
+            self.idle_drivers.put(driver)
+            self.num_drivers += 1
+
+    def _acquire_driver(self):
+        with self.lock:
+            can_create = self.num_drivers < self.max_drivers and self.idle_drivers.empty()
+            if can_create:
+                self.num_drivers += 1
+        if can_create:
+            driver = self.driver_factory()
+            self.own_drivers.append(driver)
+            return driver
+        return self.idle_drivers.get()
+
+    def wait_until_ready(self, driver):
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support.ui import WebDriverWait
+        from selenium.webdriver.support import expected_conditions as EC
+        from selenium.common.exceptions import TimeoutException
+        try:
+            WebDriverWait(driver, self.wait_timeout).until(
+                EC.presence_of_element_located((By.CLASS_NAME, self.ready_class)) )
+        except TimeoutException:
+            pass
+
+    def get(self, url):
+        driver = self._acquire_driver()
+        try:
+            driver.get(url)
+            self.wait_until_ready(driver)
+            return driver.page_source
+        finally:
+            self.idle_drivers.put(driver)
+
+    def close(self):
+        '''
+        Quits the drivers created by the pool (drivers given to the pool are left open)
+        '''
+        for driver in self.own_drivers:
+            driver.quit()
+        self.own_drivers = []
+
+
+class HttpPageFetcher(PageFetcher):
+    '''
+    Fetches pages with plain HTTP GET requests, for pages whose content doesn't need JavaScript to be rendered
+    (e.g. the Highcharts data of Worldometer pages, which is inline in <script> tags)
+    '''
+    def __init__(self, timeout=default_wait_timeout, headers=None):
+        import requests
+        self.timeout = timeout
+        self.headers = headers if headers is not None else {"User-Agent": "Mozilla/5.0"}
+        self.local = threading.local()
+        self.requests = requests
+
+    def get(self, url):
+        # requests Sessions aren't guaranteed to be thread-safe, so every thread gets its own
+        session = getattr(self.local, "session", None)
+        if session is None:
+            session = self.local.session = self.requests.Session()
+        response = session.get(url, timeout=self.timeout, headers=self.headers)
+        response.raise_for_status()
+        return response.text
+
+    def close(self):
+        session = getattr(self.local, "session", None)
+        if session is not None:
+            session.close()
+
+
+def url_to_file_name(url):
+    '''
+    Returns the file name a page is saved under by RecordingPageFetcher,
+    e.g. "https://www.worldometers.info/coronavirus/country/us/" ---> "www.worldometers.info_coronavirus_country_us.html"
+    '''
+    parsed = urlparse(url)
+    name = (parsed.netloc + parsed.path).strip("/")
+    if parsed.query:
+        name += "_" + parsed.query
+    name = re.sub(r"[^A-Za-z0-9.\-]+", "_", name)
+    if not name.endswith(".html"):
+        name += ".html"
+    return name
+
+
+class ReplayPageFetcher(PageFetcher):
+    '''
+    Returns pages saved in a folder (see url_to_file_name) instead of fetching them
+    '''
+    def __init__(self, pages_dir):
+        self.pages_dir = pages_dir
+
+    def get(self, url):
+        path = os.path.join(self.pages_dir, url_to_file_name(url))
+        if not os.path.exists(path):
+            raise FileNotFoundError("No saved page for {} (expected {})".format(url, path))
+        with open(path, encoding="utf-8") as f:
+            return f.read()
+
+
+class RecordingPageFetcher(PageFetcher):
+    '''
+    Fetches pages with another fetcher, and saves a copy of each of them in a folder so that they can be
+    replayed later with ReplayPageFetcher
+    '''
+    def __init__(self, fetcher, pages_dir):
+        self.fetcher = fetcher
+        self.pages_dir = pages_dir
+        os.makedirs(pages_dir, exist_ok=True)
+
+    def get(self, url):
+        page_source = self.fetcher.get(url)
+        with open(os.path.join(self.pages_dir, url_to_file_name(url)), "w", encoding="utf-8") as f:
+            f.write(page_source)
+        return page_source
+
+    def close(self):
+        self.fetcher.close()
+
+
+class CountingPageFetcher(PageFetcher):
+    '''
+    Fetches pages with another fetcher, counting the pages and bytes fetched through it. Closing it leaves the
+    other fetcher open, so that several CountingPageFetchers can share it.
+    '''
+    def __init__(self, fetcher):
+        self.fetcher = fetcher
+        self.pages = 0
+        self.bytes = 0
+        self.lock = threading.Lock()
+
+    def get(self, url):
+        page_source = self.fetcher.get(url)
+        with self.lock:
+            self.pages += 1
+            self.bytes += len(page_source.encode("utf-8"))
+        return page_source
+
+
+def base_page_fetcher(fetcher):
+    '''
+    Returns the fetcher wrapped by fetcher (e.g. by a RecordingPageFetcher or a CountingPageFetcher), if any
+    '''
+    while hasattr(fetcher, "fetcher"):
+        fetcher = fetcher.fetcher
+    return fetcher
+
+def make_page_fetcher(backend="selenium", driver=None, pages_dir=None, max_drivers=1):
+    '''
+    Creates a page fetcher from its backend name.
+
+    Arguments:
+    - backend => "selenium", "http" or "replay"
+    - driver => (Optional) Selenium driver to use (for the "selenium" backend)
+    - pages_dir => (Optional) folder of the saved pages (required for the "replay" backend)
+    - max_drivers => (Optional) maximum number of Selenium drivers used at the same time
+    '''
+    if backend == "selenium":
+        return SeleniumPagePool(max_drivers=max_drivers, drivers=[driver] if driver is not None else None)
+    elif backend == "http":
+        return HttpPageFetcher()
+    elif backend == "replay":
+        if pages_dir is None:
+            raise ValueError("The replay backend needs a pages_dir")
+        return ReplayPageFetcher(pages_dir)
+    raise ValueError("Unknown page fetcher backend: {}".format(backend))
+
+def as_page_fetcher(fetcher_or_driver):
+    '''
+    Returns fetcher_or_driver if it already is a PageFetcher, and wraps it in a SeleniumPagePool if it is
+    a Selenium driver. None gives a SeleniumPagePool that starts its own browser.
+    '''
+    if isinstance(fetcher_or_driver, PageFetcher):
+        return fetcher_or_driver
+    if fetcher_or_driver is None:
+        return SeleniumPagePool()
+    return SeleniumPagePool(drivers=[fetcher_or_driver])
+
+
+def iter_pages(fetcher, urls, n_workers=1, rate_limiter=None, verbose=False):
+    '''
+    Fetches all the given urls with fetcher.get, using up to n_workers threads at the same time, and yields
+    the page sources in the same order as urls as soon as they are available. At most 2 * n_workers pages are
+    fetched ahead of the one being consumed, so that the pages don't pile up in memory when the consumer is slower
+    than the fetchers.
+
+    Arguments:
+    - fetcher => object with a get(url) function returning the page source (e.g. SeleniumPagePool, HttpPageFetcher)
+    - urls => list (or iterable) of urls to fetch
+    - n_workers => (Optional) maximum number of pages fetched at the same time
+    - rate_limiter => (Optional) HostRateLimiter shared by all the workers. Default is a new HostRateLimiter.
+    '''
+    if rate_limiter is None:
+        rate_limiter = HostRateLimiter()
+
+    def fetch_one(url):
+        rate_limiter.wait(url)
+        if verbose:
+            print("Fetching", url)
+        return fetcher.get(url)
+
+    if n_workers <= 1:
+        for url in urls:
+            yield fetch_one(url)
+        return
+    max_in_flight = 2 * n_workers
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        in_flight = deque()
+        try:
+            for url in urls:
+                if len(in_flight) == max_in_flight:
+                    yield in_flight.popleft().result()
+                in_flight.append(executor.submit(fetch_one, url))
+            while in_flight:
+                yield in_flight.popleft().result()
+        finally:
+            #the consumer stopped early (or a fetch failed): don't fetch the pages that haven't started yet
+            for future in in_flight:
+                future.cancel()
+
+def fetch_pages(fetcher, urls, n_workers=1, rate_limiter=None, verbose=False):
+    '''
+    Same as iter_pages, but returns the list of all page sources
+    '''
+    return list(iter_pages(fetcher, urls, n_workers=n_workers, rate_limiter=rate_limiter, verbose=verbose))
@@ -0,0 +1,153 @@
+"""
+Contains the dense on-disk panel format used to store region x date x metric time series. A panel is a folder
+with an index.json file (regions, dates and metrics) and a values.f32 file holding a float32 array of shape
+(regions, dates, metrics), which is memory-mapped when read. Several processes opening the same panel share
+one copy of it in the page cache, and slicing a region or date range only reads the pages it needs.
+
+Authored by: Nicholas Sadjoli (Github @NickSadjoli)
+Co-authored by: Josephine Monica (Github @josephinemonica)
+"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from data_processing import make_region_names
+from data_store import default_input_dir, load_csv
+
+index_file_name = "index.json"
+values_file_name = "values.f32"
+default_panel_dir = os.path.join(default_input_dir, ".cache", "panels")
+
+
+def write_panel(path, regions, dates, metrics, values):
+    '''
+    Writes a panel folder.
+
+    Arguments:
+    - path => folder to write the panel to (created if needed)
+    - regions => list of region names
+    - dates => list of dates (anything pd.to_datetime accepts)
+    - metrics => list of metric names
+    - values => array of shape (len(regions), len(dates), len(metrics)), missing values as NaN
+    '''
+    os.makedirs(path, exist_ok=True)
+    shape = (len(regions), len(dates), len(metrics))
+    values = np.asarray(values, dtype=np.float32)
+    if values.shape != shape:
+        raise ValueError("values has shape {}, expected {}".format(values.shape, shape))
+
+    memmap = np.memmap(os.path.join(path, values_file_name), dtype=np.float32, mode="w+", shape=shape)
+    memmap[:] = values
+    memmap.flush()
+    del memmap
+
+    index = {"regions": [str(region) for region in regions],
+             "dates": [str(date) for date in pd.to_datetime(pd.Series(dates)).dt.strftime("%Y-%m-%d")],
+             "metrics": [str(metric) for metric in metrics],
+             "shape": list(shape)}
+    with open(os.path.join(path, index_file_name), "w") as f:
+        json.dump(index, f)
+
+def panel_from_long(df, metrics, region_column="Region", date_column="Date"):
+    '''
+    Reshapes a long DataFrame (one row per region and date, e.g. train.csv) into panel arrays. If df has no
+    region_column, regions are named "<Country_Region>_<Province_State>" as in data_processing.preprocess.
+
+    Returns:
+    - regions, dates, metrics, values => arguments for write_panel
+    '''
+    regions_per_row = df[region_column] if region_column in df.columns else make_region_names(df)
+    region_codes, regions = pd.factorize(np.asarray(regions_per_row))
+    date_codes, dates = pd.factorize(pd.to_datetime(df[date_column]), sort=True)
+
+    values = np.full((len(regions), len(dates), len(metrics)), np.nan, dtype=np.float32)
+    for j, metric in enumerate(metrics):
+        values[region_codes, date_codes, j] = df[metric].to_numpy(dtype=np.float32)
+    return list(regions), list(dates), list(metrics), values
+
+def panel_from_worldometer(df, year=2020, region_column="Country", metric_column="Data Type"):
+    '''
+    Reshapes a wide Worldometer time series DataFrame (one row per country and data type, one column per
+    "Mon DD" date, e.g. Worldometer_COVID19-Countries_TimeSeries.csv) into panel arrays.
+
+    Returns:
+    - regions, dates, metrics, values => arguments for write_panel
+    '''
+    date_columns = [column for column in df.columns if column not in [region_column, metric_column, "Unnamed: 0"]]
+    dates = pd.to_datetime(["{} {}".format(column, year) for column in date_columns], format="%b %d %Y")
+
+    region_codes, regions = pd.factorize(np.asarray(df[region_column]))
+    metric_codes, metrics = pd.factorize(np.asarray(df[metric_column]))
+    values = np.full((len(regions), len(dates), len(metrics)), np.nan, dtype=np.float32)
+    cells = df[date_columns].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=np.float32)
+    values[region_codes, :, metric_codes] = cells
+    return list(regions), list(dates), list(metrics), values
+
+def build_panels(input_dir=default_input_dir, panel_dir=default_panel_dir):
+    '''
+    Builds the panels of train.csv (ConfirmedCases, Fatalities) and of the Worldometer countries time series
+    '''
+    train = load_csv(os.path.join(input_dir, "train.csv"))
+    write_panel(os.path.join(panel_dir, "train"), *panel_from_long(train, ["ConfirmedCases", "Fatalities"]))
+
+    worldometer = load_csv(os.path.join(input_dir, "Worldometer_COVID19-Countries_TimeSeries.csv"))
+    write_panel(os.path.join(panel_dir, "worldometer_countries"), *panel_from_worldometer(worldometer))
+
+
+class Panel():
+    '''
+    Read-only, memory-mapped view of a panel folder. Slicing methods return views of the memory map, so only
+    the pages that are actually used get read from disk.
+    '''
+    def __init__(self, path):
+        with open(os.path.join(path, index_file_name)) as f:
+            index = json.load(f)
+        self.regions = index["regions"]
+        self.dates = pd.to_datetime(index["dates"])
+        self.metrics = index["metrics"]
+        self.values = np.memmap(os.path.join(path, values_file_name), dtype=np.float32, mode="r",
+                                shape=tuple(index["shape"]))
+
+        self.region_index = {region: i for i, region in enumerate(self.regions)}
+        self.metric_index = {metric: i for i, metric in enumerate(self.metrics)}
+
+    def _date_slice(self, start=None, end=None):
+        # start and end are both inclusive, as with DataFrame.loc
+        first = 0 if start is None else self.dates.searchsorted(pd.Timestamp(start), side="left")
+        last = len(self.dates) if end is None else self.dates.searchsorted(pd.Timestamp(end), side="right")
+        return slice(first, last)
+
+    def get(self, region=None, start=None, end=None, metric=None):
+        '''
+        Returns a view of the values for one region (or all if None), the dates between start and end (both
+        inclusive, or all if None) and one metric (or all if None). Dimensions of the given region/metric
+        are dropped.
+        '''
+        region_ix = slice(None) if region is None else self.region_index[region]
+        metric_ix = slice(None) if metric is None else self.metric_index[metric]
+        return self.values[region_ix, self._date_slice(start, end), metric_ix]
+
+    def region_frame(self, region, start=None, end=None):
+        '''
+        Returns a DataFrame (dates x metrics) of one region
+        '''
+        date_slice = self._date_slice(start, end)
+        return pd.DataFrame(self.values[self.region_index[region], date_slice, :],
+                            index=self.dates[date_slice], columns=self.metrics)
+
+    def metric_frame(self, metric, start=None, end=None):
+        '''
+        Returns a DataFrame (dates x regions) of one metric
+        '''
+        date_slice = self._date_slice(start, end)
+        return pd.DataFrame(self.values[:, date_slice, self.metric_index[metric]].T,
+                            index=self.dates[date_slice], columns=self.regions)
+
+
+if __name__ == "__main__":
+    build_panels()
+    panel = Panel(os.path.join(default_panel_dir, "train"))
+    print(panel.values.shape)
+    print(panel.region_frame("Indonesia_nan", start="2020-04-01"))
@@ -0,0 +1,391 @@
+"""
+Contains the content-addressed cache of the outputs of the data pipeline stages (join, preprocess, split, and
+interpret's Marginal().explain_data), so that re-running a notebook or a backtest on unchanged data reads the
+stored outputs back instead of computing them again. Outputs are keyed by the content of their inputs (SHA-1
+of the input files, hash of the input DataFrames), the stage parameters and the source of the stage function
+and of the modules it depends on (see the code_files of memoize). DataFrames are stored as Feather files when
+pyarrow is installed (it is listed in requirements.txt), and as pickles otherwise (see data_store). The least
+recently used outputs are evicted once the cache exceeds its size.
+
+The index of the stored outputs is kept in memory and written to disk when outputs are stored, and otherwise at
+most once every save_interval seconds (or by flush), so that reading outputs back doesn't rewrite it every time.
+
+The load stage is data_store.load_csv, which already keeps its own columnar cache of every CSV file.
+
+Authored by: Josephine Monica (Github @josephinemonica)
+Co-authored by: Nicholas Sadjoli (Github @NickSadjoli)
+"""
+import hashlib
+import importlib
+import inspect
+import json
+import os
+import pickle
+import shutil
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from data_store import _read_frame, _write_frame, default_input_dir, file_hash, write_text_atomic
+
+default_cache_dir = os.path.join(default_input_dir, ".cache", "pipeline")
+default_max_bytes = 1024 * 2**20
+default_save_interval = 5.0 #seconds between two writes of the index when only the last use of outputs changed
+index_file_name = "index.json"
+
+# (path, mtime_ns, size) ---> SHA-1 of the file, so that unchanged files are only hashed once per session
+_file_hashes = {}
+
+
+def input_file_hash(path):
+    '''
+    Returns the SHA-1 of the content of the file at path, memoized on its modification time and size
+    '''
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    if memo_key not in _file_hashes:
+        _file_hashes[memo_key] = file_hash(path)
+    return _file_hashes[memo_key]
+
+def frame_hash(df):
+    '''
+    Returns a SHA-1 of the content of a DataFrame, Series or Index: values, index, column names and dtypes
+    '''
+    sha1 = hashlib.sha1()
+    if isinstance(df, pd.DataFrame):
+        sha1.update(json.dumps([str(column) for column in df.columns]).encode("utf-8"))
+        sha1.update(json.dumps([str(dtype) for dtype in df.dtypes]).encode("utf-8"))
+    else:
+        sha1.update(json.dumps([str(df.name), str(df.dtype)]).encode("utf-8"))
+    index = isinstance(df, (pd.DataFrame, pd.Series))
+    sha1.update(pd.util.hash_pandas_object(df, index=index).to_numpy().tobytes())
+    return sha1.hexdigest()
+
+def fingerprint(value, input_files=()):
+    '''
+    Returns a JSON-serializable description of a stage argument that only depends on its content: DataFrames,
+    Series and arrays are hashed, paths of input_files are replaced by the hash of the file content, and
+    containers are described item by item.
+    '''
+    if isinstance(value, (pd.DataFrame, pd.Series, pd.Index)):
+        return {"frame": frame_hash(value)}
+    if isinstance(value, np.ndarray):
+        if value.dtype == object:
+            return {"frame": frame_hash(pd.Series(value.ravel())), "shape": value.shape}
+        return {"array": hashlib.sha1(np.ascontiguousarray(value).tobytes()).hexdigest(), "dtype": str(value.dtype),
+                "shape": value.shape}
+    if isinstance(value, str) and value in input_files:
+        return {"file": input_file_hash(value)}
+    if isinstance(value, (list, tuple)):
+        return [fingerprint(item, input_files) for item in value]
+    if isinstance(value, dict):
+        return {str(key): fingerprint(item, input_files) for key, item in value.items()}
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if callable(value):
+        return code_fingerprint(value)
+    return repr(value)
+
+def code_fingerprint(func, code_files=()):
+    '''
+    Returns a description of the code of func, so that editing it invalidates the outputs it computed: the hash
+    of its source file (e.g. data_processing.py for preprocess), else of its own source (e.g. functions defined
+    in a notebook), else its name.
+    Only the file of func itself is found automatically: the source files of the modules it calls (e.g.
+    feature_generation.py for preprocess) have to be given in code_files, whose hashes are added to the description.
+    '''
+    name = "{}.{}".format(getattr(func, "__module__", ""), getattr(func, "__qualname__", repr(func)))
+    description = {"function": name}
+    if len(code_files) > 0:
+        description["code_files"] = {os.path.basename(path): input_file_hash(path) for path in code_files}
+    try:
+        source_file = inspect.getsourcefile(func)
+        if source_file is not None and os.path.isfile(source_file):
+            description["file"] = input_file_hash(source_file)
+        else:
+            source = inspect.getsource(func)
+            description["source"] = hashlib.sha1(source.encode("utf-8")).hexdigest()
+    except (TypeError, OSError):
+        pass
+    return description
+
+def module_files(*module_names):
+    '''
+    Returns the source files of the given modules, e.g. module_files("feature_generation", "data_store"), to be
+    used as the code_files of a stage
+    '''
+    return [inspect.getsourcefile(importlib.import_module(module_name)) for module_name in module_names]
+
+
+class PipelineCache():
+    '''
+    On-disk cache of the outputs of pipeline stages, safe to share between threads.
+
+    Outputs can be DataFrames, Series, lists/tuples of them (e.g. preprocess's (X, Y)), or any picklable object
+    (e.g. the folds of split_train_val_indices, explanations of interpret). DataFrames and Series are stored
+    as columnar files with their index.
+
+    Arguments:
+    - cache_dir => (Optional) folder of the cache
+    - max_bytes => (Optional) maximum total size of the stored outputs, least recently used ones are evicted first
+    - save_interval => (Optional) minimum number of seconds between two writes of the index when outputs are only
+      read back. The index is always written when an output is stored, and by flush.
+    '''
+    def __init__(self, cache_dir=default_cache_dir, max_bytes=default_max_bytes, save_interval=default_save_interval):
+        self.cache_dir = cache_dir
+        self.objects_dir = os.path.join(cache_dir, "objects")
+        self.index_path = os.path.join(cache_dir, index_file_name)
+        self.max_bytes = max_bytes
+        self.save_interval = save_interval
+
+        self.lock = threading.Lock()
+        self.index = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                self.index = json.load(f)
+        self.dirty = False
+        self.saved_at = time.time()
+        self.stats = {"hit": 0, "miss": 0, "not_stored": 0}
+
+    def key(self, stage, func, args=(), kwargs=None, input_files=(), code_files=()):
+        '''
+        Returns the key of the output of func(*args, **kwargs) for the given stage name, see fingerprint and
+        code_fingerprint
+        '''
+        description = {"stage": stage, "code": code_fingerprint(func, code_files),
+                       "args": fingerprint(list(args), input_files),
+                       "kwargs": fingerprint(kwargs or {}, input_files)}
+        return hashlib.sha1(json.dumps(description, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    def _object_dir(self, key):
+        return os.path.join(self.objects_dir, key)
+
+    def _save_index(self):
+        write_text_atomic(self.index_path, json.dumps(self.index))
+        self.dirty = False
+        self.saved_at = time.time()
+
+    def flush(self):
+        '''
+        Writes the index to disk if it changed since it was last written
+        '''
+        with self.lock:
+            if self.dirty:
+                self._save_index()
+
+    def _write_value(self, value, path):
+        # Returns the description of how value was stored, used by _read_value to read it back
+        if isinstance(value, (list, tuple)) and not isinstance(value, str):
+            parts = [self._write_value(item, "{}-{}".format(path, i)) for i, item in enumerate(value)]
+            return {"kind": "tuple" if isinstance(value, tuple) else "list", "parts": parts}
+        if isinstance(value, (pd.DataFrame, pd.Series)):
+            is_series = isinstance(value, pd.Series)
+            df = value.to_frame(name="value") if is_series else value
+            # The index is stored as columns, which also requires string column names for Feather
+            index_columns = ["__index_{}__".format(i) for i in range(df.index.nlevels)]
+            stored = df.rename_axis(index=index_columns)
+            stored.columns = ["__column_{}__".format(i) for i in range(df.shape[1])]
+            file_format = _write_frame(stored.reset_index(), path)
+            return {"kind": "series" if is_series else "frame", "format": file_format,
+                    "index_names": list(df.index.names), "columns": pickle.dumps(list(df.columns)).hex(),
+                    "columns_name": df.columns.name, "name": value.name if is_series else None}
+        with open(path + ".pkl", "wb") as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        return {"kind": "pickle"}
+
+    def _read_value(self, stored, path):
+        if stored["kind"] in ["tuple", "list"]:
+            parts = [self._read_value(part, "{}-{}".format(path, i)) for i, part in enumerate(stored["parts"])]
+            return tuple(parts) if stored["kind"] == "tuple" else parts
+        if stored["kind"] in ["frame", "series"]:
+            df = _read_frame(path, stored["format"])
+            df = df.set_index(list(df.columns[:len(stored["index_names"])]))
+            df.index.names = stored["index_names"]
+            df.columns = pd.Index(pickle.loads(bytes.fromhex(stored["columns"])), name=stored["columns_name"])
+            if stored["kind"] == "series":
+                return df.iloc[:, 0].rename(stored["name"])
+            return df
+        with open(path + ".pkl", "rb") as f:
+            return pickle.load(f)
+
+    def get(self, key):
+        '''
+        Returns (True, output) if the output of key is stored, (False, None) otherwise
+        '''
+        with self.lock:
+            entry = self.index.get(key)
+        if entry is None:
+            return False, None
+        try:
+            value = self._read_value(entry["stored"], os.path.join(self._object_dir(key), "value"))
+        except (OSError, ValueError, KeyError, pickle.UnpicklingError):
+            # e.g. files removed by hand, or written by an incompatible version of pandas
+            with self.lock:
+                self.index.pop(key, None)
+                self._remove_object(key)
+                self._save_index()
+            return False, None
+        with self.lock:
+            if key in self.index:
+                self.index[key]["last_used"] = time.time()
+                self.dirty = True
+                if time.time() - self.saved_at >= self.save_interval:
+                    self._save_index()
+        return True, value
+
+    def put(self, key, stage, value):
+        '''
+        Stores value as the output of key. Returns False if it can't be stored (e.g. it isn't picklable).
+        '''
+        object_dir = self._object_dir(key)
+        # Written to a temporary folder, only renamed once complete so that a stored output is never partial
+        tmp_dir = "{}.tmp-{}-{}".format(object_dir, os.getpid(), threading.get_ident())
+        os.makedirs(tmp_dir, exist_ok=True)
+        try:
+            stored = self._write_value(value, os.path.join(tmp_dir, "value"))
+            size = sum(os.path.getsize(os.path.join(tmp_dir, file_name)) for file_name in os.listdir(tmp_dir))
+            with self.lock:
+                if os.path.exists(object_dir):
+                    shutil.rmtree(object_dir)
+                os.replace(tmp_dir, object_dir)
+                now = time.time()
+                self.index[key] = {"stage": stage, "stored": stored, "size": size, "created": now, "last_used": now}
+                self._evict()
+                self._save_index()
+        except (pickle.PicklingError, TypeError, AttributeError):
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return False
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        return True
+
+    def memoize(self, stage, func, args=(), kwargs=None, input_files=(), code_files=()):
+        '''
+        Returns func(*args, **kwargs), from the cache when the same stage already ran on the same inputs.
+
+        Arguments:
+        - stage => name of the stage, e.g. "preprocess"
+        - func => function computing the output of the stage
+        - args, kwargs => (Optional) arguments of func. DataFrames and arrays are keyed by their content.
+        - input_files => (Optional) arguments of func that are paths of input files, keyed by the content of
+          the files instead of their path
+        - code_files => (Optional) source files of the modules func depends on (see module_files). Editing them
+          invalidates the stored outputs, like editing the file of func itself.
+        '''
+        key = self.key(stage, func, args, kwargs, input_files, code_files)
+        found, value = self.get(key)
+        if found:
+            with self.lock:
+                self.stats["hit"] += 1
+            return value
+        value = func(*args, **(kwargs or {}))
+        stored = self.put(key, stage, value)
+        with self.lock:
+            self.stats["miss" if stored else "not_stored"] += 1
+        return value
+
+    def _evict(self):
+        total = sum(entry["size"] for entry in self.index.values())
+        for key in sorted(self.index, key=lambda key: self.index[key]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            total -= self.index.pop(key)["size"]
+            self._remove_object(key)
+
+    def _remove_object(self, key):
+        if os.path.exists(self._object_dir(key)):
+            shutil.rmtree(self._object_dir(key))
+
+    def summary(self):
+        '''
+        Returns a DataFrame of the number of stored outputs and their size (in bytes) per stage
+        '''
+        with self.lock:
+            entries = pd.DataFrame([(entry["stage"], entry["size"]) for entry in self.index.values()],
+                                   columns=["Stage", "Size"])
+        return entries.groupby("Stage")["Size"].agg(["count", "sum"]).rename(columns={"count": "Outputs",
+                                                                                     "sum": "Bytes"})
+
+    def clear(self):
+        '''
+        Removes all the stored outputs
+        '''
+        with self.lock:
+            self.index = {}
+            if os.path.isdir(self.objects_dir):
+                shutil.rmtree(self.objects_dir)
+            self._save_index()
+
+
+def cached_preprocess(data, features, targets, feature_spec=None, cache=None):
+    '''
+    Same as data_processing.preprocess, through the cache (keyed by the content of the data file, or of the
+    DataFrame)
+    '''
+    from data_processing import preprocess
+    cache = PipelineCache() if cache is None else cache
+    return cache.memoize("preprocess", preprocess, args=(data, features, targets),
+                         kwargs={"feature_spec": feature_spec}, input_files=[data] if isinstance(data, str) else [],
+                         code_files=module_files("feature_generation", "data_store"))
+
+def cached_join_population_features(df, population_df, density_df, cache=None, **kwargs):
+    '''
+    Same as feature_join.join_population_features, through the cache (keyed by the content of the DataFrames)
+    '''
+    from feature_join import join_population_features
+    cache = PipelineCache() if cache is None else cache
+    return cache.memoize("join", join_population_features, args=(df, population_df, density_df), kwargs=kwargs,
+                         code_files=module_files("region_names", "data_store"))
+
+def cached_split_train_val_indices(regions, num_of_val_days, cache=None, **kwargs):
+    '''
+    Same as data_processing.split_train_val_indices, through the cache (keyed by the content of regions)
+    '''
+    from data_processing import split_train_val_indices
+    cache = PipelineCache() if cache is None else cache
+    return cache.memoize("split", split_train_val_indices, args=(regions, num_of_val_days), kwargs=kwargs)
+
+def _explain_data(X, y, name):
+    from interpret.data import Marginal
+    return Marginal().explain_data(X, y, name)
+
+def cached_explain_data(X, y, name, cache=None):
+    '''
+    Same as interpret's Marginal().explain_data(X, y, name), through the cache (keyed by the content of X and y)
+    '''
+    cache = PipelineCache() if cache is None else cache
+    return cache.memoize("explain_data", _explain_data, args=(X, y, name))
+
+def benchmark_cache(filename="../input/train.csv", features=['Region', "prev_ConfirmedCases", "prev_Fatalities", 'Days'],
+                    targets=["ConfirmedCases", "Fatalities"], cache_dir=None):
+    '''
+    Times preprocess and the split of a backtest without the cache, then through a fresh cache (first run) and
+    again (re-run), and checks that the cached outputs are the same.
+    '''
+    import tempfile
+    from data_processing import preprocess, split_train_val_indices
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache = PipelineCache(cache_dir or tmp_dir)
+        start = time.perf_counter()
+        X, Y = preprocess(filename, features, targets)
+        folds = split_train_val_indices(X["Region"], 10, num_folds=5)
+        print("No cache: {:.1f}ms".format(1000 * (time.perf_counter() - start)))
+        for run in ["first run", "re-run"]:
+            start = time.perf_counter()
+            cached_X, cached_Y = cached_preprocess(filename, features, targets, cache=cache)
+            cached_folds = cached_split_train_val_indices(cached_X["Region"], 10, num_folds=5, cache=cache)
+            print("Cache {}: {:.1f}ms".format(run, 1000 * (time.perf_counter() - start)))
+            pd.testing.assert_frame_equal(X, cached_X)
+            pd.testing.assert_frame_equal(Y, cached_Y)
+            assert all(np.array_equal(a, b) for fold, cached_fold in zip(folds, cached_folds)
+                       for a, b in zip(fold, cached_fold)), "Folds differ"
+        print(cache.stats)
+        print(cache.summary())
+
+
+if __name__ == "__main__":
+    benchmark_cache()
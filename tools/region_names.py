@@ -0,0 +1,276 @@
+"""
+Contains the table of aliases used to match the names of countries and regions across the data sources
+(train.csv, Worldometer, OECD, UN, Worldbank), the normalization of names into the keys they are joined on,
+and RegionResolver, which resolves names of any source to a reference list with a hash index of the normalized
+names, the aliases, and a trigram/edit distance fuzzy fallback.
+
+Authored by: Nicholas Sadjoli (Github @NickSadjoli)
+Co-authored by: Josephine Monica (Github @josephinemonica)
+"""
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+# Names used by the other data sources ---> names used by Worldometer. Both sides are normalized with
+# normalize_name before being compared, so differences of case, spacing, accents, apostrophes and '&' don't
+# need an alias.
+aliases = {
+    "Burma": "Myanmar",
+    "Korea, South": "South Korea",
+    "US": "United States",
+    "Taiwan*": "Taiwan",
+    "Congo (Brazzaville)": "Congo",
+    "Congo (Kinshasa)": "DR Congo",
+    "Czechia": "Czech Republic (Czechia)",
+    "West Bank and Gaza": "State of Palestine",
+    "Saint Vincent and the Grenadines": "St. Vincent & Grenadines",
+    "Macau": "Macao",
+    "St Martin": "Saint Martin",
+    "Falkland Islands (Malvinas)": "Falkland Islands",
+    "Bonaire, Sint Eustatius and Saba": "Caribbean Netherlands",
+    "Faroe Islands": "Faeroe Islands",
+    "Turks and Caicos Islands": "Turks and Caicos",
+    "Virgin Islands": "U.S. Virgin Islands",
+    # OECD
+    "Czech Republic": "Czech Republic (Czechia)",
+    "Slovak Republic": "Slovakia",
+    "Korea": "South Korea",
+    "Russian Federation": "Russia",
+    # UN M49 / Worldbank
+    "United States of America": "United States",
+    "United Kingdom of Great Britain and Northern Ireland": "United Kingdom",
+    "Republic of Korea": "South Korea",
+    "Democratic People's Republic of Korea": "North Korea",
+    "Democratic Republic of the Congo": "DR Congo",
+    "Viet Nam": "Vietnam",
+    "Iran (Islamic Republic of)": "Iran",
+    "Bolivia (Plurinational State of)": "Bolivia",
+    "Venezuela (Bolivarian Republic of)": "Venezuela",
+    "Syrian Arab Republic": "Syria",
+    "Lao People's Democratic Republic": "Laos",
+    "Republic of Moldova": "Moldova",
+    "United Republic of Tanzania": "Tanzania",
+    "Brunei Darussalam": "Brunei",
+    "Micronesia (Federated States of)": "Micronesia",
+    "China, Hong Kong Special Administrative Region": "Hong Kong",
+    "China, Macao Special Administrative Region": "Macao",
+    "United States Virgin Islands": "U.S. Virgin Islands",
+    "Wallis and Futuna Islands": "Wallis & Futuna",
+}
+
+
+def normalize_name(name):
+    '''
+    Returns the key a country or region name is matched on: accents removed, casefolded, '&' written as 'and',
+    typographic apostrophes as "'", and whitespace collapsed. Missing names (None/NaN) give "".
+    e.g. ' Côte d'Ivoire ' ---> "cote d'ivoire", 'Saint Kitts & Nevis' ---> "saint kitts and nevis"
+    '''
+    if name is None or (isinstance(name, float) and np.isnan(name)):
+        return ""
+    name = unicodedata.normalize("NFKD", str(name))
+    name = "".join(c for c in name if not unicodedata.combining(c))
+    return " ".join(name.replace("&", " and ").replace("\u2019", "'").split()).casefold()
+
+_alias_keys = {normalize_name(alias): normalize_name(name) for alias, name in aliases.items()}
+
+def name_key(name):
+    '''
+    Returns the normalized key of name, after replacing it by its Worldometer name if it has an alias
+    '''
+    key = normalize_name(name)
+    return _alias_keys.get(key, key)
+
+def name_keys(names):
+    '''
+    Vectorized name_key: returns the keys of a column of names as a numpy array of strings. Each distinct name
+    is only normalized once.
+    '''
+    codes, uniques = pd.factorize(pd.Series(names), sort=False)
+    unique_keys = np.array([name_key(name) for name in uniques] + [""], dtype=object)
+    # missing names have code -1, i.e. the last key ""
+    return unique_keys[codes]
+
+def trigrams(key):
+    '''
+    Returns the set of the 3-character substrings of a normalized key, padded so that short keys have some too
+    '''
+    padded = "  " + key + " "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def edit_distance(a, b, max_distance=None):
+    '''
+    Returns the Levenshtein distance between the strings a and b. If max_distance is given, the computation stops
+    as soon as the distance is known to be larger, and max_distance + 1 is returned.
+    '''
+    if len(a) < len(b):
+        a, b = b, a
+    if max_distance is not None and len(a) - len(b) > max_distance:
+        return max_distance + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if max_distance is not None and min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+    return previous[-1]
+
+
+class RegionResolver():
+    '''
+    Resolves the country or region names of any source (train.csv, Worldometer, OECD, UN, Worldbank) to the names
+    of a reference list, e.g. the countries of Worldometer's population data. Names are resolved by:
+    - exact => same normalized key (see normalize_name), through a hash index of the reference names
+    - alias => normalized key of an alias (see aliases) of a reference name
+    - fuzzy => closest reference name by edit distance, among the ones sharing the most trigrams with the name.
+      Only used when exactly one reference name is similar enough (min_similarity), so that a typo or a
+      missing word gets resolved but two different countries don't.
+    Results are memoized per name, so resolving a column costs one lookup per distinct name.
+
+    Arguments:
+    - names => reference names, e.g. population_df['Country (or dependency)'].unique()
+    - extra_aliases => (Optional) dictionary of {alias: reference name}, on top of the aliases table
+    - fuzzy => (Optional) If False, only exact and alias matches are used
+    - min_similarity => (Optional) minimum 1 - edit distance / length of the longest name, of fuzzy matches
+    - max_candidates => (Optional) number of reference names (the ones with the most shared trigrams) whose
+      edit distance is computed for a fuzzy match
+    '''
+    def __init__(self, names, extra_aliases=None, fuzzy=True, min_similarity=0.8, max_candidates=8):
+        self.fuzzy = fuzzy
+        self.min_similarity = min_similarity
+        self.max_candidates = max_candidates
+
+        # normalized key ---> reference name (first one wins)
+        self.index = {}
+        for name in names:
+            key = normalize_name(name)
+            if key != "":
+                self.index.setdefault(key, name)
+        self.keys = list(self.index)
+
+        self.alias_index = {}
+        for alias, name in aliases.items():
+            self.add_alias(alias, name)
+        for alias, name in (extra_aliases or {}).items():
+            self.add_alias(alias, name)
+
+        # trigram ---> positions of the reference keys that contain it
+        self.trigram_index = {}
+        for i, key in enumerate(self.keys):
+            for trigram in trigrams(key):
+                self.trigram_index.setdefault(trigram, []).append(i)
+
+        # name ---> (reference name or None, method, similarity)
+        self.resolutions = {}
+
+    def add_alias(self, alias, name):
+        '''
+        Makes alias resolve to the reference name name. Aliases work both ways, so that the aliases table (names
+        of other sources ---> Worldometer names) can be used whatever the source of the reference names is: if
+        alias is the reference name, name resolves to it. Ignored if neither is a reference name.
+        '''
+        alias_key, name_key = normalize_name(alias), normalize_name(name)
+        if name_key in self.index:
+            self.alias_index[alias_key] = self.index[name_key]
+        elif alias_key in self.index:
+            self.alias_index[name_key] = self.index[alias_key]
+        else:
+            return
+        self.resolutions = {}
+
+    def _fuzzy_match(self, key):
+        query = trigrams(key)
+        shared = {}
+        for trigram in query:
+            for i in self.trigram_index.get(trigram, []):
+                shared[i] = shared.get(i, 0) + 1
+        candidates = sorted(shared, key=lambda i: -shared[i])[:self.max_candidates]
+
+        best, best_similarity, tied = None, 0.0, False
+        for i in candidates:
+            longest = max(len(key), len(self.keys[i]))
+            max_distance = int((1 - self.min_similarity) * longest)
+            distance = edit_distance(key, self.keys[i], max_distance=max_distance)
+            if distance > max_distance:
+                continue
+            similarity = 1 - distance / longest
+            if similarity > best_similarity:
+                best, best_similarity, tied = i, similarity, False
+            elif similarity == best_similarity:
+                tied = True
+        if best is None or tied:
+            return None, best_similarity
+        return self.index[self.keys[best]], best_similarity
+
+    def resolve(self, name):
+        '''
+        Returns the reference name of name, or None if it can't be resolved
+        '''
+        return self.resolve_with_method(name)[0]
+
+    def resolve_with_method(self, name):
+        '''
+        Returns (reference name or None, method, similarity) of name, method being "exact", "alias", "fuzzy",
+        "unresolved" or "missing" (for None/NaN names)
+        '''
+        memo_key = name if not (isinstance(name, float) and np.isnan(name)) else None
+        resolution = self.resolutions.get(memo_key)
+        if resolution is not None:
+            return resolution
+
+        key = normalize_name(name)
+        if key == "":
+            resolution = (None, "missing", 0.0)
+        elif key in self.index:
+            resolution = (self.index[key], "exact", 1.0)
+        elif key in self.alias_index:
+            resolution = (self.alias_index[key], "alias", 1.0)
+        elif self.fuzzy:
+            match, similarity = self._fuzzy_match(key)
+            resolution = (match, "fuzzy" if match is not None else "unresolved", similarity)
+        else:
+            resolution = (None, "unresolved", 0.0)
+        self.resolutions[memo_key] = resolution
+        return resolution
+
+    def resolve_many(self, names):
+        '''
+        Vectorized resolve: returns the reference names of a column of names as a numpy object array, with None
+        for the names that can't be resolved
+        '''
+        codes, uniques = pd.factorize(pd.Series(names), sort=False)
+        resolved = np.array([self.resolve(name) for name in uniques] + [None], dtype=object)
+        # missing names have code -1, i.e. the last value None
+        return resolved[codes]
+
+    def report(self, unresolved_only=True):
+        '''
+        Returns a DataFrame of the names resolved so far (only the unresolved ones by default), with their
+        reference name, method and similarity
+        '''
+        rows = [(name, match, method, similarity) for name, (match, method, similarity) in self.resolutions.items()
+                if not unresolved_only or method == "unresolved"]
+        return pd.DataFrame(rows, columns=["Name", "Resolved", "Method", "Similarity"])
+
+
+if __name__ == "__main__":
+    import time
+
+    from data_store import load
+
+    population_df = load("Worldometer_Population_Regional_Latest.csv")
+    start = time.perf_counter()
+    resolver = RegionResolver(population_df['Country (or dependency)'][population_df['Region'] == "All_Regions"])
+    print("Index built in {:.2f}ms".format(1000 * (time.perf_counter() - start)))
+
+    sources = {"train.csv": load("train.csv")['Country_Region'],
+               "OECD": load("OECD_PopulationDensity_and_Area-T2_T3_Regions-2018_2019.csv").query("TL == 1")['Region'],
+               "Climate_Data_Worldbank.csv (UN M49)": load("Climate_Data_Worldbank.csv")['Country']}
+    for source, names in sources.items():
+        for run in ["first", "memoized"]:
+            start = time.perf_counter()
+            resolver.resolve_many(names)
+            print("{} {}: {} names resolved in {:.2f}ms".format(source, run, len(names), 1000 * (time.perf_counter() - start)))
+    print(resolver.report().to_string())
@@ -6,39 +6,55 @@ Authored by: Nicholas Sadjoli (Github @NickSadjoli)
 Co-authored by: Josephine Monica (Github @josephinemonica)
 """
 
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
+import numpy as np
 import pandas as pd
 from bs4 import BeautifulSoup
 import sys
 import re
 import json as json
+import os
+import shutil
 import time
 
 from covid19_scraper_utils import BasicScraper, WorldometerScraper
+from data_store import write_chunks_atomic, write_csv_atomic, write_text_atomic
+from page_fetching import SeleniumPagePool, base_page_fetcher, iter_pages, make_page_fetcher
 
 worldometer_path = "https://www.worldometers.info/coronavirus/"
+progress_file_name = "progress.json"
 
 ## TODO: Create a Class that can scrape the time series data for all countries that has hrefs in Worldometer!
 class Worldometer_LatestCountriesData(WorldometerScraper):
-    def __init__(self, countries_w_href=None, driver=None, dates=None, verbose=False):
-        super().__init__(driver=driver, verbose=verbose, default_site=worldometer_path)
+    def __init__(self, countries_w_href=None, driver=None, dates=None, verbose=False, n_workers=1, page_fetcher=None,
+                 stream_writer=None):
+        '''
+        Scrapes the pages of all countries in countries_w_href. Pages are fetched by up to n_workers workers at
+        the same time (with per-host rate limiting), using page_fetcher if given (e.g. an HttpPageFetcher), or
+        a pool of n_workers Selenium drivers otherwise. Pages are always parsed in the order of countries_w_href,
+        so the results don't depend on n_workers.
+
+        If a stream_writer (CountriesDataStreamWriter) is given, the data of every country is handed to it as soon
+        as its page is parsed instead of being kept until the end, so memory doesn't grow with the number of
+        countries, and the countries the writer already has (from an interrupted run) are not fetched again.
+        countries_timeseries_data and countries_regional_data are then None, see CountriesDataStreamWriter.finalize.
+        '''
+        super().__init__(driver=driver, verbose=verbose, default_site=worldometer_path, page_fetcher=page_fetcher)
         
         #self.driver = self._check_webdriver(driver=driver, verbose=verbose)
+        page_pool = base_page_fetcher(self.page_fetcher)
+        if isinstance(page_pool, SeleniumPagePool):
+            page_pool.max_drivers = max(page_pool.max_drivers, n_workers)
 
         self.countries_w_href = None
         if countries_w_href is not None:
             self.countries_w_href = countries_w_href
         else:
+            self.countries_w_href = {}
             self._parse_countries_w_href()
             return
         
         self.countries_w_region_dict = {}
         self.countries_timeseries_dict = {}
-        self.countries_timeseries = None
-        self.timeseries_rows = 0
 
         self.dates = dates
 
@@ -64,79 +80,87 @@ class Worldometer_LatestCountriesData(WorldometerScraper):
                           'deaths-cured-outcome': 'Closed Cases'
                           }
                           
-        for country in self.countries_w_href:
-            country_href = self.countries_w_href[country]
-            self.driver.get(country_href)
-            '''
-            try:
-                element = WebDriverWait(self.driver, 2.2).until(
-                    EC.presence_of_element_located((By.CLASS_NAME, "footerlinks")) )
-            except:
-                pass
-            '''
-            time.sleep(3)
+        countries = list(self.countries_w_href)
+        if stream_writer is not None:
+            if self.no_dates_provided:
+                raise ValueError("Streaming the countries data needs the dates to be provided")
+            countries = [country for country in countries if not stream_writer.is_done(country)]
+            if verbose:
+                print("{} countries already written, fetching {}".format(len(self.countries_w_href) - len(countries),
+                                                                        len(countries)))
+        country_hrefs = [self.countries_w_href[country] for country in countries]
+        country_pages = iter_pages(self.page_fetcher, country_hrefs, n_workers=n_workers, verbose=verbose)
+        for country, country_page in zip(countries, country_pages):
             #print("Current country and href:", country, country_href)
-            countrypage_soup = BeautifulSoup(self.driver.page_source, "html.parser")
+            countrypage_soup = BeautifulSoup(country_page, "html.parser")
             self.get_country_timeseries(country, countrypage_soup, verbose=verbose)
             self.get_country_regional_data(country, countrypage_soup, verbose=verbose)
-
-        self.timeseries_columns = self.dates
-        self.timeseries_columns.insert(0, 'Data Type')
-        self.timeseries_columns.insert(0, 'Country')
-        
-        #self.countries_timeseries_data = pd.DataFrame(index=range(0, self.timeseries_rows), columns=self.timeseries_columns)
-        self.countries_timeseries_data = pd.DataFrame(columns=self.timeseries_columns)
-
-        i = 0
-        for country in self.countries_timeseries_dict:
-            for data_type in self.countries_timeseries_dict[country]:
-                if data_type == 'dates':
-                    pass
-                else:
-                    data_date = self.countries_timeseries_dict[country][data_type]['chart_dates']
-                    cur_timeseries = pd.Series(index=self.timeseries_columns)
-                    cur_timeseries['Country'] = country
-                    cur_timeseries['Data Type'] = data_type
-                    cur_timeseries[data_date] = self.countries_timeseries_dict[country][data_type]['values']
-                    self.countries_timeseries_data = self.countries_timeseries_data.append(cur_timeseries, ignore_index=True)
-                    '''
-                    self.countries_timeseries_data.loc[i]['Country'] = country
-                    self.countries_timeseries_data.loc[i]['Data Type'] = data_type
-                    self.countries_timeseries_data.loc[i][data_date] = self.countries_timeseries_dict[country][data_type]['values']
-                    '''
-                    i += 1
-
-        self.regional_columns = None
-        self.regional_rows = 0
-        for country in self.countries_w_region_dict:
-            if self.regional_columns is None:
-                self.regional_columns = self.countries_w_region_dict[country]['columns']
-            else:
-                self.regional_columns.append(self.countries_w_region_dict[country]['columns'])
-            self.regional_rows += len(self.countries_w_region_dict[country]['regions'])
-        self.countries_regional_data = pd.DataFrame(index=range(0, self.regional_rows), columns=self.regional_columns)
-
-        j=0
-        for country in self.countries_w_region_dict:
-            for region_data in self.countries_w_region_dict[country]['regions']:
-                self.countries_regional_data.loc[j]['Country'] = country
-                self.countries_regional_data.loc[j]['Region': ] = region_data
-                j += 1
+            if stream_writer is not None:
+                country_dates = self.countries_timeseries_dict[country].get('dates', [])
+                stream_writer.add_country(country, self._build_timeseries_frame(), self._build_regional_frame(),
+                                          last_date=country_dates[-1] if len(country_dates) > 0 else None)
+                self.countries_timeseries_dict = {}
+                self.countries_w_region_dict = {}
+
+        if stream_writer is not None:
+            stream_writer.flush()
+            self.countries_timeseries_data = None
+            self.countries_regional_data = None
+            return
+        self.countries_timeseries_data = self._build_timeseries_frame()
+        self.countries_regional_data = self._build_regional_frame()
 
         if verbose:
             print(self.countries_timeseries_data)
             print(self.countries_regional_data)
 
+    def _build_timeseries_frame(self):
+        '''
+        Builds the (Country, Data Type) x dates frame of all parsed charts at once. Values of chart dates that are
+        not in self.dates are dropped, and dates missing from a chart are left as NaN.
+        '''
+        dates = list(self.dates) if self.dates is not None else []
+        date_positions = {date: j for j, date in enumerate(dates)}
+        keys = [(country, data_type) for country in self.countries_timeseries_dict
+                for data_type in self.countries_timeseries_dict[country] if data_type != 'dates']
+
+        values = np.full((len(keys), len(dates)), np.nan)
+        for i, (country, data_type) in enumerate(keys):
+            chart = self.countries_timeseries_dict[country][data_type]
+            chart_values = np.asarray(chart['values'], dtype=np.float64)
+            positions = np.array([date_positions.get(date, -1) for date in chart['chart_dates'][:len(chart_values)]],
+                                 dtype=np.int64)
+            known = positions >= 0
+            values[i, positions[known]] = chart_values[:len(positions)][known]
+
+        self.timeseries_columns = ['Country', 'Data Type'] + dates
+        timeseries_data = pd.DataFrame(values, columns=dates)
+        timeseries_data.insert(0, 'Data Type', [data_type for _, data_type in keys])
+        timeseries_data.insert(0, 'Country', [country for country, _ in keys])
+        return timeseries_data
+
+    def _build_regional_frame(self):
+        '''
+        Builds the frame of the regional tables of all countries at once. Countries whose tables have different
+        columns (e.g. the USA's states table) get the union of all columns, with NaN where a column is missing.
+        '''
+        records = []
+        for country in self.countries_w_region_dict:
+            columns = self.countries_w_region_dict[country]['columns']
+            for region_data in self.countries_w_region_dict[country]['regions']:
+                records.append(dict(zip(columns, [country] + list(region_data))))
+        if len(records) > 0:
+            regional_data = pd.DataFrame.from_records(records)
+        else:
+            regional_data = pd.DataFrame(columns=['Country', 'Region'])
+        self.regional_columns = list(regional_data.columns)
+        self.regional_rows = len(regional_data)
+        return regional_data
+
     def _parse_countries_w_href(self):
         
-        #Get driver back to mainpage first
-        self.driver.get(worldometer_path)
-        try:
-            element = WebDriverWait(self.driver, 2.2).until(
-                EC.presence_of_element_located((By.CLASS_NAME, "footerlinks"))  )
-        except:
-            pass
-        mainpage_soup = BeautifulSoup(self.driver.page_source, "html.parser")
+        #Get mainpage first
+        mainpage_soup = self.get_page_soup(worldometer_path)
         
         #parse mainpage table to get all the countries with hrefs
         latest_table = mainpage_soup.find_all('table')[0]
@@ -156,7 +180,8 @@ class Worldometer_LatestCountriesData(WorldometerScraper):
         country_latest_table = countrypage_soup.find_all('table')
         
         if len(country_latest_table) == 0:
-            print("{} has no tables".format(country))
+            if verbose:
+                print("{} has no tables".format(country))
             return
         else:
             country_latest_table = country_latest_table[0]
@@ -170,7 +195,8 @@ class Worldometer_LatestCountriesData(WorldometerScraper):
 
     def get_country_timeseries(self, country, countrypage_soup, verbose=False):
         country_charts_elements = countrypage_soup.body.find_all('script', text=re.compile("Highcharts.chart"))
-        print(len(country_charts_elements))
+        if verbose:
+            print("{}: {} chart scripts".format(country, len(country_charts_elements)))
         self.countries_timeseries_dict[country] = {}
         self.parse_country_charts(country, country_charts_elements, verbose)
         return
@@ -180,21 +206,18 @@ class Worldometer_LatestCountriesData(WorldometerScraper):
             list_of_charts = self.find_all_highcharts(country_charts_elements[i].text, domId_map=self.domId_map, verbose=verbose)
             #print([domId for domId in list_of_charts])
             for cur_chart_domId in list_of_charts:
-                cur_chartData = list_of_charts[cur_chart_domId]
-                dates = cur_chartData.split("categories: [")[1].split("]")[0].replace('\"', '')
-                dates = dates.split(',')
+                dates = list_of_charts[cur_chart_domId]['categories']
 
                 #there are potentially more than just one data series projected in one chart (e.g. Closed Cases)
-                series_data = cur_chartData.split("series: [{")[1]
-                values_dict = self.find_all_chart_series_values(series_data, verbose)
+                values_dict = list_of_charts[cur_chart_domId]['series']
 
                 #If there aren't any list of dates to use, use list of dates that are the longest
                 if self.no_dates_provided:
                     if self.dates is None:
-                        self.dates = dates 
+                        self.dates = list(dates)
                     else:
                         if len(dates) > len(self.dates):
-                            self.dates = dates
+                            self.dates = list(dates)
 
                 if len(self.countries_timeseries_dict[country]) == 0:
                     self.countries_timeseries_dict[country]['dates'] = dates #All WorldoMeter Time series charts assumed to share the same dates
@@ -225,20 +248,167 @@ class Worldometer_LatestCountriesData(WorldometerScraper):
         return
 
 
+class CountriesDataStreamWriter():
+    '''
+    Writes the time series and regional data of the countries scraped by Worldometer_LatestCountriesData to disk
+    while they are scraped: the countries are buffered by chunks of chunk_size, and every chunk is written as 2
+    CSV files in stream_dir, with a progress file listing the chunks written so far. An interrupted run can then
+    be resumed by a writer with the same stream_dir, dates and countries: the countries of the written chunks are
+    skipped (see is_done). finalize joins the chunks into the 2 final CSVs, one chunk at a time.
+
+    Arguments:
+    - stream_dir => folder of the chunks and of the progress file
+    - dates => dates of the time series columns
+    - countries => (Optional) list of all the countries of the run. A previous run is only resumed if it was for
+      the same countries and dates, otherwise its chunks are removed.
+    - chunk_size => (Optional) number of countries per chunk, i.e. number of countries whose data is in memory
+      at the same time, and that may have to be scraped again after an interruption
+    '''
+    def __init__(self, stream_dir, dates, countries=None, chunk_size=1, verbose=False):
+        self.stream_dir = stream_dir
+        self.progress_path = os.path.join(stream_dir, progress_file_name)
+        self.chunk_size = chunk_size
+        self.verbose = verbose
+        self.timeseries_chunks = []
+        self.regional_chunks = []
+        self.buffered_countries = []
+        self.buffered_last_dates = {}
+
+        run = {"dates": list(dates), "countries": list(countries) if countries is not None else None}
+        self.progress = None
+        if os.path.exists(self.progress_path):
+            with open(self.progress_path) as f:
+                progress = json.load(f)
+            if progress["run"] == run:
+                self.progress = progress
+                if verbose:
+                    print("Resuming after {} chunks ({} countries)".format(len(progress["chunks"]),
+                                                                          len(progress["last_dates"])))
+        if self.progress is None:
+            self.clear()
+            self.progress = {"run": run, "chunks": [], "last_dates": {}}
+        self.done_countries = set(self.progress["last_dates"])
+
+    def is_done(self, country):
+        '''
+        Returns True if the data of country is already written
+        '''
+        return country in self.done_countries
+
+    @property
+    def last_dates(self):
+        '''
+        Dictionary of {country: last date of its charts} of the countries written so far
+        '''
+        return dict(self.progress["last_dates"])
+
+    def add_country(self, country, timeseries, regional, last_date=None):
+        '''
+        Adds the data of one country (its rows of the time series and regional frames), written with the next chunk
+        '''
+        if len(timeseries) > 0:
+            self.timeseries_chunks.append(timeseries)
+        if len(regional) > 0:
+            self.regional_chunks.append(regional)
+        self.buffered_countries.append(country)
+        self.buffered_last_dates[country] = last_date
+        if len(self.buffered_countries) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        '''
+        Writes the buffered countries as a new chunk, then records it in the progress file
+        '''
+        if len(self.buffered_countries) == 0:
+            return
+        chunk_name = "chunk_{:05d}".format(len(self.progress["chunks"]))
+        timeseries = pd.DataFrame()
+        if len(self.timeseries_chunks) > 0:
+            timeseries = pd.concat(self.timeseries_chunks, ignore_index=True, sort=False)
+        regional = pd.DataFrame()
+        if len(self.regional_chunks) > 0:
+            regional = pd.concat(self.regional_chunks, ignore_index=True, sort=False)
+        write_csv_atomic(timeseries, os.path.join(self.stream_dir, chunk_name + "_timeseries.csv"), index=False,
+                         float_format='%.5f')
+        write_csv_atomic(regional, os.path.join(self.stream_dir, chunk_name + "_regional.csv"), index=False,
+                         float_format='%.5f')
+
+        # The chunk only counts once the progress file says so, a chunk written before an interruption is overwritten
+        self.progress["chunks"].append({"name": chunk_name, "countries": list(self.buffered_countries),
+                                        "timeseries_rows": len(timeseries), "regional_rows": len(regional),
+                                        "regional_columns": list(regional.columns)})
+        self.progress["last_dates"].update(self.buffered_last_dates)
+        write_text_atomic(self.progress_path, json.dumps(self.progress))
+        self.done_countries.update(self.buffered_countries)
+        if self.verbose:
+            print("Wrote {} ({} countries)".format(chunk_name, len(self.buffered_countries)))
+
+        self.timeseries_chunks = []
+        self.regional_chunks = []
+        self.buffered_countries = []
+        self.buffered_last_dates = {}
+
+    def _iter_csv_text(self, kind, columns):
+        # The chunks are read back as strings, so that the values are written exactly as they were formatted
+        row_offset = 0
+        for i, chunk in enumerate(self.progress["chunks"]):
+            if chunk[kind + "_rows"] == 0:
+                continue
+            df = pd.read_csv(os.path.join(self.stream_dir, chunk["name"] + "_" + kind + ".csv"), dtype=str,
+                             keep_default_na=False)
+            df = df.reindex(columns=columns, fill_value="")
+            df.index = pd.RangeIndex(row_offset, row_offset + len(df))
+            row_offset += len(df)
+            yield df.to_csv(header=row_offset == len(df))
+        if row_offset == 0:
+            yield pd.DataFrame(columns=columns).to_csv()
+
+    def finalize(self, timeseries_path, regional_path):
+        '''
+        Writes the time series and regional CSVs of all the written countries (same content as the
+        countries_timeseries_data and countries_regional_data frames of a run without streaming, written with
+        write_csv_atomic), reading one chunk at a time
+
+        Returns:
+        - list of the paths written (files whose content didn't change are not rewritten)
+        '''
+        self.flush()
+        timeseries_columns = ['Country', 'Data Type'] + self.progress["run"]["dates"]
+        regional_columns = []
+        for chunk in self.progress["chunks"]:
+            if chunk["regional_rows"] > 0:
+                regional_columns += [column for column in chunk["regional_columns"] if column not in regional_columns]
+        if len(regional_columns) == 0:
+            regional_columns = ['Country', 'Region']
+
+        written = []
+        if write_chunks_atomic(timeseries_path, self._iter_csv_text("timeseries", timeseries_columns)):
+            written.append(timeseries_path)
+        if write_chunks_atomic(regional_path, self._iter_csv_text("regional", regional_columns)):
+            written.append(regional_path)
+        return written
+
+    def clear(self):
+        '''
+        Removes the chunks and the progress file
+        '''
+        if os.path.isdir(self.stream_dir):
+            shutil.rmtree(self.stream_dir)
+        os.makedirs(self.stream_dir, exist_ok=True)
+
+
 class Worldometer_LatestGlobalData(WorldometerScraper):
     '''
     Class that scrapes the main page of the Worldometer site.
     '''
-    def __init__(self, mainpage_soup=None, driver=None, verbose=False):
-        super().__init__(driver=driver, verbose=verbose, default_site=worldometer_path)
+    def __init__(self, mainpage_soup=None, driver=None, verbose=False, page_fetcher=None):
+        super().__init__(driver=driver, verbose=verbose, default_site=worldometer_path, page_fetcher=page_fetcher)
         #self.driver = self._check_webdriver(driver=driver, verbose=verbose)
 
         if mainpage_soup is not None:
             self.mainpage_soup = mainpage_soup
         else:
-            self.mainpage_soup = BeautifulSoup(self.driver.page_source, "html.parser")
-
-        self.mainpage_soup = BeautifulSoup(self.driver.page_source, "html.parser")
+            self.mainpage_soup = self.get_page_soup(worldometer_path)
 
         #Get the Main Table first
         self.latest_table = self.mainpage_soup.find_all('table')[0]
@@ -254,7 +424,7 @@ class Worldometer_LatestGlobalData(WorldometerScraper):
 
         #Then get the Charts
         #find all dom-s with charts created with Highchart.js 
-        self.global_charts = mainpage_soup.body.find_all('script', text=re.compile("Highcharts.chart"))
+        self.global_charts = self.mainpage_soup.body.find_all('script', text=re.compile("Highcharts.chart"))
         self.global_timeseries_dict = {}
         
         self.domId_map = {'total-currently-infected-linear': 'Current Active Cases (Linear)',
@@ -285,6 +455,10 @@ class Worldometer_LatestGlobalData(WorldometerScraper):
         else:
             if verbose:
                 print("no drivers initated yet")
+            from selenium import webdriver
+            from selenium.webdriver.common.by import By
+            from selenium.webdriver.support.ui import WebDriverWait
+            from selenium.webdriver.support import expected_conditions as EC
             cur_driver = webdriver.Chrome()
             cur_driver.get(worldometer_path)
             try:
@@ -352,19 +526,16 @@ class Worldometer_LatestGlobalData(WorldometerScraper):
 
             #There might be more than 1 chart in one particular dom
             list_of_charts = self.find_all_highcharts(js_charts[i].text, domId_map=self.domId_map, verbose=verbose)
-            #list_of_charts = self.find_all_highcharts(js_charts[i].text, verbose)
 
             for cur_chart_domId in list_of_charts:
-                cur_chartData = list_of_charts[cur_chart_domId]
-                dates = cur_chartData.split("categories: [")[1].split("]")[0].replace('\"', '')
-                dates = dates.split(',')
+                dates = list_of_charts[cur_chart_domId]['categories']
 
                 #there are potentially more than just one data series projected in one chart (e.g. Closed Cases)
-                series_data = cur_chartData.split("series: [{")[1]
-                values_dict = self.find_all_chart_series_values(series_data, verbose)
+                values_dict = list_of_charts[cur_chart_domId]['series']
 
-                if len(self.global_timeseries_dict) == 0:
-                    self.global_timeseries_dict['dates'] = dates #All WorldoMeter Time series charts assumed to share the same dates
+                #Charts whose data started to be recorded later are padded to the longest list of dates
+                if len(dates) > len(self.global_timeseries_dict.get('dates', [])):
+                    self.global_timeseries_dict['dates'] = dates
 
                 if len(values_dict) > 1:
                     for val_name in values_dict:
@@ -376,26 +547,24 @@ class Worldometer_LatestGlobalData(WorldometerScraper):
         self.recorded_dates = self.global_timeseries_dict['dates']
         ts_data_col = self.recorded_dates.copy()
         ts_data_col.insert(0, 'Data Type')
-        print("number of columns", len(ts_data_col))
+        if verbose:
+            print("number of columns", len(ts_data_col))
 
         #not including dates as a main data row
-        self.global_timeseries_data = pd.DataFrame(index=range(0, len(self.global_timeseries_dict) -1), columns=ts_data_col) 
-
-        i = 0
-        #for i in range(0, len(self.global_timeseries_dict) -1):
+        rows = []
         for data_type in self.global_timeseries_dict:
             if data_type == "dates":
                 continue
-                
-            to_be_inserted = self.global_timeseries_dict[data_type]
+            values = self.global_timeseries_dict[data_type]
+
+            #Counts are kept as integers, so that they are written as such next to the rates of the other rows
+            if np.isfinite(values).all() and (values == np.round(values)).all():
+                values = values.astype(np.int64)
 
-            #Some data might be started to be recorded at a different date. In this case fill the rest of the data with '0'
-            if len(to_be_inserted) < len(ts_data_col):
-                for j in range(0, len(ts_data_col) - len(to_be_inserted) - 1):
-                    to_be_inserted.insert(0, '0')
-            to_be_inserted.insert(0, data_type)
-            self.global_timeseries_data.loc[i] = to_be_inserted #self.global_timeseries_dict[data_type]
-            i += 1
+            #Some data might be started to be recorded at a different date. In this case fill the rest of the data with 0
+            num_missing = max(len(self.recorded_dates) - len(values), 0)
+            rows.append([data_type] + [0] * num_missing + values.tolist())
+        self.global_timeseries_data = pd.DataFrame(rows, columns=ts_data_col, dtype=object)
 
         return
 
@@ -416,18 +585,17 @@ class Worldometer_LatestGlobalData(WorldometerScraper):
 
 if __name__=="__main__":
     
-    driver = webdriver.Chrome()
-    driver.get(worldometer_path)
-    mainpage_soup = BeautifulSoup(driver.page_source, "html.parser")
+    page_fetcher = make_page_fetcher(sys.argv[1] if len(sys.argv) > 1 else "selenium",
+                                     pages_dir=sys.argv[2] if len(sys.argv) > 2 else None)
 
-    global_cases = Worldometer_LatestGlobalData(mainpage_soup=mainpage_soup, driver=driver, verbose=True)
+    global_cases = Worldometer_LatestGlobalData(page_fetcher=page_fetcher, verbose=True)
     global_cases.write_latestTable_to_csv("./data/Main_Worldometer_Table.csv")
     global_cases.write_globalTimeSeries_to_csv("./data/Main_Worldometer_TimeSeries.csv")
     recorded_dates = global_cases.get_timeseries_dates()
     print("Recorded dates", recorded_dates)
 
     countries_w_href = global_cases.get_countries_w_href()
-    countries_data = Worldometer_LatestCountriesData(countries_w_href=countries_w_href, driver=driver, dates=recorded_dates, verbose=True)
+    countries_data = Worldometer_LatestCountriesData(countries_w_href=countries_w_href, page_fetcher=page_fetcher, dates=recorded_dates, verbose=True)
     countries_data.write_countriesTimeSeries_to_csv("./data/Worldometer_Countries_TimeSeries.csv")
     countries_data.write_countriesRegional_to_csv("./data/Worldometer_Countries_Regional.csv")
 
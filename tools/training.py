@@ -0,0 +1,112 @@
+"""
+Contains the functions used to train the forecasting models, fitting independent models concurrently
+in a process pool.
+
+Authored by: Josephine Monica (Github @josephinemonica)
+Co-authored by: Nicholas Sadjoli (Github @NickSadjoli)
+"""
+import multiprocessing
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+default_targets = ["ConfirmedCases", "Fatalities"]
+seed = 1
+
+# Training data of the running fit_models/run_backtest calls, as {key: {name: (X, Y)}}. Every call registers its
+# data under its own key (see share_datasets), so overlapping calls (e.g. from several threads) don't see or release
+# each other's data. The workers of a process_pool get it through their initializer: forked workers without any
+# pickling, other start methods once per worker.
+_shared_datasets = {}
+
+
+def ebm_model_factory(random_state, n_jobs):
+    '''
+    Default model factory: an ExplainableBoostingRegressor, as used in the experimental notebook
+    '''
+    from interpret.glassbox import ExplainableBoostingRegressor
+    return ExplainableBoostingRegressor(random_state=random_state, n_jobs=n_jobs)
+
+def _init_worker(key, datasets):
+    _shared_datasets[key] = datasets
+
+def get_shared_dataset(key, name):
+    '''
+    Returns the (X, Y) dataset shared under the given key (see share_datasets) and name
+    '''
+    return _shared_datasets[key][name]
+
+def share_datasets(datasets):
+    '''
+    Makes the given datasets readable through get_shared_dataset in the current process (e.g. when models are
+    fitted without a pool), under a new unique key.
+
+    Returns:
+    - key => key of the datasets, to give to process_pool, get_shared_dataset and release_shared_datasets (in a
+      finally block, once done)
+    '''
+    key = uuid.uuid4().hex
+    _init_worker(key, datasets)
+    return key
+
+def release_shared_datasets(key):
+    '''
+    Removes the datasets shared under key from the current process
+    '''
+    _shared_datasets.pop(key, None)
+
+def process_pool(n_workers, key, datasets):
+    '''
+    Creates a ProcessPoolExecutor whose workers can read the given datasets through get_shared_dataset, under
+    key (see share_datasets). They are given to the workers by the pool initializer: with the fork start method
+    they are inherited by the workers, otherwise they are pickled once per worker.
+    '''
+    mp_context = multiprocessing.get_context("fork") if "fork" in multiprocessing.get_all_start_methods() else None
+    return ProcessPoolExecutor(max_workers=n_workers, mp_context=mp_context, initializer=_init_worker,
+                               initargs=(key, datasets))
+
+def _fit_one(key, dataset_name, target, model_factory, random_state, n_jobs):
+    X, Y = get_shared_dataset(key, dataset_name)
+    model = model_factory(random_state, n_jobs)
+    model.fit(X, Y[target])
+    return model
+
+def fit_models(datasets, targets=default_targets, n_workers=None, random_state=seed, model_factory=ebm_model_factory):
+    '''
+    Fits one model per (dataset, target) pair, concurrently in a process pool.
+
+    Arguments:
+    - datasets => dictionary of {name: (X, Y)}, e.g. {"train": (X_train, Y_train), "full": (X, Y)}
+    - targets => (Optional) list of targets (columns of Y) to fit a model for
+    - n_workers => (Optional) number of worker processes. Default is one per model, up to the number of CPUs.
+      With n_workers=1 the models are fitted one after another in the current process.
+    - random_state => (Optional) seed given to every model, so results don't depend on the worker count
+    - model_factory => (Optional) picklable function (random_state, n_jobs) -> unfitted model. The CPUs are
+      split between the workers, and each model gets its share as n_jobs.
+
+    Returns:
+    - dictionary of {name: {target: fitted model}}
+    '''
+    tasks = [(name, target) for name in datasets for target in targets]
+    num_cpus = os.cpu_count() or 1
+    if n_workers is None:
+        n_workers = min(len(tasks), num_cpus)
+    n_workers = max(1, min(n_workers, len(tasks)))
+    n_jobs = max(1, num_cpus // n_workers)
+
+    models = {name: {} for name in datasets}
+    key = share_datasets(datasets)
+    try:
+        if n_workers == 1:
+            for name, target in tasks:
+                models[name][target] = _fit_one(key, name, target, model_factory, random_state, n_jobs)
+        else:
+            with process_pool(n_workers, key, datasets) as executor:
+                futures = {(name, target): executor.submit(_fit_one, key, name, target, model_factory, random_state,
+                                                           n_jobs)
+                           for name, target in tasks}
+                for (name, target), future in futures.items():
+                    models[name][target] = future.result()
+    finally:
+        release_shared_datasets(key)
+    return models
@@ -5,48 +5,215 @@ Authored by: Nicholas Sadjoli (Github @NickSadjoli)
 Co-authored by: Josephine Monica (Github @josephinemonica)
 """
 
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
 import pandas as pd
 import numpy as np
 from bs4 import BeautifulSoup
+import argparse
+import json
+import os
 import sys
 import re
 import requests
 import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
-from covid19_scraper_utils import WorldometerScraper, BasicScraper
-from scrape_worldometer_data import worldometer_path, Worldometer_LatestCountriesData, Worldometer_LatestGlobalData
+from covid19_scraper_utils import WorldometerScraper, BasicScraper, extract_table, read_html_tables
+from scrape_worldometer_data import worldometer_path, CountriesDataStreamWriter, Worldometer_LatestCountriesData, Worldometer_LatestGlobalData
+from data_store import build_cache, write_csv_atomic, write_text_atomic
+from http_cache import HttpCache
+from page_fetching import CountingPageFetcher, as_page_fetcher, iter_pages, make_page_fetcher
+from worldbank_climate import default_max_concurrency, default_periods, default_variables, fetch_climate_data, start_end_dict
 
 default_data_dir = "./input/"
+manifest_file_name = os.path.join(".cache", "update_manifest.json")
+max_manifest_runs = 100
+http_cache_dir_name = os.path.join(".cache", "http")
+report_file_name = os.path.join(".cache", "update_report.json")
+stream_dir_name = os.path.join(".cache", "countries_stream")
+
+main_table_file_name = "Main_Worldometer_Table.csv"
+main_timeseries_file_name = "Main_Worldometer_TimeSeries.csv"
+countries_timeseries_file_name = "Worldometer_COVID19-Countries_TimeSeries.csv"
+countries_regional_file_name = "Worldometer_COVID19-Countries_Regional.csv"
+timeseries_key_columns = ['Country', 'Data Type']
+#the climate step fetches the temperature and precipitation projections of all periods
+climate_variables = ["tas", "pr"]
+climate_periods = list(start_end_dict)
+
+
+def make_http_cache(data_dir=default_data_dir, **kwargs):
+    '''
+    Returns the HttpCache used for the downloads of the data sources, kept in data_dir/.cache/http
+    '''
+    return HttpCache(os.path.join(data_dir, http_cache_dir_name), **kwargs)
+
+def load_manifest(path):
+    if not os.path.exists(path):
+        return {"countries": {}, "runs": []}
+    with open(path) as f:
+        return json.load(f)
+
+def save_manifest(manifest, path):
+    manifest["runs"] = manifest["runs"][-max_manifest_runs:]
+    write_text_atomic(path, json.dumps(manifest, indent=1))
+
+def read_existing_csv(path, **read_csv_kwargs):
+    '''
+    Returns the DataFrame previously written to path (without its index column), or None if there is none
+    '''
+    if not os.path.exists(path):
+        return None
+    return pd.read_csv(path, index_col=0, **read_csv_kwargs)
+
+def countries_to_update(countries, latest_date, existing_timeseries=None, manifest=None):
+    '''
+    Returns the countries whose pages have to be fetched to bring the countries time series up to latest_date:
+    countries that are not in existing_timeseries yet, and countries that have no value for latest_date and
+    weren't already checked for it during a previous run (according to manifest).
+    '''
+    checked = manifest["countries"] if manifest is not None else {}
+    if existing_timeseries is None:
+        return list(countries)
+    known = set(existing_timeseries['Country'])
+    up_to_date = set()
+    if latest_date in existing_timeseries.columns:
+        has_latest = existing_timeseries[latest_date].notnull().to_numpy()
+        up_to_date = set(existing_timeseries['Country'].to_numpy()[has_latest])
+
+    to_update = []
+    for country in countries:
+        if country not in known:
+            to_update.append(country)
+        elif country in up_to_date or checked.get(country, {}).get("checked_for") == latest_date:
+            continue
+        else:
+            to_update.append(country)
+    return to_update
 
-def update_worldometer_data(driver, data_dir=default_data_dir, verbose=False):
-    driver.get(worldometer_path)
-    mainpage_soup = BeautifulSoup(driver.page_source, "html.parser")
+def merge_timeseries(existing, updated, key_columns=timeseries_key_columns):
+    '''
+    Merges freshly scraped time series rows into the existing ones. Values of updated win wherever they are
+    not NaN, new dates are added after the existing ones and new rows after the existing rows.
+    '''
+    if existing is None:
+        return updated
+    existing = existing.drop_duplicates(key_columns, keep="last").set_index(key_columns)
+    updated = updated.drop_duplicates(key_columns, keep="last").set_index(key_columns)
+    columns = list(existing.columns) + [column for column in updated.columns if column not in existing.columns]
+    rows = list(existing.index) + [key for key in updated.index if key not in existing.index]
+    merged = updated.combine_first(existing).reindex(index=pd.MultiIndex.from_tuples(rows, names=key_columns),
+                                                     columns=columns)
+    return merged.reset_index()
+
+def merge_regional(existing, updated, updated_countries):
+    '''
+    Replaces the regional rows of updated_countries in the existing regional data by the updated ones
+    '''
+    if existing is None:
+        return updated
+    kept = existing[~existing['Country'].isin(updated_countries)]
+    return pd.concat([kept, updated], ignore_index=True, sort=False)
+
+def update_worldometer_data(page_fetcher, data_dir=default_data_dir, verbose=False, n_workers=1, incremental=False,
+                            manifest_path=None):
+    '''
+    Scrapes the Worldometer main page and country pages, and writes the 4 Worldometer CSVs atomically.
+
+    Arguments:
+    - page_fetcher => any PageFetcher (see page_fetching), or a Selenium driver
+    - data_dir => (Optional) folder of the CSVs
+    - n_workers => (Optional) number of country pages fetched at the same time
+    - incremental => (Optional) If True, the existing countries CSVs are read and only the pages of countries that
+      are new or miss the latest date are fetched, then merged into the existing data. CSVs whose content
+      doesn't change are not rewritten. Otherwise the countries data is streamed to data_dir/.cache/countries_stream
+      while it is scraped (see CountriesDataStreamWriter), and a run that was interrupted resumes from there.
+    - manifest_path => (Optional) JSON file keeping the state of the incremental updates and a log of the runs.
+      Default is data_dir/.cache/update_manifest.json
+
+    Returns:
+    - the run record added to the manifest
+    '''
+    start = time.time()
+    if manifest_path is None:
+        manifest_path = os.path.join(data_dir, manifest_file_name)
+    manifest = load_manifest(manifest_path)
 
-    global_cases = Worldometer_LatestGlobalData(mainpage_soup=mainpage_soup, driver=driver, verbose=verbose)
-    global_cases.write_latestTable_to_csv(data_dir + "Main_Worldometer_Table.csv")
-    global_cases.write_globalTimeSeries_to_csv(data_dir + "Main_Worldometer_TimeSeries.csv")
+    page_fetcher = as_page_fetcher(page_fetcher)
+    global_cases = Worldometer_LatestGlobalData(page_fetcher=page_fetcher, verbose=verbose)
     recorded_dates = global_cases.get_timeseries_dates()
+    latest_date = recorded_dates[-1]
     print("Recorded dates", recorded_dates)
 
-    countries_w_href = global_cases.get_countries_w_href()
-    countries_data = Worldometer_LatestCountriesData(countries_w_href=countries_w_href, driver=driver, dates=recorded_dates, verbose=verbose)
-    countries_data.write_countriesTimeSeries_to_csv(data_dir + "Worldometer_COVID19-Countries_TimeSeries.csv")
-    countries_data.write_countriesRegional_to_csv(data_dir + "Worldometer_COVID19-Countries_Regional.csv")
-    return
+    written = []
+    if write_csv_atomic(global_cases.get_latestTable_data(), os.path.join(data_dir, main_table_file_name), sep=','):
+        written.append(main_table_file_name)
+    if write_csv_atomic(global_cases.get_globalTimeSeries(), os.path.join(data_dir, main_timeseries_file_name),
+                        sep=',', float_format='%.5f'):
+        written.append(main_timeseries_file_name)
 
-def get_worldometer_population_data(driver, verbose=False):
-    driver.get("https://www.worldometers.info/world-population/population-by-country/")
-    try:
-        element = WebDriverWait(driver, 2.2).until(
-            EC.presence_of_element_located((By.CLASS_NAME, "footerlinks")) )
-    except:
-        pass
-    scraper = WorldometerScraper(driver=driver, verbose=verbose)
-    page_soup = BeautifulSoup(scraper.driver.page_source, "html.parser")
+    countries_w_href = global_cases.get_countries_w_href()
+    timeseries_path = os.path.join(data_dir, countries_timeseries_file_name)
+    regional_path = os.path.join(data_dir, countries_regional_file_name)
+    existing_timeseries = existing_regional = None
+    if incremental:
+        existing_timeseries = read_existing_csv(timeseries_path)
+        existing_regional = read_existing_csv(regional_path, dtype=str, keep_default_na=False)
+        countries = countries_to_update(countries_w_href, latest_date, existing_timeseries, manifest)
+    else:
+        countries = list(countries_w_href)
+    if verbose:
+        print("Fetching {} of {} countries".format(len(countries), len(countries_w_href)))
+
+    new_dates = list(recorded_dates)
+    if existing_timeseries is not None:
+        new_dates = [date for date in recorded_dates if date not in existing_timeseries.columns]
+
+    if len(countries) > 0 and existing_timeseries is None:
+        # Nothing to merge with: the countries are streamed to disk as they are scraped, and an interrupted
+        # run resumes from the last country written
+        stream_writer = CountriesDataStreamWriter(os.path.join(data_dir, stream_dir_name), recorded_dates,
+                                                  countries=countries, verbose=verbose)
+        Worldometer_LatestCountriesData(countries_w_href={country: countries_w_href[country] for country in countries},
+                                        page_fetcher=page_fetcher, dates=list(recorded_dates), verbose=verbose,
+                                        n_workers=n_workers, stream_writer=stream_writer)
+        written += [os.path.basename(path) for path in stream_writer.finalize(timeseries_path, regional_path)]
+        last_dates = stream_writer.last_dates
+        stream_writer.clear()
+    elif len(countries) > 0:
+        countries_data = Worldometer_LatestCountriesData(countries_w_href={country: countries_w_href[country] for country in countries},
+                                                         page_fetcher=page_fetcher, dates=list(recorded_dates), verbose=verbose,
+                                                         n_workers=n_workers)
+        timeseries = merge_timeseries(existing_timeseries, countries_data.countries_timeseries_data)
+        regional = merge_regional(existing_regional, countries_data.countries_regional_data, countries)
+        if write_csv_atomic(timeseries, timeseries_path, sep=',', float_format='%.5f'):
+            written.append(countries_timeseries_file_name)
+        if write_csv_atomic(regional, regional_path, sep=',', float_format='%.5f'):
+            written.append(countries_regional_file_name)
+        last_dates = {}
+        for country in countries:
+            country_dates = countries_data.countries_timeseries_dict.get(country, {}).get('dates', [])
+            last_dates[country] = country_dates[-1] if len(country_dates) > 0 else None
+
+    for country in countries:
+        manifest["countries"][country] = {"checked_for": latest_date, "last_date": last_dates.get(country)}
+
+    run = {"started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(start)), "seconds": round(time.time() - start, 3),
+           "incremental": incremental, "latest_date": latest_date, "new_dates": new_dates,
+           "fetched_countries": len(countries), "total_countries": len(countries_w_href), "written": written}
+    manifest["latest_date"] = latest_date
+    manifest["runs"].append(run)
+    save_manifest(manifest, manifest_path)
+    if verbose:
+        print(run)
+    return run
+
+def get_worldometer_population_data(page_fetcher, verbose=False, n_workers=1):
+    '''
+    Scrapes the population of every country, followed by the population of its cities. The country pages of the
+    cities are fetched by up to n_workers threads at the same time (see page_fetching.iter_pages).
+    '''
+    scraper = WorldometerScraper(verbose=verbose, page_fetcher=as_page_fetcher(page_fetcher))
+    page_soup = scraper.get_page_soup("https://www.worldometers.info/world-population/population-by-country/")
     population_table = page_soup.find_all('table')[0]
     #population_data, _, _ = scraper.parse_table(population_table)
     #return population_data
@@ -54,125 +221,91 @@ def get_worldometer_population_data(driver, verbose=False):
     #print(population_data, countries_w_href)
     population_data.insert(2, 'Region', 'All_Regions')
     pop_data_cols = population_data.columns
-    for country in countries_w_href:
-        country_href = countries_w_href[country]
-        scraper.driver.get(country_href)
-        '''
-        try:
-            element = WebDriverWait(scraper.driver, 10, poll_frequency=1.0).until(
-                EC.presence_of_element_located((By.CLASS_NAME, "table-responsive")) )
-        except:
-            pass
-        '''
-        time.sleep(3)
-        country_population_page_init = scraper.driver.page_source
-        #country_population_page = country_population_page_init.replace("<!--", " ").replace("--> ", " ") #for some reason, these markup 
-                                                                    #'comment' sections throws off BeautifulSoup  
-        country_population_page = country_population_page_init
-        country_population_soup = BeautifulSoup(country_population_page, "html.parser")
-        #country_population_soup =  BeautifulSoup(re.findall(r'<table.*>.*</table>', country_population_page.read())[0])
-        regional_population_table = country_population_soup.find_all('table')[-1]
-        if len(regional_population_table) == 0:
+
+    #rows of the countries are followed by the rows of their cities, numbered '<country index + 1.5>'
+    country_positions = {}
+    for position, country in enumerate(population_data['Country (or dependency)']):
+        country_positions.setdefault(country, position)
+
+    city_index = []
+    city_rows = []
+    countries = list(countries_w_href)
+    country_pages = iter_pages(scraper.page_fetcher, [countries_w_href[country] for country in countries], n_workers=n_workers,
+                               verbose=verbose)
+    for country, country_population_page in zip(countries, country_pages):
+        tables = read_html_tables(country_population_page)
+        if len(tables) == 0:
             continue
-        rows = regional_population_table.find_all('tr')
-        header_row = rows[0].find_all('th')
-        column_names = [head.text.replace('\xa0', ' ') for head in header_row] #&nbsp gets turned into \xa0 by BeautifulSoup
+        regional_population_data, column_names, _ = extract_table(tables[-1], numbers=False)
 
         #sanity check to ensure that Regional population table exists (if it doesn't, then another table would get picked for the 
         # regional_population_table variable)
-        if 'CITY NAME' not in column_names:
+        if 'CITY NAME' not in column_names or country not in country_positions:
             continue
 
-        num_of_columns = len(column_names)
-        table_data = pd.DataFrame(index=range(0, len(rows[1:])), columns=column_names)
-
-        #HTML seems to use the 1-indexing system instead of the normal 0-indexing system
-        for i in range(1, len(rows)):
-            row_elements = rows[i].find_all('td')
-            row_values = [row_el.text.replace('\n', ' ').replace('+', '') for row_el in row_elements]
-
-            cur_country_index = population_data[population_data['Country (or dependency)'] == country].index.values[0]
-            cur_df = pd.DataFrame(index=[cur_country_index + 1], columns=pop_data_cols)
-            cur_df.loc[cur_country_index + 1]['#'] = str(cur_country_index + 1.5)
-            cur_df.loc[cur_country_index + 1]['Country (or dependency)'] = country.rstrip()
-            cur_df.loc[cur_country_index + 1]['Region'] = row_values[1]
-            cur_df.loc[cur_country_index + 1]['Population (2020)'] = row_values[-1]
-
-            population_data = population_data.append(cur_df)
-            population_data = population_data.sort_values(by=['#']) #i.e. sort by the countries' index numbers. This will ensure that all the
-                                                                    # regions belong for each country correctly
-
-            #print(row_elements, row_values)
-
-            '''
-            table_data.loc[i-1] = row_values
-            '''
+        cur_country_index = population_data.index[country_positions[country]]
+        for region, population in zip(regional_population_data.iloc[:, 1], regional_population_data.iloc[:, -1]):
+            city_index.append(cur_country_index + 1)
+            city_rows.append({'#': str(cur_country_index + 1.5), 'Country (or dependency)': country.rstrip(),
+                              'Region': region, 'Population (2020)': population})
+
+    if len(city_rows) > 0:
+        cities_data = pd.DataFrame(city_rows, index=city_index, columns=pop_data_cols)
+        population_data = pd.concat([population_data, cities_data])
+    #i.e. sort by the countries' index numbers. This will ensure that all the regions belong for each country correctly
+    population_data = population_data.sort_values(by=['#'], kind='mergesort')
+    if verbose:
         print(population_data)
     return population_data
 
-def get_climate_data(driver, verbose=False):
+def get_climate_data(page_fetcher, verbose=False, http_cache=None, variables=default_variables, periods=default_periods,
+                     max_concurrency=default_max_concurrency):
     '''
     Getting the CSV data using the API provided by worldbank here:
     https://datahelpdesk.worldbank.org/knowledgebase/articles/902061-climate-data-api
+    The CSVs of all countries are fetched concurrently through http_cache (default: make_http_cache()), for every
+    variable ("tas", "pr") and period (start year, see worldbank_climate.start_end_dict), see
+    worldbank_climate.fetch_climate_data.
     '''
+    if http_cache is None:
+        http_cache = make_http_cache()
 
     #First get the ISO-alpha3 code for all countries, as listed by UN
-    driver.get("https://unstats.un.org/unsd/methodology/m49/")
-    try:
-        element = WebDriverWait(driver, 2.2).until(
-            EC.presence_of_element_located((By.CLASS_NAME, "footerlinks")) )
-    except:
-        pass
-    
-    scraper = BasicScraper(driver=driver, verbose=verbose)
-    page_soup = BeautifulSoup(scraper.driver.page_source, "html.parser")
+    scraper = BasicScraper(verbose=verbose, page_fetcher=as_page_fetcher(page_fetcher))
+    page_soup = scraper.get_page_soup("https://unstats.un.org/unsd/methodology/m49/")
     iso_country_table = page_soup.find(id="ENG_COUNTRIES").find_all('table')[0] #Specifically find the country table in English
     iso_country_data, _, _ = scraper.parse_table(iso_country_table)
-    iso_country_data = iso_country_data.set_index('Country or Area')
-    country_names = iso_country_data.index.to_numpy()
-    country_codes = iso_country_data['ISO-alpha3 code'].to_numpy()
-    print(iso_country_data)
-    print(len(country_names), len(country_codes), iso_country_data.loc[' Afghanistan']['ISO-alpha3 code'])
-    #sys.exit(0)
-
-    start_end_dict = {'2020':'2039', '2040':'2059', '2060':'2079', '2080': '2099'}
-
-    template_link = "http://climatedataapi.worldbank.org/climateweb/rest/v1/country/" 
-    period_type = "mavg"
-    variable = "tas"
-    start = "2020"
-    end = start_end_dict[start]
-
-    full_climate_data = None
-
-    for country in country_names:
-        cur_code = iso_country_data.loc[country]['ISO-alpha3 code']
-        api_call = template_link + period_type + "/" + variable + "/" + start + "/" + end + "/" + cur_code + ".csv"
-        print("Currently calling API:", api_call)
-        cur_climate_data = pd.read_csv(api_call, sep=',')
-        cur_climate_data['Country'] = country
-        if full_climate_data is None:
-            full_climate_data = cur_climate_data
-        else:
-            full_climate_data = full_climate_data.append(cur_climate_data, ignore_index=True)
-
-    return full_climate_data
-
-def get_ourworldindata_testing_data():
+    iso_codes = dict(zip(iso_country_data['Country or Area'], iso_country_data['ISO-alpha3 code']))
+    if verbose:
+        print(iso_country_data)
+
+    climate_data, failures = fetch_climate_data(iso_codes, variables=variables, periods=periods, max_concurrency=max_concurrency,
+                                                http_cache=http_cache, verbose=verbose)
+    if verbose:
+        for url in failures:
+            print("Failed:", url, failures[url])
+    return climate_data
+
+def get_ourworldindata_testing_data(data_dir=default_data_dir, http_cache=None):
+    if http_cache is None:
+        http_cache = make_http_cache(data_dir)
     ourworldindata_github_dir = "https://raw.githubusercontent.com/owid/covid-19-data/master/public/data/testing/"
-    ourworldindata_allobservations = pd.read_csv(ourworldindata_github_dir + "covid-testing-all-observations.csv")
-    ourworldindata_latest_details = pd.read_csv(ourworldindata_github_dir + "covid-testing-latest-data-source-details.csv")
+    ourworldindata_allobservations = http_cache.read_csv(ourworldindata_github_dir + "covid-testing-all-observations.csv")
+    ourworldindata_latest_details = http_cache.read_csv(ourworldindata_github_dir + "covid-testing-latest-data-source-details.csv")
     
-    ourworldindata_allobservations.to_csv(default_data_dir + "OurWorldinData-COVID_testing-all_observations.csv")
-    ourworldindata_latest_details.to_csv(default_data_dir + "OurWorldinData-COVID_testing-latest_datasource_details.csv")
+    write_csv_atomic(ourworldindata_allobservations, os.path.join(data_dir, "OurWorldinData-COVID_testing-all_observations.csv"))
+    write_csv_atomic(ourworldindata_latest_details, os.path.join(data_dir, "OurWorldinData-COVID_testing-latest_datasource_details.csv"))
+    http_cache.flush()
     return
 
-def get_covidtracking_test_data():
+def get_covidtracking_test_data(data_dir=default_data_dir, http_cache=None):
     """
     Get test data from The COVID Tracking Project, for testing data collected in the US region.
 
     Writes out to several dataFrames and saves to more .csv-s as well
     """
+    if http_cache is None:
+        http_cache = make_http_cache(data_dir)
     covidtracking_api_path =  "https://covidtracking.com/api/"
 
     perstates_timeseries_path = covidtracking_api_path + "v1/states/daily.csv"
@@ -180,30 +313,199 @@ def get_covidtracking_test_data():
     us_whole_timeseries_path = covidtracking_api_path + "us/daily.csv" 
     us_whole_current_values_path = covidtracking_api_path  + "v1/us/current.csv"
 
-    us_perstates_timeseries     = pd.read_csv(perstates_timeseries_path)
-    us_perstates_current_values = pd.read_csv(perstates_current_values_path)
-    us_whole_timeseries         = pd.read_csv(us_whole_timeseries_path)
-    us_whole_current_values     = pd.read_csv(us_whole_current_values_path)
+    us_perstates_timeseries     = http_cache.read_csv(perstates_timeseries_path)
+    us_perstates_current_values = http_cache.read_csv(perstates_current_values_path)
+    us_whole_timeseries         = http_cache.read_csv(us_whole_timeseries_path)
+    us_whole_current_values     = http_cache.read_csv(us_whole_current_values_path)
 
-    us_perstates_timeseries.to_csv("./input/COVIDTracking-US_PerStates-Timeseries.csv")
-    us_perstates_current_values.to_csv("./input/COVIDTracking-US_PerStates-CurVal.csv")
-    us_whole_timeseries.to_csv("./input/COVIDTracking-US_Whole-Timeseries.csv")
-    us_whole_current_values.to_csv("./input/COVIDTracking-US_Whole-CurVal.csv")
+    write_csv_atomic(us_perstates_timeseries, os.path.join(data_dir, "COVIDTracking-US_PerStates-Timeseries.csv"))
+    write_csv_atomic(us_perstates_current_values, os.path.join(data_dir, "COVIDTracking-US_PerStates-CurVal.csv"))
+    write_csv_atomic(us_whole_timeseries, os.path.join(data_dir, "COVIDTracking-US_Whole-Timeseries.csv"))
+    write_csv_atomic(us_whole_current_values, os.path.join(data_dir, "COVIDTracking-US_Whole-CurVal.csv"))
+    http_cache.flush()
 
     return
 
-def update_all_data(verbose=False):
+def make_update_steps(data_dir=default_data_dir, verbose=False, incremental=False, n_workers=1,
+                      climate_variables=climate_variables, climate_periods=climate_periods):
+    '''
+    Returns the steps of update_all_data, as a dictionary of {name: step}. Every step is a dictionary with:
+    - function => function(page_fetcher, http_cache) doing the step
+    - depends_on => names of the steps that have to be done before it
+    - run_after_failures => If True, the step also runs when some of the steps it depends on failed
+
+    The data sources are independent of each other. The last step converts all the CSVs (including the ones of
+    the sources that failed, as left by their last successful update) into the data_store cache.
+    In incremental mode only the new Worldometer dates/countries are fetched (see update_worldometer_data), and
+    the population and climate data, which don't change from one day to the next, are only scraped if their
+    CSVs don't exist yet. The climate step fetches the given climate_variables and climate_periods (see
+    get_climate_data), all of them by default.
+    '''
+    population_path = os.path.join(data_dir, "Worldometer_Population_Regional_Latest.csv")
+    climate_path = os.path.join(data_dir, "Climate_Data_Worldbank.csv")
+
+    def update_worldometer(page_fetcher, http_cache):
+        update_worldometer_data(page_fetcher, data_dir=data_dir, verbose=verbose, n_workers=n_workers, incremental=incremental)
+
+    def update_population(page_fetcher, http_cache):
+        if not (incremental and os.path.exists(population_path)):
+            population_data = get_worldometer_population_data(page_fetcher, verbose=verbose, n_workers=n_workers)
+            write_csv_atomic(population_data, population_path)
+
+    def update_climate(page_fetcher, http_cache):
+        if not (incremental and os.path.exists(climate_path)):
+            climate_data = get_climate_data(page_fetcher, verbose=verbose, http_cache=http_cache,
+                                            variables=climate_variables, periods=climate_periods)
+            write_csv_atomic(climate_data, climate_path)
+
+    def update_covidtracking(page_fetcher, http_cache):
+        get_covidtracking_test_data(data_dir, http_cache=http_cache)
+
+    def update_ourworldindata(page_fetcher, http_cache):
+        get_ourworldindata_testing_data(data_dir, http_cache=http_cache)
+
+    def update_cache(page_fetcher, http_cache):
+        build_cache(data_dir, verbose=verbose)
+
+    sources = ["worldometer", "population", "climate", "covidtracking", "ourworldindata"]
+    steps = {
+        "worldometer": {"function": update_worldometer},
+        "population": {"function": update_population},
+        "climate": {"function": update_climate},
+        "covidtracking": {"function": update_covidtracking},
+        "ourworldindata": {"function": update_ourworldindata},
+        "cache": {"function": update_cache, "depends_on": sources, "run_after_failures": True},
+    }
+    for step in steps.values():
+        step.setdefault("depends_on", [])
+        step.setdefault("run_after_failures", False)
+    return steps
+
+def _run_step(name, step, page_fetcher, http_cache, retries, retry_backoff, verbose):
+    # Every step gets its own counting views of the shared page fetcher and http cache, to report what it fetched
+    step_page_fetcher = CountingPageFetcher(page_fetcher)
+    step_http_cache = http_cache.stats_view()
+    start = time.perf_counter()
+    error = None
+    for attempt in range(retries + 1):
+        try:
+            step["function"](step_page_fetcher, step_http_cache)
+            error = None
+            break
+        except Exception as e:
+            error = "{}: {}".format(type(e).__name__, e)
+            if verbose:
+                print("Step {} failed (attempt {}): {}".format(name, attempt + 1, error))
+            if attempt < retries:
+                time.sleep(retry_backoff * 2**attempt)
+    #the responses of the step are written to the index of the cache once, at the end of the step
+    step_http_cache.flush()
+
+    return {"step": name, "status": "failed" if error is not None else "done", "attempts": attempt + 1,
+            "seconds": round(time.perf_counter() - start, 3), "pages_fetched": step_page_fetcher.pages,
+            "bytes_fetched": step_page_fetcher.bytes + step_http_cache.stats["bytes_downloaded"],
+            "http_requests": dict(step_http_cache.stats), "error": error}
+
+def run_steps(steps, page_fetcher, http_cache, selected=None, max_workers=None, retries=1, retry_backoff=5.0, verbose=False):
+    '''
+    Runs a DAG of steps (see make_update_steps) in a thread pool: every step starts as soon as the steps it depends
+    on are done, so independent steps run in parallel. A failing step is retried, and only the steps that depend
+    on it are skipped (unless they have run_after_failures), all the others still run.
+
+    Arguments:
+    - steps => dictionary of {name: step}
+    - page_fetcher, http_cache => shared by all the steps
+    - selected => (Optional) names of the steps to run. Dependencies that are not selected are considered done.
+      Default is all the steps.
+    - max_workers => (Optional) maximum number of steps running at the same time. Default is all of them.
+    - retries => (Optional) number of times a failed step is retried
+    - retry_backoff => (Optional) seconds before the first retry of a step, doubled on every retry
+
+    Returns:
+    - list of the report of every step (status "done", "failed" or "skipped", attempts, seconds, pages and bytes
+      fetched, HTTP requests and error), in the order the steps finished
+    '''
+    selected = list(steps) if selected is None else list(selected)
+    for name in selected:
+        if name not in steps:
+            raise ValueError("Unknown step: {}".format(name))
+    pending = {name: [dependency for dependency in steps[name]["depends_on"] if dependency in selected] for name in selected}
+    status = {}
+    reports = []
+
+    with ThreadPoolExecutor(max_workers=max_workers or len(selected) or 1) as executor:
+        running = {}
+        while pending or running:
+            for name in list(pending):
+                dependencies = pending[name]
+                if any(dependency not in status for dependency in dependencies):
+                    continue
+                del pending[name]
+                if not steps[name]["run_after_failures"] and any(status[dependency] != "done" for dependency in dependencies):
+                    status[name] = "skipped"
+                    reports.append({"step": name, "status": "skipped", "attempts": 0, "seconds": 0, "pages_fetched": 0,
+                                    "bytes_fetched": 0, "http_requests": {}, "error": "a step it depends on failed"})
+                    continue
+                if verbose:
+                    print("Starting step", name)
+                running[executor.submit(_run_step, name, steps[name], page_fetcher, http_cache, retries, retry_backoff,
+                                        verbose)] = name
+            if not running:
+                continue
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in done:
+                report = future.result()
+                status[running.pop(future)] = report["status"]
+                reports.append(report)
+                if verbose:
+                    print("Step {step} {status} in {seconds}s, {bytes_fetched} bytes fetched".format(**report))
+    return reports
+
+def update_all_data(verbose=False, backend="selenium", pages_dir=None, data_dir=default_data_dir, incremental=False, n_workers=1,
+                    sources=None, retries=1, climate_variables=climate_variables, climate_periods=climate_periods):
+    '''
+    Updates all the data files (or only the given sources, see make_update_steps), running the independent sources
+    in parallel (see run_steps). Pages are fetched with the given page fetcher backend ("selenium", "http", or
+    "replay" to re-use pages saved in pages_dir).
 
-    driver = webdriver.Chrome()
-    update_worldometer_data(driver)
-    population_data = get_worldometer_population_data(driver)
-    population_data.to_csv(default_data_dir + "Worldometer_Population_Regional_Latest.csv")
-    full_climate_data = get_climate_data(driver)
-    full_climate_data.to_csv(default_data_dir + "Climate_Data_Worldbank.csv")
-    get_covidtracking_test_data()
-    get_ourworldindata_testing_data()
+    Returns:
+    - the report of every step, also written to data_dir/.cache/update_report.json
+    '''
 
-    return
+    page_fetcher = make_page_fetcher(backend, pages_dir=pages_dir, max_drivers=max(1, n_workers))
+    http_cache = make_http_cache(data_dir)
+    steps = make_update_steps(data_dir=data_dir, verbose=verbose, incremental=incremental, n_workers=n_workers,
+                              climate_variables=climate_variables, climate_periods=climate_periods)
+    try:
+        reports = run_steps(steps, page_fetcher, http_cache, selected=sources, retries=retries, verbose=verbose)
+    finally:
+        page_fetcher.close()
+        http_cache.close()
+
+    write_text_atomic(os.path.join(data_dir, report_file_name), json.dumps(reports, indent=1))
+    if verbose:
+        print(pd.DataFrame(reports)[["step", "status", "attempts", "seconds", "pages_fetched", "bytes_fetched"]])
+    return reports
 
 if __name__ == "__main__":
-    update_all_data()
+    parser = argparse.ArgumentParser(description="Updates the data files of the input folder")
+    parser.add_argument("backend", nargs="?", default="selenium", choices=["selenium", "http", "replay"],
+                        help="how pages are fetched")
+    parser.add_argument("pages_dir", nargs="?", default=None, help="folder of the saved pages (replay backend)")
+    parser.add_argument("--data-dir", default=default_data_dir, help="folder the CSVs are written to")
+    parser.add_argument("--incremental", action="store_true", help="only fetch new dates and countries")
+    parser.add_argument("--workers", type=int, default=1, help="number of pages fetched at the same time")
+    parser.add_argument("--source", action="append", choices=list(make_update_steps()), dest="sources",
+                        help="only update this source (can be given several times)")
+    parser.add_argument("--climate-variable", action="append", choices=climate_variables, dest="climate_variables",
+                        help="only fetch this climate variable (can be given several times)")
+    parser.add_argument("--climate-period", action="append", choices=climate_periods, dest="climate_periods",
+                        help="only fetch the climate period starting this year (can be given several times)")
+    parser.add_argument("--retries", type=int, default=1, help="number of times a failed step is retried")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+    reports = update_all_data(verbose=args.verbose, backend=args.backend, pages_dir=args.pages_dir, data_dir=args.data_dir,
+                              incremental=args.incremental, n_workers=args.workers, sources=args.sources, retries=args.retries,
+                              climate_variables=args.climate_variables or climate_variables,
+                              climate_periods=args.climate_periods or climate_periods)
+    sys.exit(0 if all(report["status"] == "done" for report in reports) else 1)
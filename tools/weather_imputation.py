@@ -0,0 +1,185 @@
+"""
+Contains the imputation of the weather features of the training_data_with_weather_info files (NOAA GSOD readings).
+What is missing, and how it is filled, is described declaratively (see default_imputation), and all the columns
+are imputed at once on a single (rows x columns) array sorted by region and date.
+
+Authored by: Josephine Monica (Github @josephinemonica)
+Co-authored by: Nicholas Sadjoli (Github @NickSadjoli)
+"""
+import numpy as np
+import pandas as pd
+
+# Imputation steps, applied in this order:
+# - sentinels => values GSOD uses for "no reading" (and non-finite values computed from them), replaced by NaN
+# - region_fill => columns filled from the previous day of the same region, then from the next day (for the
+#   first days of a region)
+# - fallbacks => columns filled from another column of the same row (after it was region filled). A missing max/min
+#   is the day's temp rather than the max/min of a neighbouring day, so they are not region filled themselves.
+# - constants => last resort value of a column
+default_imputation = {
+    "sentinels": {"stp": [999.9], "wdsp": [999.9], "prcp": [99.99], "ah": [np.inf, -np.inf]},
+    "region_fill": ["temp", "stp", "slp", "dewp", "rh", "ah", "wdsp", "prcp"],
+    "fallbacks": {"min": "temp", "max": "temp"},
+    "constants": {"prcp": 0.0},
+}
+report_steps = ["sentinels", "region_fill", "fallbacks", "constants", "still_missing"]
+
+
+def region_codes(df, region_columns):
+    '''
+    Returns an integer code per row of df, the same for all the rows with the same values in region_columns
+    (missing values included, e.g. the NaN Province_State of whole countries)
+    '''
+    codes = np.zeros(len(df), dtype=np.int64)
+    for column in region_columns:
+        column_codes, uniques = pd.factorize(df[column])
+        codes = codes * (len(uniques) + 1) + (column_codes + 1)
+    return pd.factorize(codes)[0]
+
+def _group_fill_positions(valid, group_start):
+    # Position of the last valid row at or before every row of its group (or the group's first row if there is
+    # none, which is then still missing): invalid rows point to their group's first row, which is always larger
+    # than the positions of the previous groups, and a running maximum carries the last valid position forward.
+    positions = np.where(valid, np.arange(valid.shape[0])[:, None], group_start[:, None])
+    return np.maximum.accumulate(positions, axis=0)
+
+def impute_weather(df, imputation=default_imputation, region_columns=["Country_Region", "Province_State"],
+                   date_column="Date"):
+    '''
+    Imputes the weather columns of a training or test style DataFrame (columns of imputation missing from df are
+    skipped).
+
+    Arguments:
+    - df => DataFrame with the region_columns, the date_column and weather columns
+    - imputation => (Optional) imputation steps, see default_imputation
+    - region_columns => (Optional) columns whose values identify a region
+    - date_column => (Optional) column of the dates, regions are filled in date order
+
+    Returns:
+    - imputed => copy of df with the imputed weather columns
+    - report => DataFrame with the number of values of every column changed by each step, and still missing
+    '''
+    present = lambda columns: [column for column in columns if column in df.columns]
+    columns = present(list(dict.fromkeys(imputation.get("region_fill", []) + list(imputation.get("sentinels", {})) +
+                                         list(imputation.get("fallbacks", {})) + list(imputation.get("constants", {})))))
+    fill_columns = present(imputation.get("region_fill", []))
+    report = pd.DataFrame(0, index=columns, columns=report_steps)
+
+    # Sort the rows by region, then date (stable, so rows of the same day keep their order)
+    codes = region_codes(df, region_columns)
+    order = np.lexsort((pd.to_datetime(df[date_column]).values, codes))
+    sorted_codes = codes[order]
+    is_start = np.r_[True, sorted_codes[1:] != sorted_codes[:-1]]
+    group_start = np.maximum.accumulate(np.where(is_start, np.arange(len(order)), 0))
+    is_end = np.r_[is_start[1:], True]
+    group_end = np.minimum.accumulate(np.where(is_end, np.arange(len(order)), len(order))[::-1])[::-1]
+
+    values = df[columns].to_numpy(dtype=np.float64)[order]
+    column_ix = {column: j for j, column in enumerate(columns)}
+
+    for column, sentinels in imputation.get("sentinels", {}).items():
+        if column in column_ix:
+            j = column_ix[column]
+            is_sentinel = np.isin(values[:, j], sentinels)
+            report.loc[column, "sentinels"] = int(is_sentinel.sum())
+            values[is_sentinel, j] = np.nan
+
+    if len(fill_columns) > 0:
+        fill_ix = [column_ix[column] for column in fill_columns]
+        block = values[:, fill_ix]
+        missing_before = np.isnan(block)
+        forward = block[_group_fill_positions(~missing_before, group_start), np.arange(len(fill_ix))]
+        # backward fill = forward fill of the reversed rows, whose groups start at the original group ends
+        reversed_start = len(order) - 1 - group_end[::-1]
+        backward = forward[::-1][_group_fill_positions(~np.isnan(forward[::-1]), reversed_start),
+                                 np.arange(len(fill_ix))][::-1]
+        values[:, fill_ix] = backward
+        report.loc[fill_columns, "region_fill"] = (missing_before & ~np.isnan(backward)).sum(axis=0)
+
+    for column, source in imputation.get("fallbacks", {}).items():
+        if column in column_ix and source in column_ix:
+            j = column_ix[column]
+            use = np.isnan(values[:, j]) & ~np.isnan(values[:, column_ix[source]])
+            values[use, j] = values[use, column_ix[source]]
+            report.loc[column, "fallbacks"] = int(use.sum())
+
+    for column, constant in imputation.get("constants", {}).items():
+        if column in column_ix:
+            j = column_ix[column]
+            use = np.isnan(values[:, j])
+            values[use, j] = constant
+            report.loc[column, "constants"] = int(use.sum())
+
+    report["still_missing"] = np.isnan(values).sum(axis=0)
+    imputed = df.copy()
+    unsorted = np.empty_like(values)
+    unsorted[order] = values
+    for column, j in column_ix.items():
+        imputed[column] = unsorted[:, j]
+    return imputed, report
+
+def _impute_weather_rowwise(df, imputation=default_imputation, region_columns=["Country_Region", "Province_State"],
+                            date_column="Date"):
+    '''
+    Reference implementation of impute_weather, one column and one region at a time (as the notebook fills
+    max/min). Only used for benchmarking.
+    '''
+    df = df.copy()
+    df["_region"] = region_codes(df, region_columns)
+    df["_date"] = pd.to_datetime(df[date_column])
+    for column, sentinels in imputation.get("sentinels", {}).items():
+        if column in df.columns:
+            df[column] = df[column].astype(np.float64)
+            for sentinel in sentinels:
+                missing_index = np.where(df[column] == sentinel)[0]
+                df.iloc[missing_index, df.columns.get_loc(column)] = np.nan
+    for column in imputation.get("region_fill", []):
+        if column not in df.columns:
+            continue
+        df[column] = df[column].astype(np.float64)
+        for region in df["_region"].unique():
+            region_index = df.index[df["_region"] == region]
+            region_rows = df.loc[region_index].sort_values("_date", kind="mergesort")
+            df.loc[region_rows.index, column] = region_rows[column].ffill().bfill()
+    for column, source in imputation.get("fallbacks", {}).items():
+        if column in df.columns and source in df.columns:
+            missing_index = np.where(df[column].isnull())[0]
+            df.iloc[missing_index, df.columns.get_loc(column)] = df[source].to_numpy()[missing_index]
+    for column, constant in imputation.get("constants", {}).items():
+        if column in df.columns:
+            df[column] = df[column].astype(np.float64).fillna(constant)
+    return df.drop(columns=["_region", "_date"])
+
+def benchmark_imputation(file_names=["training_data_with_weather_info_week_3.csv",
+                                     "training_data_with_weather_info_week_4.csv"], input_dir=None):
+    '''
+    Times impute_weather against the one-column-one-region-at-a-time reference implementation on the weather
+    files, and checks that both give exactly the same values.
+    '''
+    import os
+    import time
+    from data_store import default_input_dir, load
+
+    if input_dir is None:
+        input_dir = default_input_dir
+    for file_name in file_names:
+        df = load(file_name, input_dir=input_dir)
+
+        start = time.perf_counter()
+        rowwise = _impute_weather_rowwise(df)
+        rowwise_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        imputed, report = impute_weather(df)
+        vectorized_time = time.perf_counter() - start
+
+        columns = list(report.index)
+        assert np.array_equal(rowwise[columns].to_numpy(dtype=np.float64), imputed[columns].to_numpy(dtype=np.float64),
+                              equal_nan=True), "Imputed values differ"
+        print("{} ({} rows): column/region loops {:.3f}s, vectorized {:.3f}s ({:.1f}x)".format(
+            file_name, len(df), rowwise_time, vectorized_time, rowwise_time / vectorized_time))
+        print(report)
+
+
+if __name__ == "__main__":
+    benchmark_imputation()
@@ -0,0 +1,161 @@
+"""
+Contains the client of the Worldbank climate data API
+(https://datahelpdesk.worldbank.org/knowledgebase/articles/902061-climate-data-api), used to fetch the climate
+projections of all countries. Requests run concurrently from an asyncio event loop (a bounded number at a time,
+retried with exponential backoff), and all responses are parsed together from bytes into one typed DataFrame.
+
+Authored by: Nicholas Sadjoli (Github @NickSadjoli)
+Co-authored by: Josephine Monica (Github @josephinemonica)
+"""
+import asyncio
+import io
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from http_cache import HttpCache
+
+default_base_url = "http://climatedataapi.worldbank.org/climateweb/rest/v1/country/"
+start_end_dict = {'2020': '2039', '2040': '2059', '2060': '2079', '2080': '2099'}
+default_variables = ["tas"]
+default_periods = ["2020"]
+default_max_concurrency = 16
+default_retries = 3
+default_backoff = 1.0 #seconds before the first retry, doubled on every retry
+climate_ttl = 30 * 24 * 3600 #climate projections don't change, revalidate them once a month
+
+expected_header = "GCM,var,scenario,from_year,to_year,Jan,Feb,Mar,Apr,May,Jun,Jul,Aug,Sep,Oct,Nov,Dec"
+month_columns = expected_header.split(",")[5:]
+category_columns = ["GCM", "var", "scenario", "Country"]
+
+
+def climate_api_url(iso_code, variable="tas", start="2020", period_type="mavg", base_url=default_base_url):
+    '''
+    Returns the url of the CSV of one country, variable ("tas" for temperature, "pr" for precipitation) and
+    20-year period starting at start (see start_end_dict)
+    '''
+    return "{}{}/{}/{}/{}/{}.csv".format(base_url, period_type, variable, start, start_end_dict[start], iso_code)
+
+def parse_climate_responses(bodies, countries):
+    '''
+    Parses the CSV responses of several requests at once: their data lines are joined (tagged with the
+    position of their country) and read by a single pd.read_csv call.
+
+    Arguments:
+    - bodies => list of response bodies, as bytes
+    - countries => list of the country of each body
+
+    Returns:
+    - climate_data => DataFrame with the columns of the API's CSVs and a Country column. GCM, var, scenario and
+      Country are categorical, the years are integers and the monthly values float64.
+    - invalid => list of the positions of the bodies that are not climate CSVs (e.g. unknown country codes)
+    '''
+    lines = []
+    invalid = []
+    for i, body in enumerate(bodies):
+        text = body.decode("utf-8", errors="replace").replace("\r\n", "\n").strip("\n")
+        header, _, data = text.partition("\n")
+        if header.strip() != expected_header:
+            invalid.append(i)
+            continue
+        if data:
+            lines.append(data.replace("\n", ",{}\n".format(i)) + ",{}".format(i))
+
+    columns = expected_header.split(",") + ["_position"]
+    if len(lines) == 0:
+        climate_data = pd.DataFrame(columns=columns)
+    else:
+        climate_data = pd.read_csv(io.StringIO("\n".join(lines)), header=None, names=columns)
+
+    positions = climate_data.pop("_position").to_numpy(dtype=np.int64)
+    climate_data["Country"] = np.asarray(countries, dtype=object)[positions]
+    for column in ["from_year", "to_year"]:
+        if climate_data[column].notnull().all():
+            climate_data[column] = climate_data[column].astype(np.int64)
+    for column in month_columns:
+        climate_data[column] = climate_data[column].astype(np.float64)
+    for column in category_columns:
+        climate_data[column] = climate_data[column].astype("category")
+    return climate_data, invalid
+
+async def _fetch_with_retries(loop, executor, semaphore, http_cache, url, retries, backoff):
+    for attempt in range(retries + 1):
+        try:
+            async with semaphore:
+                return await loop.run_in_executor(executor, http_cache.get, url, climate_ttl)
+        except Exception as error:
+            # client errors (e.g. 404 for an unknown country code) won't go away by retrying
+            response = getattr(error, "response", None)
+            status_code = getattr(response, "status_code", None)
+            if attempt == retries or (status_code is not None and 400 <= status_code < 500 and status_code != 429):
+                raise
+        # exponential backoff, with some jitter so that failed requests don't all come back at once
+        await asyncio.sleep(backoff * 2**attempt * (0.5 + random.random()))
+
+async def fetch_climate_data_async(iso_codes, variables=default_variables, periods=default_periods, period_type="mavg",
+                                   max_concurrency=default_max_concurrency, retries=default_retries,
+                                   backoff=default_backoff, http_cache=None, base_url=default_base_url, verbose=False):
+    '''
+    Coroutine version of fetch_climate_data
+    '''
+    if http_cache is None:
+        http_cache = HttpCache()
+    requests = [(country, iso_code, variable, start) for variable in variables for start in periods
+                for country, iso_code in iso_codes.items()]
+    urls = [climate_api_url(iso_code, variable, start, period_type=period_type, base_url=base_url)
+            for _, iso_code, variable, start in requests]
+
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(max_concurrency)
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        results = await asyncio.gather(*[_fetch_with_retries(loop, executor, semaphore, http_cache, url, retries, backoff)
+                                         for url in urls], return_exceptions=True)
+    #the index of the cache is written once for the whole batch
+    http_cache.flush()
+
+    failures = {}
+    bodies, countries = [], []
+    for (country, _, _, _), url, result in zip(requests, urls, results):
+        if isinstance(result, BaseException):
+            failures[url] = "{}: {}".format(type(result).__name__, result)
+        else:
+            bodies.append(result)
+            countries.append(country)
+
+    climate_data, invalid = parse_climate_responses(bodies, countries)
+    body_urls = [url for url, result in zip(urls, results) if not isinstance(result, BaseException)]
+    for i in invalid:
+        failures[body_urls[i]] = "not a climate CSV: {}".format(bodies[i][:80].decode("utf-8", errors="replace"))
+    if verbose:
+        print("Fetched {} climate CSVs, {} failed".format(len(urls) - len(failures), len(failures)))
+    return climate_data, failures
+
+def fetch_climate_data(iso_codes, variables=default_variables, periods=default_periods, period_type="mavg",
+                       max_concurrency=default_max_concurrency, retries=default_retries, backoff=default_backoff,
+                       http_cache=None, base_url=default_base_url, verbose=False):
+    '''
+    Fetches the climate projections of several countries, variables and periods.
+
+    Arguments:
+    - iso_codes => dictionary of {country name: ISO-alpha3 code}
+    - variables => (Optional) list of variables to fetch ("tas": temperature, "pr": precipitation)
+    - periods => (Optional) list of the start years of the periods to fetch (keys of start_end_dict)
+    - period_type => (Optional) "mavg" (monthly averages) or "annualavg"
+    - max_concurrency => (Optional) maximum number of requests in flight at the same time
+    - retries => (Optional) number of times a failed request is retried
+    - backoff => (Optional) seconds before the first retry, doubled on every retry
+    - http_cache => (Optional) HttpCache the requests go through. Default is a HttpCache in the default folder.
+    - base_url => (Optional) root url of the API
+
+    Returns:
+    - climate_data => one typed DataFrame with the rows of all countries, variables and periods (see
+      parse_climate_responses)
+    - failures => dictionary of {url: error} of the requests that failed after all retries or didn't return a
+      climate CSV
+    '''
+    coroutine = fetch_climate_data_async(iso_codes, variables=variables, periods=periods, period_type=period_type,
+                                         max_concurrency=max_concurrency, retries=retries, backoff=backoff,
+                                         http_cache=http_cache, base_url=base_url, verbose=verbose)
+    return asyncio.run(coroutine)